@@ -0,0 +1,121 @@
+import resource
+import time
+from dataclasses import asdict, dataclass
+
+from django.db import connection
+
+from crawler.benchmarks.replay import (
+    SAMPLE_WARC_PATH,
+    ReplayServer,
+    read_warc_responses,
+)
+from crawler.models import Crawl, CrawlConfig, Error, Page
+from crawler.wpull.crawler import WpullCrawler
+
+
+@dataclass
+class CrawlBenchmarkResult:
+    status: str
+    pages: int
+    errors: int
+    requests: int
+    seconds: float
+    pages_per_second: float
+    db_write_seconds: float
+    db_growth_kb: int
+    peak_rss_kb: int
+
+
+def get_database_size_kb():
+    """Return the space used by the database, or None if it can't be measured."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(
+                "SELECT (page_count - freelist_count) * page_size "
+                "FROM pragma_page_count(), pragma_freelist_count(), pragma_page_size()"
+            )
+        elif connection.vendor == "postgresql":
+            cursor.execute("SELECT pg_database_size(current_database())")
+        else:
+            return None
+
+        return cursor.fetchone()[0] // 1024
+
+
+def run_crawl_benchmark(server, keep_crawl=False, **config):
+    """Crawl a local server from start to finish, and measure the crawl.
+
+    Keyword arguments are passed to CrawlConfig. Unless keep_crawl is set,
+    the crawl is deleted afterwards so that benchmarks don't fill up the
+    database.
+    """
+    db_size_kb = get_database_size_kb()
+
+    start = time.perf_counter()
+    WpullCrawler().crawl(CrawlConfig(start_url=server.url, **config))
+    seconds = time.perf_counter() - start
+
+    crawl = Crawl.objects.latest("started")
+    pages = Page._base_manager.filter(crawl=crawl).count()
+    stats = crawl.stats or {"stages": {}}
+
+    result = CrawlBenchmarkResult(
+        status=crawl.status,
+        pages=pages,
+        errors=Error._base_manager.filter(crawl=crawl).count(),
+        requests=server.requests,
+        seconds=round(seconds, 3),
+        pages_per_second=round(pages / seconds, 3),
+        db_write_seconds=round(stats["stages"].get("write", {}).get("sum", 0), 3),
+        db_growth_kb=db_size_kb and get_database_size_kb() - db_size_kb,
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    )
+
+    if not keep_crawl:
+        crawl.delete()
+
+    return result
+
+
+def run_warc_benchmark(
+    warc_path=SAMPLE_WARC_PATH, latency=0, error_rate=0, seed=0, **kwargs
+):
+    """Benchmark a crawl of the responses recorded in a WARC file."""
+    responses = read_warc_responses(warc_path)
+
+    with ReplayServer(
+        responses, latency=latency, error_rate=error_rate, seed=seed
+    ) as server:
+        return asdict(run_crawl_benchmark(server, **kwargs))
+
+
+def run_synthetic_benchmark(site, latency=0, error_rate=0, seed=0, **kwargs):
+    """Benchmark a crawl of a SyntheticSite."""
+    with ReplayServer(
+        site, latency=latency, error_rate=error_rate, seed=seed
+    ) as server:
+        return asdict(run_crawl_benchmark(server, **kwargs))
+
+
+def compare_crawl_results(result, baseline, tolerance=0.2):
+    """Compare crawl benchmark results against a saved baseline.
+
+    Returns a list of messages describing each measurement that got worse by
+    more than the given fractional tolerance.
+    """
+    regressions = []
+
+    if result["pages_per_second"] < baseline["pages_per_second"] * (1 - tolerance):
+        regressions.append(
+            f"{result['pages_per_second']} pages/sec, "
+            f"baseline {baseline['pages_per_second']}"
+        )
+
+    for name, label in [
+        ("db_write_seconds", "DB write time"),
+        ("peak_rss_kb", "peak RSS"),
+    ]:
+        if result[name] > baseline[name] * (1 + tolerance):
+            regressions.append(f"{label} {result[name]}, baseline {baseline[name]}")
+
+    return regressions
@@ -0,0 +1,233 @@
+import random
+import resource
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from multiprocessing import Pipe, Process
+
+from django.conf import settings
+
+from crawler.parser import PARSER_VERSION, ParserPool, _parse_html
+
+SAMPLE_SRC_DIR = settings.BASE_DIR / "sample" / "src"
+
+GENERATED_PAGE_SIZES = [
+    10 * 1024,
+    100 * 1024,
+    1024 * 1024,
+    5 * 1024 * 1024,
+]
+
+# libxml2's HTML parser refuses to nest elements more than 256 levels deep.
+GENERATED_PAGE_DEPTH = 250
+
+GENERATED_PAGE_LINKS = 5000
+
+INTERNAL_LINK_HOST = "localhost:8000"
+
+
+@dataclass
+class BenchmarkResult:
+    pages: int
+    pages_per_second: float
+    p50_ms: float
+    p99_ms: float
+    rss_growth_kb: int = 0
+
+
+def generate_page(size=10 * 1024, depth=1, links=0, seed=0):
+    """Generate a deterministic HTML page of roughly the given size in bytes.
+
+    The body contains paragraphs of text and components, nested depth levels
+    deep, followed by the requested number of links.
+    """
+    rng = random.Random(seed)
+
+    head = '<!DOCTYPE html>\n<html lang="en"><head><title>Generated page</title></head><body>'
+    tail = "</body></html>"
+
+    parts = [head, '<div class="o-header"><a href="/header/">Header</a></div>']
+    parts.extend('<div class="m-nested">' for _ in range(depth - 1))
+    parts.extend(
+        f'<p><a href="/page/{i}/" class="a-link">Link {i}</a></p>' for i in range(links)
+    )
+
+    length = sum(map(len, parts)) + len(tail) + 6 * (depth - 1)
+    i = 0
+
+    while length < size:
+        paragraph = (
+            f'<div class="m-card-{i % 10}"><p>Paragraph {i} '
+            + " ".join(
+                rng.choice(("lorem", "ipsum", "dolor", "sit", "amet"))
+                for _ in range(20)
+            )
+            + "</p><script>var ignored = true;</script></div>\n"
+        )
+        parts.append(paragraph)
+        length += len(paragraph)
+        i += 1
+
+    parts.extend("</div>" for _ in range(depth - 1))
+    parts.append(tail)
+
+    return "".join(parts)
+
+
+def get_benchmark_pages(sizes=GENERATED_PAGE_SIZES):
+    """Return (name, html) pairs for the pages used to benchmark the parser."""
+    pages = [
+        (f"sample/{path.relative_to(SAMPLE_SRC_DIR)}", path.read_text())
+        for path in sorted(SAMPLE_SRC_DIR.glob("**/*.html"))
+    ]
+
+    pages.extend(
+        (f"generated/{size // 1024}kb", generate_page(size=size)) for size in sizes
+    )
+
+    pages.append(
+        (
+            f"generated/depth-{GENERATED_PAGE_DEPTH}",
+            generate_page(depth=GENERATED_PAGE_DEPTH),
+        )
+    )
+    pages.append(
+        (
+            f"generated/links-{GENERATED_PAGE_LINKS}",
+            generate_page(links=GENERATED_PAGE_LINKS),
+        )
+    )
+
+    return pages
+
+
+def benchmark(parse, html, iterations):
+    """Time repeated calls to parse(html, internal_link_host)."""
+    latencies = []
+
+    for _ in range(iterations):
+        start = time.perf_counter()
+        parse(html, INTERNAL_LINK_HOST)
+        latencies.append(time.perf_counter() - start)
+
+    return BenchmarkResult(
+        pages=iterations,
+        pages_per_second=round(iterations / sum(latencies), 3),
+        p50_ms=round(1000 * statistics.median(latencies), 3),
+        p99_ms=round(1000 * _percentile(latencies, 99), 3),
+    )
+
+
+def benchmark_in_new_process(parser_name, html, iterations):
+    """Benchmark parsing a page in a new process, and measure its memory use.
+
+    Peak RSS is a high-water mark for a whole process, so measured in one
+    process it would only reflect the largest page parsed so far. Instead,
+    each page is parsed in a fresh process forked from this one, and the
+    growth in its peak RSS, or that of the parser workers it starts, is
+    reported.
+    """
+    connection, child_connection = Pipe()
+    process = Process(
+        target=_benchmark_main,
+        args=(child_connection, parser_name, html, iterations),
+    )
+    process.start()
+    child_connection.close()
+
+    try:
+        return connection.recv()
+    finally:
+        process.join()
+        connection.close()
+
+
+def _benchmark_main(connection, parser_name, html, iterations):
+    start_rss_kb = _get_peak_rss_kb()
+
+    if parser_name == "multiprocessing":
+        pool = ParserPool()
+
+        try:
+            result = benchmark(pool.parse, html, iterations)
+        finally:
+            pool.close()
+    else:
+        result = benchmark(_parse_html, html, iterations)
+
+    result.rss_growth_kb = _get_peak_rss_kb() - start_rss_kb
+    connection.send(result)
+
+
+def _get_peak_rss_kb():
+    # Parser workers are included once the pool has closed and waited for
+    # them.
+    return max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percentile // 100)]
+
+
+def run_benchmarks(pages, iterations=10, multiprocessing=True):
+    """Benchmark the in-process and multiprocessing parser paths.
+
+    Results are returned as a JSON-serializable dictionary. Parsing bypasses
+    the parse cache so that every iteration does the full amount of work.
+    """
+    results = {
+        "parser_version": PARSER_VERSION,
+        "iterations": iterations,
+        "results": {},
+    }
+
+    parser_names = ["in_process"]
+
+    if multiprocessing:
+        parser_names.append("multiprocessing")
+
+    for parser_name in parser_names:
+        results["results"][parser_name] = {
+            name: asdict(benchmark_in_new_process(parser_name, html, iterations))
+            for name, html in pages
+        }
+
+    return results
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """Compare benchmark results against a saved baseline.
+
+    Returns a list of messages describing each page whose throughput dropped,
+    or whose p99 latency rose, by more than the given fractional tolerance.
+    """
+    regressions = []
+
+    for parser_name, pages in results["results"].items():
+        baseline_pages = baseline["results"].get(parser_name, {})
+
+        for name, result in pages.items():
+            baseline_result = baseline_pages.get(name)
+
+            if not baseline_result:
+                continue
+
+            if result["pages_per_second"] < baseline_result["pages_per_second"] * (
+                1 - tolerance
+            ):
+                regressions.append(
+                    f"{parser_name} {name}: {result['pages_per_second']} pages/sec, "
+                    f"baseline {baseline_result['pages_per_second']}"
+                )
+
+            if result["p99_ms"] > baseline_result["p99_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{parser_name} {name}: p99 {result['p99_ms']} ms, "
+                    f"baseline {baseline_result['p99_ms']}"
+                )
+
+    return regressions
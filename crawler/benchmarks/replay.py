@@ -0,0 +1,198 @@
+import gzip
+import http.client
+import io
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+from django.conf import settings
+
+SAMPLE_WARC_PATH = settings.BASE_DIR / "sample" / "crawl.warc.gz"
+
+# Recorded headers that describe the original connection rather than the
+# response, and so aren't replayed.
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "content-length",
+    "date",
+    "keep-alive",
+    "server",
+    "transfer-encoding",
+}
+
+
+@dataclass
+class ReplayResponse:
+    status: int
+    headers: list = field(default_factory=list)
+    body: bytes = b""
+
+
+def iter_warc_records(f):
+    """Parse a WARC file, yielding (headers, block) pairs for each record.
+
+    Headers are returned as a dictionary with lowercased names.
+    """
+    while True:
+        version = f.readline()
+
+        if not version:
+            return
+
+        if not version.strip():
+            continue
+
+        headers = {}
+
+        for line in iter(f.readline, b"\r\n"):
+            if not line:
+                return
+
+            name, _, value = line.decode("utf-8").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        yield headers, f.read(int(headers.get("content-length", 0)))
+
+
+def read_chunked_body(f):
+    """Read a body sent with chunked transfer encoding, without its framing."""
+    chunks = []
+
+    for line in iter(f.readline, b""):
+        size = int(line.split(b";")[0], 16)
+
+        if not size:
+            break
+
+        chunks.append(f.read(size))
+        f.readline()
+
+    return b"".join(chunks)
+
+
+def parse_http_response(block):
+    """Parse a recorded HTTP response into a ReplayResponse.
+
+    Chunked bodies are decoded, since responses are replayed with a
+    Content-Length instead.
+    """
+    f = io.BytesIO(block)
+    status = int(f.readline().split()[1])
+    headers = http.client.parse_headers(f)
+
+    if "chunked" in headers.get("Transfer-Encoding", "").lower():
+        body = read_chunked_body(f)
+    else:
+        body = f.read()
+
+    return ReplayResponse(
+        status=status,
+        headers=[
+            (name, value)
+            for name, value in headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        ],
+        body=body,
+    )
+
+
+def get_replay_key(url):
+    """Return the path and query string that a URL is replayed at."""
+    parts = parse.urlsplit(url)
+    return parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+
+def read_warc_responses(path):
+    """Read the HTTP responses recorded in a, possibly gzipped, WARC file.
+
+    Responses are keyed by path and query string, so that they can be served
+    from any host. If a URL was recorded more than once, the last response
+    is used.
+    """
+    opener = gzip.open if str(path).endswith(".gz") else open
+    responses = {}
+
+    with opener(path, "rb") as f:
+        for headers, block in iter_warc_records(f):
+            if headers.get("warc-type") != "response":
+                continue
+
+            url = headers["warc-target-uri"].strip("<>")
+            responses[get_replay_key(url)] = parse_http_response(block)
+
+    return responses
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        response = self.server.get_response(self.path)
+
+        self.send_response(response.status)
+
+        for name, value in response.headers:
+            self.send_header(name, value)
+
+        self.send_header("Content-Length", str(len(response.body)))
+        self.end_headers()
+
+        if self.command != "HEAD":
+            self.wfile.write(response.body)
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Serve recorded responses over HTTP on a local port.
+
+    responses maps paths, including any query string, to ReplayResponses.
+    Each request waits for latency seconds before being answered. A random
+    fraction of requests, given by error_rate, fail with error_status, and
+    paths that weren't recorded return a 404. The server listens on the
+    given port, or a free one by default. Use the server as a context manager
+    to run it in a background thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, responses, latency=0, error_rate=0, error_status=503, seed=0, port=0
+    ):
+        super().__init__(("127.0.0.1", port), ReplayRequestHandler)
+        self.responses = responses
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/"
+
+    def get_response(self, path):
+        with self._lock:
+            self.requests += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+
+        if failed:
+            return ReplayResponse(self.error_status)
+
+        return self.responses.get(path) or ReplayResponse(404)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,175 @@
+import random
+from dataclasses import dataclass
+from html import escape
+
+from crawler.benchmarks.replay import ReplayResponse
+
+COMPONENTS = [
+    "o-header",
+    "o-footer",
+    "o-featured-content-module",
+    "o-info-unit-group",
+    "o-expandable",
+    "o-table",
+    "o-well",
+    "m-hero",
+    "m-card",
+    "m-notification",
+    "m-list",
+    "m-breadcrumbs",
+    "m-related-links",
+    "a-btn",
+    "a-heading",
+    "a-tag",
+]
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consumer", "finance", "credit"]
+
+HTML_HEADERS = [("Content-Type", "text/html; charset=utf-8")]
+
+
+@dataclass
+class SyntheticSite:
+    """A deterministic generated website of any size.
+
+    Page 0 is the homepage at "/", and every other page is at /pages/<n>/.
+    Pages form a tree in which each page links to fan_out children, so that
+    every page can be reached. Each page also has random_links links to
+    randomly chosen pages, which are replaced at the given rates by broken
+    links, links through chains of redirects, and external links.
+    The homepage also links to a listing of all pages split across
+    listing_pages pages at /list/?page=<n>.
+
+    Responses are generated on request, so sites with millions of pages
+    don't use any more memory than small ones. Use with ReplayServer in
+    place of a mapping of recorded responses.
+    """
+
+    pages: int = 1000
+    fan_out: int = 10
+    random_links: int = 5
+    components_per_page: int = 4
+    paragraphs: int = 10
+    broken_link_rate: float = 0.02
+    redirect_rate: float = 0.02
+    redirect_chain_length: int = 2
+    external_link_rate: float = 0.05
+    listing_pages: int = 10
+    external_url: str = "http://external.invalid/external/"
+    seed: int = 0
+
+    def get_page_url(self, n):
+        return "/" if n == 0 else f"/pages/{n}/"
+
+    def get(self, path):
+        """Return the response for a path, or None if it doesn't exist."""
+        path, _, query = path.partition("?")
+        parts = path.strip("/").split("/")
+
+        try:
+            if path == "/":
+                return self.render_page(0)
+            elif parts[0] == "pages" and len(parts) == 2:
+                n = int(parts[1])
+
+                if 0 < n < self.pages and path == self.get_page_url(n):
+                    return self.render_page(n)
+            elif parts[0] == "redirect" and len(parts) == 3:
+                return self.render_redirect(int(parts[1]), int(parts[2]))
+            elif parts[0] == "list" and len(parts) == 1:
+                return self.render_listing(int(query.removeprefix("page=") or 1))
+            elif parts[0] == "external":
+                return ReplayResponse(200, HTML_HEADERS, b"<html></html>")
+        except ValueError:
+            pass
+
+    def get_links(self, n):
+        rng = random.Random(f"{self.seed}:links:{n}")
+
+        links = [
+            self.get_page_url(child)
+            for child in range(n * self.fan_out + 1, (n + 1) * self.fan_out + 1)
+            if child < self.pages
+        ]
+
+        # Only random links are replaced, so that every page stays reachable.
+        for i in range(self.random_links):
+            target = rng.randrange(self.pages)
+
+            if rng.random() < self.broken_link_rate:
+                links.append(f"/missing/{n}-{i}/")
+            elif (
+                target
+                and self.redirect_chain_length
+                and rng.random() < self.redirect_rate
+            ):
+                links.append(f"/redirect/{target}/{self.redirect_chain_length}/")
+            elif rng.random() < self.external_link_rate:
+                links.append(f"{self.external_url}{n}-{i}/")
+            else:
+                links.append(self.get_page_url(target))
+
+        if n == 0 and self.listing_pages:
+            links.append("/list/?page=1")
+
+        return links
+
+    def render_page(self, n):
+        rng = random.Random(f"{self.seed}:page:{n}")
+        components = rng.sample(
+            COMPONENTS, min(self.components_per_page, len(COMPONENTS))
+        )
+
+        parts = [
+            '<!DOCTYPE html>\n<html lang="en"><head>'
+            f"<title>Synthetic page {n}</title></head><body>"
+        ]
+
+        for i in range(self.paragraphs):
+            words = " ".join(rng.choice(WORDS) for _ in range(30))
+            component = components[i % len(components)] if components else "body"
+            parts.append(f'<div class="{component}"><p>{words}</p></div>')
+
+        parts.append("<ul>")
+        parts.extend(
+            f'<li><a href="{escape(link)}">Link {i}</a></li>'
+            for i, link in enumerate(self.get_links(n))
+        )
+        parts.append("</ul></body></html>")
+
+        return ReplayResponse(200, HTML_HEADERS, "".join(parts).encode("utf-8"))
+
+    def render_redirect(self, n, remaining):
+        if not 0 < n < self.pages or not 0 < remaining <= self.redirect_chain_length:
+            return None
+
+        location = (
+            f"/redirect/{n}/{remaining - 1}/" if remaining > 1 else self.get_page_url(n)
+        )
+
+        return ReplayResponse(301, [("Location", location)])
+
+    def render_listing(self, page):
+        if not 0 < page <= self.listing_pages:
+            return None
+
+        per_page = -(-self.pages // self.listing_pages)
+        start = (page - 1) * per_page
+
+        links = [
+            self.get_page_url(n)
+            for n in range(start, min(start + per_page, self.pages))
+        ]
+
+        if page < self.listing_pages:
+            links.append(f"/list/?page={page + 1}")
+
+        body = (
+            '<!DOCTYPE html>\n<html lang="en"><head>'
+            f"<title>Page listing {page}</title></head><body>"
+            '<div class="m-list"><ul>'
+            + "".join(f'<li><a href="{escape(link)}">{link}</a></li>' for link in links)
+            + "</ul></div></body></html>"
+        )
+
+        return ReplayResponse(200, HTML_HEADERS, body.encode("utf-8"))
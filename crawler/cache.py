@@ -0,0 +1,140 @@
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class SQLiteCache(BaseCache):
+    """A Django cache stored in a SQLite database in the LOCATION directory.
+
+    Django's file-based cache lists its whole directory every time a value is
+    set, and evicts entries at random once full. Here entries are kept in a
+    single table indexed by key and by when they were last accessed, and the
+    least recently used are evicted once there are more than MAX_ENTRIES.
+    Entries are only counted every MAX_ENTRIES / CULL_FREQUENCY writes, so
+    the cache may briefly hold more entries than that.
+
+    The database can be shared by several processes.
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = Path(location) / "cache.sqlite3"
+        self._connection = None
+        self._cull_interval = max(1, self._max_entries // (self._cull_frequency or 1))
+        self._writes = 0
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires REAL,
+                    accessed REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+                """)
+
+        return self._connection
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+
+        row = self.connection.execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            [key, now],
+        ).fetchone()
+
+        if row is None:
+            return default
+
+        self.connection.execute(
+            "UPDATE cache SET accessed = ? WHERE key = ?", [now, key]
+        )
+        return pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._insert("INSERT OR REPLACE", key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        # Expired entries can be replaced.
+        self.connection.execute(
+            "DELETE FROM cache WHERE key = ? AND expires <= ?", [key, time.time()]
+        )
+
+        return self._insert("INSERT OR IGNORE", key, value, timeout)
+
+    def _insert(self, insert, key, value, timeout):
+        cursor = self.connection.execute(
+            f"{insert} INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+            [
+                key,
+                pickle.dumps(value, self.pickle_protocol),
+                self.get_backend_timeout(timeout),
+                time.time(),
+            ],
+        )
+
+        if not cursor.rowcount:
+            return False
+
+        self._writes += 1
+
+        if self._writes >= self._cull_interval:
+            self._writes = 0
+            self._cull()
+
+        return True
+
+    def _cull(self):
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()
+
+        if count <= self._max_entries:
+            return
+
+        # Like Django's other caches, a CULL_FREQUENCY of 0 clears the cache.
+        if self._cull_frequency:
+            count -= self._max_entries - self._max_entries // self._cull_frequency
+
+        self.connection.execute(
+            "DELETE FROM cache WHERE key IN "
+            "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+            [count],
+        )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self.connection.execute(
+            "UPDATE cache SET expires = ? "
+            "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            [self.get_backend_timeout(timeout), key, time.time()],
+        )
+        return bool(cursor.rowcount)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self.connection.execute("DELETE FROM cache WHERE key = ?", [key])
+        return bool(cursor.rowcount)
+
+    def clear(self):
+        self.connection.execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,261 @@
+import struct
+import zlib
+from collections import Counter
+
+from django.apps import apps
+from django.db.backends.signals import connection_created
+from django.db.models import TextField, lookups
+from django.db.models.query_utils import DeferredAttribute
+
+# zlib can't make use of dictionaries larger than its 32 KB window.
+DICTIONARY_SIZE = 32 * 1024
+
+# Lines must appear in at least this fraction of sample pages to be included
+# in a trained dictionary.
+MIN_LINE_FREQUENCY = 0.1
+
+COMPRESSION_LEVEL = 6
+
+# Compressed values start with the id of the dictionary they were compressed
+# with, or 0 if they weren't compressed with one.
+_HEADER = struct.Struct(">I")
+
+_dictionaries = {}
+_current_dictionary = None
+
+
+def get_dictionary(dictionary_id):
+    """Return the data of a compression dictionary, given its id."""
+    if not dictionary_id:
+        return None
+
+    if dictionary_id not in _dictionaries:
+        model = apps.get_model("crawler", "CompressionDictionary")
+        _dictionaries[dictionary_id] = bytes(
+            model.objects.values_list("data", flat=True).get(pk=dictionary_id)
+        )
+
+    return _dictionaries[dictionary_id]
+
+
+def get_current_dictionary():
+    """Return the id and data of the dictionary to compress new values with.
+
+    This is the most recently trained dictionary, if there is one.
+    """
+    global _current_dictionary
+
+    if _current_dictionary is None:
+        model = apps.get_model("crawler", "CompressionDictionary")
+        dictionary = model.objects.order_by("-pk").first()
+
+        if dictionary:
+            _dictionaries[dictionary.pk] = bytes(dictionary.data)
+            _current_dictionary = dictionary.pk, _dictionaries[dictionary.pk]
+        else:
+            _current_dictionary = 0, None
+
+    return _current_dictionary
+
+
+def clear_dictionary_cache():
+    global _current_dictionary
+
+    _dictionaries.clear()
+    _current_dictionary = None
+
+
+def compress(text, dictionary_id=0, dictionary=None):
+    compressor = (
+        zlib.compressobj(COMPRESSION_LEVEL, zdict=dictionary)
+        if dictionary
+        else zlib.compressobj(COMPRESSION_LEVEL)
+    )
+
+    return (
+        _HEADER.pack(dictionary_id)
+        + compressor.compress(text.encode("utf-8"))
+        + compressor.flush()
+    )
+
+
+def get_dictionary_id(value):
+    return _HEADER.unpack_from(value)[0]
+
+
+def decompress(value, dictionary=None):
+    """Decompress a value returned by compress.
+
+    The dictionary it was compressed with is looked up if it isn't given.
+    Values that aren't compressed are returned unchanged.
+    """
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+
+    value = bytes(value)
+    dictionary_id = get_dictionary_id(value)
+
+    if dictionary is None:
+        dictionary = get_dictionary(dictionary_id)
+
+    decompressor = (
+        zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+    )
+
+    return (
+        decompressor.decompress(value[_HEADER.size :]) + decompressor.flush()
+    ).decode("utf-8")
+
+
+def train_dictionary(samples, size=DICTIONARY_SIZE):
+    """Build a compression dictionary from sample page HTML.
+
+    Pages from the same site share most of their markup, like headers,
+    footers, and navigation, which comes from the site's templates. The
+    dictionary is made of the lines that appear in the most pages, with the
+    most common last, because zlib encodes references to the end of its
+    dictionary most compactly.
+    """
+    samples = list(samples)
+    line_counts = Counter()
+
+    for sample in samples:
+        line_counts.update(
+            set(
+                line for line in sample.encode("utf-8").splitlines(True) if line.strip()
+            )
+        )
+
+    min_count = max(2, MIN_LINE_FREQUENCY * len(samples))
+    lines = sorted(
+        (line for line, count in line_counts.items() if count >= min_count),
+        key=lambda line: (line_counts[line], line),
+    )
+
+    dictionary = b"".join(lines)[-size:]
+    return dictionary or None
+
+
+def _sqlite_get_dictionary_id(value):
+    return get_dictionary_id(value) if isinstance(value, bytes) else None
+
+
+def _sqlite_decompress(value, dictionary):
+    return decompress(value, dictionary or b"") if value is not None else None
+
+
+def register_sqlite_functions(sender, connection, **kwargs):
+    if connection.vendor == "sqlite":
+        connection.connection.create_function(
+            "crawler_dictionary_id", 1, _sqlite_get_dictionary_id, deterministic=True
+        )
+        connection.connection.create_function(
+            "crawler_decompress", 2, _sqlite_decompress, deterministic=True
+        )
+
+
+connection_created.connect(register_sqlite_functions)
+
+
+class CompressedTextAttribute(DeferredAttribute):
+    """Decompress a field's value the first time it's accessed.
+
+    Defining __set__ makes this a data descriptor, so that __get__ is called
+    even though values are stored in the instance's __dict__.
+    """
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+
+        value = super().__get__(instance, cls)
+
+        if isinstance(value, (bytes, memoryview)):
+            value = instance.__dict__[self.field.attname] = decompress(value)
+
+        return value
+
+
+class CompressedTextField(TextField):
+    """A text field that's stored compressed in SQLite databases.
+
+    Values are compressed with zlib using the current dictionary, if one has
+    been trained, and are only decompressed when they're accessed. Values
+    written before the field was compressed, or to other databases, are
+    stored as plain text.
+
+    Lookups like icontains decompress values in the database, so they work
+    on compressed and plain text values alike.
+    """
+
+    descriptor_class = CompressedTextAttribute
+
+    def pre_save(self, model_instance, add):
+        # Save values that haven't been decompressed as they are, so that
+        # copying rows doesn't decompress and recompress them.
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return value
+
+        return super().get_prep_value(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+
+        # Values used in lookups are prepared, and aren't compressed.
+        if (
+            not prepared
+            and connection.vendor == "sqlite"
+            and isinstance(value, str)
+            and value
+        ):
+            value = compress(value, *get_current_dictionary())
+
+        return value
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return decompress(value)
+
+        return super().to_python(value)
+
+
+class DecompressedLookupMixin:
+    def process_lhs(self, compiler, connection, lhs=None):
+        sql, params = super().process_lhs(compiler, connection, lhs)
+
+        if connection.vendor == "sqlite":
+            dictionary_table = apps.get_model(
+                "crawler", "CompressionDictionary"
+            )._meta.db_table
+
+            sql = (
+                f"crawler_decompress({sql}, (SELECT data FROM {dictionary_table} "
+                f"WHERE id = crawler_dictionary_id({sql})))"
+            )
+            params = [*params, *params]
+
+        return sql, params
+
+
+for lookup in [
+    lookups.Exact,
+    lookups.IExact,
+    lookups.Contains,
+    lookups.IContains,
+    lookups.StartsWith,
+    lookups.IStartsWith,
+    lookups.EndsWith,
+    lookups.IEndsWith,
+]:
+    CompressedTextField.register_lookup(
+        type(lookup.__name__, (DecompressedLookupMixin, lookup), {})
+    )
@@ -0,0 +1,101 @@
+import heapq
+import itertools
+import math
+from collections import Counter
+from urllib import parse
+
+from crawler.url_index import canonicalize_url
+
+# Weights of the factors that a URL's priority is made up of. URLs are
+# favored for being listed in the sitemap with a high priority and for being
+# linked to from many pages, and disfavored for being deep in the crawl and
+# for being in a section of the site that many URLs were already found in.
+SITEMAP_PRIORITY_WEIGHT = 2.0
+IN_LINK_WEIGHT = 1.0
+DEPTH_WEIGHT = 1.0
+SECTION_WEIGHT = 0.5
+
+
+def get_section(url):
+    """Return the section of a site that a URL is in: its first path segment."""
+    parts = parse.urlsplit(url)
+    return parts.netloc, parts.path.strip("/").partition("/")[0]
+
+
+class PriorityFrontier:
+    """Order URLs waiting to be crawled so that the most important come first.
+
+    Each time a link is found, call add with the URL it points to and its
+    depth in the crawl, and whether it's waiting to be crawled. Its priority
+    is raised for each link, so URLs linked to from many pages move up the
+    queue. Call pop to take the highest priority URL.
+
+    Priorities are kept in a heap. When a URL's priority changes, another
+    entry is pushed, and entries that have been superseded are skipped by
+    pop. Once superseded entries outnumber current ones, the heap is rebuilt
+    without them, so that it doesn't grow with every link found.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.pending = {}
+        self.in_links = Counter()
+        self.section_counts = Counter()
+        self.sitemap_priorities = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def get_priority(self, url, depth, section_rank):
+        return (
+            SITEMAP_PRIORITY_WEIGHT
+            * self.sitemap_priorities.get(canonicalize_url(url), 0)
+            + IN_LINK_WEIGHT * math.log2(1 + self.in_links[url])
+            - DEPTH_WEIGHT * depth
+            - SECTION_WEIGHT * math.log2(1 + section_rank)
+        )
+
+    def add(self, url, depth, queued=True):
+        """Record a link to url, adding it to the frontier if it's queued."""
+        self.in_links[url] += 1
+
+        if url in self.pending:
+            depth, section_rank, _ = self.pending[url]
+        elif queued:
+            section = get_section(url)
+            section_rank = self.section_counts[section]
+            self.section_counts[section] += 1
+        else:
+            return
+
+        entry_id = next(self._counter)
+        self.pending[url] = (depth, section_rank, entry_id)
+        heapq.heappush(
+            self.heap, (-self.get_priority(url, depth, section_rank), entry_id, url)
+        )
+
+        if len(self.heap) > 2 * len(self.pending):
+            self.compact()
+
+    def compact(self):
+        """Rebuild the heap from the current entry for each pending URL."""
+        self.heap = [
+            (-self.get_priority(url, depth, section_rank), entry_id, url)
+            for url, (depth, section_rank, entry_id) in self.pending.items()
+        ]
+        heapq.heapify(self.heap)
+
+    def remove(self, url):
+        self.pending.pop(url, None)
+
+    def pop(self):
+        """Remove and return the highest priority URL, or None if it's empty."""
+        while self.heap:
+            _, entry_id, url = heapq.heappop(self.heap)
+
+            if url in self.pending and self.pending[url][2] == entry_id:
+                del self.pending[url]
+                return url
+
+        return None
@@ -0,0 +1,172 @@
+import hashlib
+import http.client
+import logging
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+from django.core.cache import caches
+
+from crawler.ratelimit import BACKOFF_STATUS_CODES, AdaptiveRateController
+from crawler.url_index import canonicalize_url
+
+logger = logging.getLogger("crawler")
+
+
+USER_AGENT = "CFPB website indexer"
+
+# How many times to request a link whose status may be temporary.
+LINK_CHECK_TRIES = 3
+
+# How many links can be waiting to be checked for each worker thread, before
+# checking another one waits for a place in the queue.
+LINK_CHECK_QUEUE_SIZE = 100
+
+
+@dataclass
+class LinkStatus:
+    status_code: int
+    location: str = None
+    retry_after: str = None
+
+    @property
+    def cacheable(self):
+        # Network failures, server errors, and requests to slow down are often
+        # temporary.
+        return (
+            0 < self.status_code < 500 and self.status_code not in BACKOFF_STATUS_CODES
+        )
+
+
+def get_cache_key(url):
+    url_hash = hashlib.sha256(canonicalize_url(url).encode("utf-8")).hexdigest()
+    return f"link-status:{url_hash}"
+
+
+def get_cached_link_status(url):
+    cached = caches["links"].get(get_cache_key(url))
+    return LinkStatus(**cached) if cached else None
+
+
+def set_cached_link_status(url, link_status, ttl):
+    caches["links"].set(get_cache_key(url), asdict(link_status), ttl)
+
+
+class _NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def build_opener(*handlers):
+    """Build a urllib opener that, like the crawler, doesn't verify SSL."""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+
+    opener = urllib.request.build_opener(
+        *handlers, urllib.request.HTTPSHandler(context=context)
+    )
+    opener.addheaders = [("User-Agent", USER_AGENT)]
+    return opener
+
+
+def fetch_link_status(url, method="GET", timeout=30):
+    """Request a URL, without following redirects, and return its status.
+
+    Network failures are reported with a status code of 0.
+    """
+    opener = build_opener(_NoRedirectHandler)
+
+    try:
+        request = urllib.request.Request(url, method=method)
+
+        with opener.open(request, timeout=timeout) as response:
+            return LinkStatus(response.status)
+    except urllib.error.HTTPError as e:
+        return LinkStatus(
+            e.code, e.headers.get("Location"), e.headers.get("Retry-After")
+        )
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        logger.debug(f"Failed to check {url}: {e}")
+        return LinkStatus(0)
+
+
+class LinkChecker:
+    """Check the status of external links in a pool of threads.
+
+    Statuses are cached for ttl seconds in the "links" cache, which can be
+    shared across crawls. Cached statuses are reported immediately, while
+    other links are queued and reported once they've been requested. Either
+    way, callback is called with the URL, its LinkStatus, and the referrer.
+
+    Requests to each host are limited by rate_controller, which may be shared
+    with the crawler, and temporary failures are retried. Once the queue is
+    full, checking a link waits until there's room for it.
+    """
+
+    def __init__(self, callback, max_workers=4, ttl=86400, rate_controller=None):
+        self.callback = callback
+        self.ttl = ttl
+        self.rate_controller = rate_controller or AdaptiveRateController()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="LinkChecker"
+        )
+        self.queue_slots = threading.BoundedSemaphore(
+            max_workers * LINK_CHECK_QUEUE_SIZE
+        )
+        self.cache_hits = 0
+        self.requests = 0
+
+    def check(self, url, method="GET", referrer=None):
+        link_status = get_cached_link_status(url) if self.ttl else None
+
+        if link_status:
+            self.cache_hits += 1
+            self._report(url, link_status, referrer)
+        else:
+            self.requests += 1
+            self.queue_slots.acquire()
+            future = self.executor.submit(self._check, url, method, referrer)
+            future.add_done_callback(lambda future: self.queue_slots.release())
+
+    def close(self):
+        """Wait for all queued links to be checked."""
+        self.executor.shutdown(wait=True)
+
+    def _check(self, url, method, referrer):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+
+        for _ in range(LINK_CHECK_TRIES):
+            time.sleep(self.rate_controller.get_delay(host))
+
+            start = time.monotonic()
+            link_status = fetch_link_status(url, method)
+
+            if link_status.status_code:
+                self.rate_controller.record_response(
+                    host,
+                    link_status.status_code,
+                    time.monotonic() - start,
+                    link_status.retry_after,
+                )
+            else:
+                self.rate_controller.record_error(host)
+
+            if link_status.cacheable:
+                break
+
+        if self.ttl and link_status.cacheable:
+            set_cached_link_status(url, link_status, self.ttl)
+
+        self._report(url, link_status, referrer)
+
+    def _report(self, url, link_status, referrer):
+        try:
+            self.callback(url, link_status, referrer)
+        except Exception:
+            logger.exception(f"Failed to report status of {url}")
@@ -0,0 +1,122 @@
+import json
+
+import djclick as click
+
+from crawler.benchmarks.crawl import (
+    compare_crawl_results,
+    run_synthetic_benchmark,
+    run_warc_benchmark,
+)
+from crawler.benchmarks.replay import SAMPLE_WARC_PATH
+from crawler.benchmarks.site import SyntheticSite
+
+
+@click.command()
+@click.option(
+    "--warc",
+    type=click.Path(exists=True, dir_okay=False),
+    help="WARC file of responses to crawl",
+    default=str(SAMPLE_WARC_PATH),
+)
+@click.option(
+    "--synthetic-pages",
+    type=int,
+    help="Crawl a generated site with this many pages instead of a WARC file",
+)
+@click.option(
+    "--fan-out",
+    type=int,
+    help="Number of child pages each generated page links to",
+    default=10,
+)
+@click.option(
+    "--latency", type=float, help="Seconds to wait before each response", default=0
+)
+@click.option(
+    "--error-rate",
+    type=click.FloatRange(0, 1),
+    help="Fraction of requests that fail with a 503 response",
+    default=0,
+)
+@click.option(
+    "--seed",
+    type=int,
+    help="Seed for choosing failed requests and generating pages",
+    default=0,
+)
+@click.option(
+    "--concurrency", type=int, help="Number of URLs to download at once", default=1
+)
+@click.option(
+    "--max-rate",
+    type=float,
+    help="Maximum requests per second to the replay server",
+    default=1000.0,
+)
+@click.option("--keep-crawl", is_flag=True, help="Don't delete the benchmark crawl")
+@click.option("--output", type=click.Path(), help="Write results to this JSON file")
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True),
+    help="Compare results against this JSON file",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    help="Allowed fractional slowdown relative to the baseline",
+    default=0.2,
+)
+def command(
+    warc,
+    synthetic_pages,
+    fan_out,
+    latency,
+    error_rate,
+    seed,
+    concurrency,
+    max_rate,
+    keep_crawl,
+    output,
+    baseline,
+    tolerance,
+):
+    kwargs = dict(
+        latency=latency,
+        error_rate=error_rate,
+        seed=seed,
+        keep_crawl=keep_crawl,
+        concurrency=concurrency,
+        min_rate=max_rate,
+        max_rate=max_rate,
+    )
+
+    if synthetic_pages:
+        result = run_synthetic_benchmark(
+            SyntheticSite(pages=synthetic_pages, fan_out=fan_out, seed=seed), **kwargs
+        )
+    else:
+        result = run_warc_benchmark(warc, **kwargs)
+
+    click.secho(
+        f"Crawl {result['status'].lower()}: "
+        f"{result['pages']} pages, {result['errors']} errors, "
+        f"{result['requests']} requests in {result['seconds']} seconds, "
+        f"{result['pages_per_second']} pages/sec, "
+        f"DB write {result['db_write_seconds']} seconds, "
+        f"DB growth {result['db_growth_kb']} KB, "
+        f"peak RSS {result['peak_rss_kb']} KB"
+    )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=4)
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare_crawl_results(result, json.load(f), tolerance)
+
+        for regression in regressions:
+            click.secho(f"Regression: {regression}", fg="red")
+
+        if regressions:
+            raise click.ClickException(f"{len(regressions)} regressions found")
@@ -0,0 +1,60 @@
+import json
+
+import djclick as click
+
+from crawler.benchmarks.parser import (
+    compare_results,
+    get_benchmark_pages,
+    run_benchmarks,
+)
+
+
+@click.command()
+@click.option(
+    "--iterations", type=int, help="Number of times to parse each page", default=10
+)
+@click.option(
+    "--multiprocessing/--no-multiprocessing",
+    help="Also benchmark parsing in worker processes",
+    default=True,
+)
+@click.option("--output", type=click.Path(), help="Write results to this JSON file")
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True),
+    help="Compare results against this JSON file",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    help="Allowed fractional slowdown relative to the baseline",
+    default=0.2,
+)
+def command(iterations, multiprocessing, output, baseline, tolerance):
+    results = run_benchmarks(
+        get_benchmark_pages(), iterations=iterations, multiprocessing=multiprocessing
+    )
+
+    for parser_name, pages in results["results"].items():
+        for name, result in pages.items():
+            click.secho(
+                f"{parser_name} {name}: "
+                f"{result['pages_per_second']} pages/sec, "
+                f"p50 {result['p50_ms']} ms, "
+                f"p99 {result['p99_ms']} ms, "
+                f"RSS growth {result['rss_growth_kb']} KB"
+            )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare_results(results, json.load(f), tolerance)
+
+        for regression in regressions:
+            click.secho(f"Regression: {regression}", fg="red")
+
+        if regressions:
+            raise click.ClickException(f"{len(regressions)} regressions found")
@@ -0,0 +1,119 @@
+from django.db import connection, transaction
+from django.db.models import CharField, Func, Q
+
+import djclick as click
+
+from crawler.compression import (
+    clear_dictionary_cache,
+    compress,
+    decompress,
+    get_current_dictionary,
+    train_dictionary,
+)
+from crawler.models import CompressionDictionary, Page
+
+
+def typeof(field_name):
+    return Func(field_name, function="typeof", output_field=CharField())
+
+
+@click.command()
+@click.option(
+    "--crawl",
+    "crawl_ids",
+    type=int,
+    multiple=True,
+    help="ID of a crawl to compress; may be repeated (default: all crawls)",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    help="Number of pages to compress in each transaction",
+    default=500,
+)
+@click.option(
+    "--train",
+    is_flag=True,
+    help="Train a new compression dictionary first, even if there already is one",
+)
+@click.option(
+    "--sample-size",
+    type=click.IntRange(min=1),
+    help="Number of pages to train the compression dictionary on",
+    default=500,
+)
+@click.option("--vacuum", is_flag=True, help="Return the space saved to the filesystem")
+def command(crawl_ids, batch_size, train, sample_size, vacuum):
+    if connection.vendor != "sqlite":
+        raise click.ClickException("Pages can only be compressed in SQLite databases")
+
+    pages = Page._base_manager.all()
+
+    if crawl_ids:
+        pages = pages.filter(crawl__in=crawl_ids)
+
+    if train or not CompressionDictionary.objects.exists():
+        samples = [
+            decompress(html)
+            for html in pages.order_by("?").values_list("html", flat=True)[:sample_size]
+        ]
+        dictionary = train_dictionary(samples)
+
+        if dictionary:
+            CompressionDictionary.objects.create(data=dictionary)
+            clear_dictionary_cache()
+            click.secho(
+                f"Trained a {len(dictionary)} byte dictionary on {len(samples)} pages"
+            )
+
+    dictionary_id, dictionary = get_current_dictionary()
+
+    # Only pages with values stored as plain text need to be compressed, and
+    # empty values, like those of skipped pages, are always stored that way.
+    uncompressed_pages = (
+        pages.annotate(html_type=typeof("html"), text_type=typeof("text"))
+        .filter(
+            (Q(html_type="text") & ~Q(html="")) | (Q(text_type="text") & ~Q(text=""))
+        )
+        .order_by("pk")
+    )
+
+    count = size_before = size_after = 0
+    last_pk = 0
+
+    while True:
+        batch = list(
+            uncompressed_pages.filter(pk__gt=last_pk).values_list("pk", "html", "text")[
+                :batch_size
+            ]
+        )
+
+        if not batch:
+            break
+
+        with transaction.atomic():
+            for pk, *values in batch:
+                updates = {}
+
+                for field_name, value in zip(["html", "text"], values):
+                    if isinstance(value, str) and value:
+                        updates[field_name] = compress(value, dictionary_id, dictionary)
+                        size_before += len(value.encode("utf-8"))
+                        size_after += len(updates[field_name])
+
+                Page._base_manager.filter(pk=pk).update(**updates)
+                count += 1
+
+        last_pk = batch[-1][0]
+        click.secho(f"Compressed {count} pages")
+
+    saved = size_before - size_after
+    click.secho(
+        f"Compressed {count} pages from {size_before} to {size_after} bytes, "
+        f"saving {saved} bytes"
+        + (f" ({saved / size_before:.0%})" if size_before else "")
+    )
+
+    if vacuum:
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM")
@@ -1,15 +1,230 @@
+import json
+import re
+
 import djclick as click
 
-from crawler.models import CrawlConfig
+from crawler.models import Crawl, CrawlConfig
+from crawler.parser import DEFAULT_PARSER_BACKEND, PARSER_BACKENDS
+from crawler.rules import URLRuleSet
 from crawler.wpull.crawler import WpullCrawler
 
 
 @click.command()
-@click.argument("start_url")
+@click.argument("start_url", required=False)
 @click.option(
     "--max-pages", type=int, help="Maximum number of pages to crawl", default=0
 )
 @click.option("--depth", type=int, help="Maximum crawl depth", default=0)
-def command(start_url, max_pages, depth):
-    config = CrawlConfig(start_url=start_url, max_pages=max_pages, depth=depth)
-    return WpullCrawler().crawl(config)
+@click.option(
+    "--parser-backend",
+    type=click.Choice(list(PARSER_BACKENDS)),
+    help="HTML parser to use",
+    default=DEFAULT_PARSER_BACKEND,
+)
+@click.option(
+    "--bloom-filter-capacity",
+    type=int,
+    help="Track visited URLs in a Bloom filter sized for this many URLs",
+    default=0,
+)
+@click.option(
+    "--concurrency", type=int, help="Number of URLs to download at once", default=1
+)
+@click.option(
+    "--min-rate",
+    type=float,
+    help="Minimum requests per second to each host",
+    default=0.5,
+)
+@click.option(
+    "--max-rate",
+    type=float,
+    help="Maximum requests per second to each host",
+    default=2.0,
+)
+@click.option(
+    "--incremental/--no-incremental",
+    help="Only download and parse pages changed since the last crawl",
+    default=False,
+)
+@click.option(
+    "--link-check-ttl",
+    type=int,
+    help="Seconds to cache the status of external links, or 0 to not cache",
+    default=86400,
+)
+@click.option(
+    "--link-check-workers",
+    type=int,
+    help="Number of external links to check at once",
+    default=4,
+)
+@click.option(
+    "--max-page-size",
+    type=int,
+    help="Don't download pages larger than this many bytes, or 0 for no limit",
+    default=0,
+)
+@click.option(
+    "--pipeline-queue-size",
+    type=int,
+    help="Parse pages in the background, queueing up to this many downloaded "
+    "pages, or 0 to parse each page before downloading the next",
+    default=0,
+)
+@click.option(
+    "--prioritize/--no-prioritize",
+    help="Crawl the most important URLs first, instead of in the order found",
+    default=False,
+)
+@click.option(
+    "--url-rules",
+    type=click.File(),
+    help="JSON file of rules deciding which URLs to crawl, replacing the defaults",
+)
+@click.option("--sitemap-url", help="Sitemap or sitemap index to seed the crawl with")
+@click.option(
+    "--shards",
+    type=int,
+    help="Number of workers to split the crawl between",
+    default=1,
+)
+@click.option(
+    "--shard",
+    type=int,
+    multiple=True,
+    help="Index of a shard to run locally; may be repeated (default: all shards)",
+)
+@click.option(
+    "--join",
+    type=int,
+    help="ID of a sharded crawl to run the shards given by --shard of",
+)
+@click.option(
+    "--stats-file",
+    type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+    help="File to write crawl stats to periodically, as JSON or, if it ends "
+    "in .prom, in the Prometheus text format",
+)
+@click.option(
+    "--resume",
+    type=int,
+    help="ID of an interrupted crawl to resume, using its original options",
+)
+def command(
+    start_url,
+    max_pages,
+    depth,
+    parser_backend,
+    bloom_filter_capacity,
+    concurrency,
+    min_rate,
+    max_rate,
+    incremental,
+    link_check_ttl,
+    link_check_workers,
+    max_page_size,
+    pipeline_queue_size,
+    prioritize,
+    url_rules,
+    sitemap_url,
+    shards,
+    shard,
+    join,
+    stats_file,
+    resume,
+):
+    if join is not None:
+        crawl_record = Crawl.objects.filter(
+            pk=join, status=Crawl.Status.STARTED
+        ).first()
+
+        if not crawl_record or crawl_record.config.get("shards", 1) < 2:
+            raise click.BadParameter(
+                f"No running sharded crawl with ID {join}", param_hint="--join"
+            )
+
+        if not shard:
+            raise click.UsageError("--join requires at least one --shard")
+
+        check_shard_indexes(shard, crawl_record.config["shards"])
+        return WpullCrawler().crawl_shards(crawl_record, shard)
+
+    if resume is not None:
+        crawl_record = Crawl.objects.filter(pk=resume).first()
+
+        if (
+            not crawl_record
+            or crawl_record.status == Crawl.Status.FINISHED
+            or crawl_record.config.get("shards", 1) > 1
+        ):
+            raise click.BadParameter(
+                f"No unfinished unsharded crawl with ID {resume}",
+                param_hint="--resume",
+            )
+
+        return WpullCrawler().resume(crawl_record)
+
+    if not start_url:
+        raise click.UsageError("Missing argument START_URL")
+
+    if not 0 < min_rate <= max_rate:
+        raise click.UsageError("--min-rate must be positive and at most --max-rate")
+
+    if max_page_size < 0:
+        raise click.BadParameter("Must not be negative", param_hint="--max-page-size")
+
+    if pipeline_queue_size < 0:
+        raise click.BadParameter(
+            "Must not be negative", param_hint="--pipeline-queue-size"
+        )
+
+    if url_rules:
+        url_rules = load_url_rules(url_rules)
+
+    if shards < 1:
+        raise click.BadParameter("Must be at least 1", param_hint="--shards")
+
+    check_shard_indexes(shard, shards)
+
+    config = CrawlConfig(
+        start_url=start_url,
+        max_pages=max_pages,
+        depth=depth,
+        parser_backend=parser_backend,
+        bloom_filter_capacity=bloom_filter_capacity,
+        concurrency=concurrency,
+        min_rate=min_rate,
+        max_rate=max_rate,
+        incremental=incremental,
+        link_check_ttl=link_check_ttl,
+        link_check_workers=link_check_workers,
+        sitemap_url=sitemap_url,
+        shards=shards,
+        stats_file=stats_file,
+        max_page_size=max_page_size,
+        pipeline_queue_size=pipeline_queue_size,
+        url_rules=url_rules,
+        prioritize=prioritize,
+    )
+    return WpullCrawler().crawl(config, shard)
+
+
+def check_shard_indexes(shard_indexes, shards):
+    for shard_index in shard_indexes:
+        if not 0 <= shard_index < shards:
+            raise click.BadParameter(
+                f"Must be between 0 and {shards - 1}", param_hint="--shard"
+            )
+
+
+def load_url_rules(f):
+    try:
+        rules = json.load(f)
+
+        if not isinstance(rules, list):
+            raise ValueError("expected a list of rules")
+
+        return [rule.to_dict() for rule in URLRuleSet(rules).rules]
+    except (ValueError, TypeError, re.error) as e:
+        raise click.BadParameter(f"Invalid URL rules: {e}", param_hint="--url-rules")
@@ -4,6 +4,7 @@ from django.db.models import OuterRef, Subquery
 import djclick as click
 
 from crawler.models import Crawl
+from crawler.stats import format_stats
 
 
 @click.group()
@@ -16,6 +17,9 @@ def list():
     for crawl in Crawl.objects.all():
         click.secho(crawl)
 
+        if crawl.stats:
+            click.secho(f"  {format_stats(crawl.stats)}")
+
 
 @cli.command()
 @click.argument("crawl_id", type=int)
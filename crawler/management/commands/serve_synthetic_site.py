@@ -0,0 +1,68 @@
+import djclick as click
+
+from crawler.benchmarks.replay import ReplayServer
+from crawler.benchmarks.site import SyntheticSite
+
+
+@click.command()
+@click.option("--pages", type=int, help="Number of pages", default=1000)
+@click.option(
+    "--fan-out", type=int, help="Number of child pages each page links to", default=10
+)
+@click.option(
+    "--random-links",
+    type=int,
+    help="Number of links from each page to random pages",
+    default=5,
+)
+@click.option(
+    "--components-per-page",
+    type=int,
+    help="Number of different components on each page",
+    default=4,
+)
+@click.option(
+    "--broken-link-rate",
+    type=click.FloatRange(0, 1),
+    help="Fraction of random links that are broken",
+    default=0.02,
+)
+@click.option(
+    "--redirect-rate",
+    type=click.FloatRange(0, 1),
+    help="Fraction of random links that go through redirects",
+    default=0.02,
+)
+@click.option(
+    "--redirect-chain-length",
+    type=int,
+    help="Number of redirects in each chain",
+    default=2,
+)
+@click.option(
+    "--external-link-rate",
+    type=click.FloatRange(0, 1),
+    help="Fraction of random links to another host",
+    default=0.05,
+)
+@click.option(
+    "--listing-pages",
+    type=int,
+    help="Number of ?page= pages listing every page",
+    default=10,
+)
+@click.option("--seed", type=int, help="Seed for generating the site", default=0)
+@click.option("--port", type=int, help="Port to serve the site on", default=8000)
+@click.option(
+    "--latency", type=float, help="Seconds to wait before each response", default=0
+)
+def command(port, latency, **kwargs):
+    site = SyntheticSite(**kwargs)
+    server = ReplayServer(site, latency=latency, port=port)
+
+    click.secho(f"Serving {site.pages} synthetic pages at {server.url}")
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
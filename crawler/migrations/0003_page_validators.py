@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crawler", "0002_alter_crawl_options"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="page",
+            name="etag",
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="page",
+            name="last_modified",
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.30 on 2026-10-17 10:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crawler", "0003_page_validators"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CrawlShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index", models.PositiveIntegerField()),
+                ("status", models.CharField(default="Running", max_length=64)),
+                (
+                    "crawl",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shards",
+                        to="crawler.crawl",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["crawl", "index"],
+            },
+        ),
+        migrations.CreateModel(
+            name="FrontierURL",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveIntegerField()),
+                ("url", models.TextField()),
+                ("parent_url", models.TextField(blank=True, null=True)),
+                ("level", models.PositiveIntegerField(default=0)),
+                ("claimed", models.BooleanField(default=False)),
+                (
+                    "crawl",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="frontier_urls",
+                        to="crawler.crawl",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["pk"],
+                "indexes": [
+                    models.Index(
+                        models.F("crawl"),
+                        models.F("shard"),
+                        models.F("claimed"),
+                        name="frontierurl_shard_claimed_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="frontierurl",
+            constraint=models.UniqueConstraint(
+                models.F("crawl"), models.F("url"), name="frontierurl_crawl_url_key"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="crawlshard",
+            constraint=models.UniqueConstraint(
+                models.F("crawl"), models.F("index"), name="crawlshard_crawl_index_key"
+            ),
+        ),
+    ]
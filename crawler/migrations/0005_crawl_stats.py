@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crawler", "0004_crawl_shards"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crawl",
+            name="stats",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crawler", "0005_crawl_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="skipped_reason",
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:06
+
+import crawler.compression
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crawler", "0006_page_skipped_reason"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompressionDictionary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("data", models.BinaryField()),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-pk"],
+            },
+        ),
+        migrations.AlterField(
+            model_name="page",
+            name="html",
+            field=crawler.compression.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name="page",
+            name="text",
+            field=crawler.compression.CompressedTextField(),
+        ),
+    ]
@@ -1,12 +1,16 @@
 import dataclasses
+import hashlib
 import re
+from datetime import datetime
 
-from django.db import models
+from django.db import models, transaction
 
 from modelcluster.models import ClusterableModel
 from modelcluster.fields import ParentalManyToManyField
 
-from crawler.parser import parse_html
+from crawler.compression import CompressedTextField
+from crawler.parser import DEFAULT_PARSER_BACKEND, parse_html
+from crawler.stats import merge_stats
 
 
 @dataclasses.dataclass
@@ -14,6 +18,29 @@ class CrawlConfig:
     start_url: str
     max_pages: int = 0
     depth: int = 0
+    parser_backend: str = DEFAULT_PARSER_BACKEND
+    bloom_filter_capacity: int = 0
+    concurrency: int = 1
+    min_rate: float = 0.5
+    max_rate: float = 2.0
+    incremental: bool = False
+    link_check_ttl: int = 86400
+    link_check_workers: int = 4
+    sitemap_url: str = None
+    shards: int = 1
+    stats_file: str = None
+    max_page_size: int = 0
+    pipeline_queue_size: int = 0
+    url_rules: list = None
+    prioritize: bool = False
+
+
+def get_content_hash(html):
+    """Return a hash of a page's HTML, as bytes or a string."""
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+
+    return hashlib.sha256(html).hexdigest()
 
 
 class Crawl(models.Model):
@@ -26,6 +53,7 @@ class Crawl(models.Model):
     status = models.CharField(max_length=64, default=Status.STARTED)
     config = models.JSONField()
     failure_message = models.TextField(null=True, blank=True)
+    stats = models.JSONField(null=True, blank=True)
 
     class Meta:
         ordering = ["-started"]
@@ -40,16 +68,88 @@ class Crawl(models.Model):
 
     @classmethod
     def start(cls, config: CrawlConfig):
-        return cls.objects.create(config=dataclasses.asdict(config))
+        crawl = cls.objects.create(config=dataclasses.asdict(config))
+
+        if config.shards > 1:
+            CrawlShard.objects.bulk_create(
+                CrawlShard(crawl=crawl, index=index) for index in range(config.shards)
+            )
+
+        return crawl
+
+    # Status changes only save the fields they change, so that they don't
+    # overwrite stats saved by the crawler in the meantime.
+    def resume(self):
+        # Crawls started before an option was added use its default.
+        self.config = dataclasses.asdict(CrawlConfig(**self.config))
+        self.status = self.Status.STARTED
+        self.failure_message = None
+        self.save(update_fields=["config", "status", "failure_message"])
 
     def finish(self):
         self.status = self.Status.FINISHED
-        self.save()
+        self.save(update_fields=["status"])
 
     def fail(self, failure_message):
         self.status = self.Status.FAILED
         self.failure_message = failure_message
-        self.save()
+        self.save(update_fields=["status", "failure_message"])
+
+    def add_stats(self, stats):
+        """Add the stats from one run of the crawl to its totals."""
+        with transaction.atomic():
+            crawl = Crawl.objects.select_for_update().get(pk=self.pk)
+            self.stats = merge_stats(crawl.stats, stats)
+            self.save(update_fields=["stats"])
+
+
+class CrawlShard(models.Model):
+    """One of the workers that together run a sharded crawl."""
+
+    class Status(models.TextChoices):
+        RUNNING = "Running"
+        IDLE = "Idle"
+        FAILED = "Failed"
+
+    crawl = models.ForeignKey(Crawl, on_delete=models.CASCADE, related_name="shards")
+    index = models.PositiveIntegerField()
+    status = models.CharField(max_length=64, default=Status.RUNNING)
+
+    class Meta:
+        ordering = ["crawl", "index"]
+        constraints = [
+            models.UniqueConstraint("crawl", "index", name="crawlshard_crawl_index_key")
+        ]
+
+    def __str__(self):
+        return f"Crawl {self.crawl_id} shard {self.index} ({self.status})"
+
+
+class FrontierURL(models.Model):
+    """A URL found by one shard of a crawl that belongs to another shard."""
+
+    crawl = models.ForeignKey(
+        Crawl, on_delete=models.CASCADE, related_name="frontier_urls"
+    )
+    shard = models.PositiveIntegerField()
+    url = models.TextField()
+    parent_url = models.TextField(null=True, blank=True)
+    level = models.PositiveIntegerField(default=0)
+    claimed = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["pk"]
+        constraints = [
+            models.UniqueConstraint("crawl", "url", name="frontierurl_crawl_url_key")
+        ]
+        indexes = [
+            models.Index(
+                "crawl", "shard", "claimed", name="frontierurl_shard_claimed_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.url} (shard {self.shard})"
 
 
 class LatestCrawlManager(models.Manager):
@@ -95,13 +195,32 @@ class Link(models.Model):
         ordering = ["href"]
 
 
+class CompressionDictionary(models.Model):
+    """A zlib dictionary trained on pages' HTML, to compress them with."""
+
+    data = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-pk"]
+
+    def __str__(self):
+        return f"Compression dictionary {self.pk} ({len(self.data)} bytes)"
+
+
 class Page(Request, ClusterableModel):
     title = models.TextField()
     language = models.TextField(null=True, blank=True)
-    html = models.TextField()
-    text = models.TextField()
+    html = CompressedTextField()
+    text = CompressedTextField()
     components = ParentalManyToManyField(Component, related_name="pages")
     links = ParentalManyToManyField(Link, related_name="links")
+    etag = models.TextField(null=True, blank=True)
+    last_modified = models.TextField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
+
+    # Set instead of html and text for pages whose content wasn't downloaded.
+    skipped_reason = models.TextField(null=True, blank=True)
 
     class Meta(Request.Meta):
         ordering = Request.Meta.ordering
@@ -119,24 +238,90 @@ class Page(Request, ClusterableModel):
         url,
         html,
         internal_link_host,
+        parser_backend=DEFAULT_PARSER_BACKEND,
+        encoding=None,
+    ):
+        record = PageRecord.from_html(
+            url, html, internal_link_host, parser_backend, encoding
+        )
+
+        if record is None:
+            return None
+
+        page = record.to_page()
+        page.links = [Link(href=href) for href in record.links]
+        page.components = [
+            Component(class_name=class_name) for class_name in record.components
+        ]
+        return page
+
+
+@dataclasses.dataclass(slots=True)
+class PageRecord:
+    """A crawled page waiting to be saved, without the overhead of a model.
+
+    Crawls create one of these for every page they download. Its links and
+    components are plain strings, which are only turned into rows, along
+    with the Page itself, when records are saved in bulk.
+    """
+
+    url: str
+    timestamp: datetime
+    title: str
+    html: str
+    text: str
+    language: str = None
+    links: list = dataclasses.field(default_factory=list)
+    components: list = dataclasses.field(default_factory=list)
+    etag: str = None
+    last_modified: str = None
+    content_hash: str = None
+    skipped_reason: str = None
+    crawl: Crawl = None
+
+    def __str__(self):
+        return self.url
+
+    @classmethod
+    def from_html(
+        cls,
+        url,
+        html,
+        internal_link_host,
+        parser_backend=DEFAULT_PARSER_BACKEND,
+        encoding=None,
     ):
-        parsed_html = parse_html(html, internal_link_host)
+        parsed_html = parse_html(html, internal_link_host, parser_backend, encoding)
 
         if parsed_html is None:
             return None
 
-        return Page(
-            timestamp=parsed_html.timestamp,
+        return cls(
             url=url,
+            timestamp=parsed_html.timestamp,
             title=parsed_html.title,
-            language=parsed_html.language,
             html=parsed_html.html,
             text=parsed_html.text,
-            links=[Link(href=href) for href in parsed_html.links],
-            components=[
-                Component(class_name=class_name)
-                for class_name in parsed_html.components
-            ],
+            language=parsed_html.language,
+            links=parsed_html.links,
+            components=parsed_html.components,
+            content_hash=get_content_hash(html),
+        )
+
+    def to_page(self):
+        """Return a Page for this record, without its components and links."""
+        return Page(
+            crawl=self.crawl,
+            timestamp=self.timestamp,
+            url=self.url,
+            title=self.title,
+            language=self.language,
+            html=self.html,
+            text=self.text,
+            etag=self.etag,
+            last_modified=self.last_modified,
+            content_hash=self.content_hash,
+            skipped_reason=self.skipped_reason,
         )
 
 
@@ -1,20 +1,63 @@
+import atexit
+import codecs
+import email.message
+import functools
+import hashlib
+import logging
 import multiprocessing
+import queue
 import re
+import resource
+import signal
+import time
+from collections import defaultdict
 from dataclasses import dataclass, field
 from datetime import datetime
 from os import environ
-from typing import List
+from pathlib import Path
+from typing import List, Set
 from urllib import parse
 
+from django.core.cache import caches
 from django.utils import timezone
 
 import lxml.etree
 import lxml.html.soupparser
 
-HTML_COMPONENT_SEARCH = re.compile(r"(?:(?:class=\")|\s)((?:o|m|a)-[\w\-]*)")
+HTML_COMPONENT_CLASS_NAME = re.compile(r"(?:o|m|a)-[\w\-]*")
 HTML_EXTERNAL_SITE = re.compile("/external-site/")
+HTML_META_CHARSET = re.compile(
+    rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE
+)
 HTML_WHITESPACE = re.compile(r"\s+")
 
+# Elements removed from the page body before extracting text, links, and
+# components. Only simple tag and class selectors are supported.
+DROP_ELEMENT_SELECTORS = [
+    ".o-header",
+    ".o-footer",
+    ".skip-nav",
+    "img",
+    "script",
+    "style",
+]
+
+PARSER_POOL_SIZE = 1
+PARSER_MAX_PAGES_PER_WORKER = 500
+PARSER_MAX_RSS_GROWTH_KB = 256 * 1024
+PARSER_TIMEOUT = 5
+
+# Cached parse results are invalidated whenever this file changes.
+PARSER_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:12]
+
+DEFAULT_PARSER_BACKEND = "lxml"
+
+logger = logging.getLogger("crawler")
+
+
+class ParserWorkerError(Exception):
+    """Parser workers repeatedly timed out or died while parsing a page."""
+
 
 @dataclass
 class ParsedHTML:
@@ -27,8 +70,31 @@ class ParsedHTML:
     components: List[str] = field(default_factory=list)
 
 
-def parse_html(html, internal_link_host):
-    # Parse HTML using lxml in a child process to avoid memory leaks.
+def parse_html(html, internal_link_host, backend=DEFAULT_PARSER_BACKEND, encoding=None):
+    # HTML may be passed as raw bytes, optionally with the encoding declared by
+    # the server. UTF-8 bytes are passed directly to the parser, which decodes
+    # them natively; other encodings are parsed from the decoded text, which
+    # is needed anyway to store the page's HTML.
+    if isinstance(html, bytes):
+        encoding = get_html_encoding(html, encoding)
+        html_text = html.decode(encoding, errors="replace")
+
+        if codecs.lookup(encoding).name != "utf-8":
+            html, encoding = html_text, None
+    else:
+        encoding = None
+        html_text = html
+
+    # Skip parsing entirely if this exact HTML has been parsed before.
+    cache = caches["parser"]
+    cache_key = _get_cache_key(html, internal_link_host, backend, encoding)
+    cached = cache.get(cache_key)
+
+    if cached is not None:
+        return ParsedHTML(html=html_text, **cached) if cached else None
+
+    # Parse HTML using lxml in a pool of recycled child processes to avoid
+    # memory leaks.
     #
     # See https://www.reddit.com/r/Python/comments/j0gl8t/psa_pythonlxml_memory_leaks_and_a_solution/
     #
@@ -36,65 +102,336 @@ def parse_html(html, internal_link_host):
     # testing just call lxml directly since we don't care as much
     # about long-running memory usage.
     parser = (
-        _parse_html
-        if ("PYTEST_CURRENT_TEST" in environ)
-        else _parse_html_multiprocessing
+        _parse_html if ("PYTEST_CURRENT_TEST" in environ) else get_parser_pool().parse
     )
-    return parser(html, internal_link_host)
 
+    try:
+        parsed_html = parser(html, internal_link_host, backend, encoding)
+    except ParserWorkerError as e:
+        # Don't cache the failure, since the page may parse another time.
+        logger.error(e)
+        return None
 
-def _parse_html_multiprocessing(html, internal_link_host):  # pragma: no cover
-    queue = multiprocessing.Queue()
-    process = multiprocessing.Process(
-        target=_parse_html_multiprocessing_process,
-        args=(html, internal_link_host, queue),
+    cache.set(
+        cache_key,
+        (
+            {
+                "title": parsed_html.title,
+                "language": parsed_html.language,
+                "text": parsed_html.text,
+                "links": parsed_html.links,
+                "components": parsed_html.components,
+            }
+            if parsed_html is not None
+            else {}
+        ),
     )
-    process.daemon = True
-    process.start()
 
-    parsed_html = queue.get(timeout=5)
-    process.terminate()
+    if parsed_html is not None:
+        parsed_html.html = html_text
 
     return parsed_html
 
 
-def _parse_html_multiprocessing_process(
-    html, internal_link_host, queue
-):  # pragma: no cover
-    parsed_html = _parse_html(html, internal_link_host)
-    queue.put(parsed_html)
+def get_html_encoding(html, declared_encoding=None):
+    """Choose the encoding to use to decode HTML bytes.
+
+    Prefer a declared encoding, like one from a Content-Type header, then one
+    from a <meta> tag near the start of the document, and then UTF-8.
+    """
+    meta_charset = HTML_META_CHARSET.search(html, 0, 1024)
+
+    for encoding in [
+        declared_encoding,
+        meta_charset.group(1).decode("ascii") if meta_charset else None,
+    ]:
+        if not encoding:
+            continue
+
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            continue
+
+        return encoding
 
+    return "utf-8"
 
-def _parse_html(html, internal_link_host):
-    tree = _parse_html_into_tree(html)
 
-    title_tag = tree.find(".//title")
-    title = title_tag.text.strip() if title_tag is not None else None
-    language = tree.find(".").get("lang")
+def get_content_type_charset(content_type):
+    """Return the charset parameter of a Content-Type header, if any."""
+    message = email.message.Message()
+    message["Content-Type"] = content_type
+    return message.get_content_charset()
 
-    if title is None:
+
+def get_link_urls(html, base_url):
+    """Return the absolute URLs of all of a page's links, like wpull finds them.
+
+    Unlike the links returned by parse_html, these include links in parts of
+    the page that are dropped before extracting its content, like the site
+    header and footer.
+    """
+    try:
+        tree = lxml.html.document_fromstring(
+            html.encode("utf-8"), parser=_get_lxml_parser("utf-8")
+        )
+    except lxml.etree.ParserError:
+        return []
+
+    # Links are relative to the page's <base> element, if it has one.
+    base = tree.find(".//base[@href]")
+
+    if base is not None:
+        base_url = _join_url(base_url, base.get("href")) or base_url
+
+    urls = (_join_url(base_url, element.get("href")) for element in tree.iter("a"))
+    return [url for url in urls if url]
+
+
+def _join_url(base_url, href):
+    href = (href or "").strip()
+
+    if not href:
         return None
 
-    body = _get_cleaned_body_from_tree(tree)
+    try:
+        return parse.urljoin(base_url, href)
+    except ValueError:
+        return None
 
-    if body is not None:
-        text = HTML_WHITESPACE.sub(" ", body.text_content()).strip()
-    else:
-        text = None
 
-    parsed_html = ParsedHTML(title=title, language=language, html=html, text=text)
+def _get_cache_key(html, internal_link_host, backend, encoding):
+    content_hash = hashlib.sha256(internal_link_host.encode("utf-8") + b"\0")
+    content_hash.update(html if isinstance(html, bytes) else html.encode("utf-8"))
+    return (
+        f"parsed-html:{PARSER_VERSION}:{backend}:{encoding}:{content_hash.hexdigest()}"
+    )
+
+
+class ParserWorker:
+    """A long-lived child process that parses HTML sent to it over a pipe.
+
+    HTML is only sent one way: the worker returns the parsed result without
+    the original markup, which the parent reattaches.
+    """
+
+    def __init__(self):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_parser_worker_main, args=(child_connection,), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+
+        self.pages_parsed = 0
+        self.rss_growth_kb = 0
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def parse(self, html, internal_link_host, backend, encoding, timeout):
+        self.connection.send((html, internal_link_host, backend, encoding))
+
+        if not self.connection.poll(timeout):
+            raise TimeoutError(f"Parser worker {self.pid} timed out")
+
+        parsed_html, exception, self.rss_growth_kb, backend_stats = (
+            self.connection.recv()
+        )
+        self.pages_parsed += 1
+
+        for name, stats in backend_stats.items():
+            parser_backend_stats[name].add(stats)
+
+        if exception is not None:
+            raise exception
+
+        if parsed_html is not None:
+            parsed_html.html = html
 
-    if body is None:
         return parsed_html
 
-    hrefs = list(
-        set(
-            href
-            for element, attribute, href, pos in body.iterlinks()
-            if "a" == element.tag and "href" == attribute
+    def close(self, timeout=1):
+        # Ask the worker to exit. Workers that don't, for example because
+        # they're stuck parsing a page, are terminated.
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+
+        self.process.join(timeout)
+
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+        self.connection.close()
+
+
+class ParserPool:
+    """A pool of parser worker processes that are recycled periodically.
+
+    Parsing with lxml leaks memory, so each worker is replaced after it has
+    parsed max_pages_per_worker pages or its RSS has grown by more than
+    max_rss_growth_kb since it started. Workers that time out or die are
+    replaced, and the page is retried once in a fresh worker. If that fails
+    too, the page is given up on and counted as a failure of its backend,
+    rather than risk hanging or crashing the current process on it.
+    """
+
+    def __init__(
+        self,
+        size=PARSER_POOL_SIZE,
+        max_pages_per_worker=PARSER_MAX_PAGES_PER_WORKER,
+        max_rss_growth_kb=PARSER_MAX_RSS_GROWTH_KB,
+        timeout=PARSER_TIMEOUT,
+    ):
+        self.size = size
+        self.max_pages_per_worker = max_pages_per_worker
+        self.max_rss_growth_kb = max_rss_growth_kb
+        self.timeout = timeout
+
+        # Workers are started lazily; None marks a free slot with no worker.
+        self._workers = queue.Queue()
+        for _ in range(size):
+            self._workers.put(None)
+
+    def parse(
+        self, html, internal_link_host, backend=DEFAULT_PARSER_BACKEND, encoding=None
+    ):
+        worker = self._workers.get()
+
+        try:
+            for _ in range(2):
+                if worker is None:
+                    worker = ParserWorker()
+
+                try:
+                    parsed_html = worker.parse(
+                        html, internal_link_host, backend, encoding, self.timeout
+                    )
+                except (TimeoutError, EOFError, OSError) as e:
+                    logger.warning(f"Restarting parser worker {worker.pid}: {e!r}")
+                    worker.close(timeout=0)
+                    worker = None
+                    continue
+
+                if self._should_recycle(worker):
+                    logger.debug(
+                        f"Recycling parser worker {worker.pid} after "
+                        f"{worker.pages_parsed} pages, "
+                        f"RSS growth {worker.rss_growth_kb} KB"
+                    )
+                    worker.close()
+                    worker = None
+
+                return parsed_html
+
+            stats = parser_backend_stats[backend]
+            stats.calls += 1
+            stats.failures += 1
+            raise ParserWorkerError("Parser workers failed, giving up on page")
+        finally:
+            self._workers.put(worker)
+
+    def _should_recycle(self, worker):
+        return (
+            worker.pages_parsed >= self.max_pages_per_worker
+            or worker.rss_growth_kb >= self.max_rss_growth_kb
         )
+
+    def close(self):
+        for _ in range(self.size):
+            worker = self._workers.get()
+
+            if worker is not None:
+                worker.close()
+
+            self._workers.put(None)
+
+
+_parser_pool = None
+
+
+def get_parser_pool():
+    global _parser_pool
+
+    if _parser_pool is None:
+        _parser_pool = ParserPool()
+        atexit.register(_parser_pool.close)
+
+    return _parser_pool
+
+
+def _get_max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _parser_worker_main(connection):
+    # Let the parent process decide when workers should stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    initial_rss_kb = _get_max_rss_kb()
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+
+        if message is None:
+            return
+
+        html, internal_link_host, backend, encoding = message
+
+        parsed_html = exception = None
+
+        try:
+            parsed_html = _parse_html(html, internal_link_host, backend, encoding)
+        except Exception as e:
+            exception = e
+
+        # Don't send the HTML back to the parent, which already has it.
+        if parsed_html is not None:
+            parsed_html.html = None
+
+        # Timing statistics are collected in the parent process.
+        backend_stats = dict(parser_backend_stats)
+        parser_backend_stats.clear()
+
+        connection.send(
+            (
+                parsed_html,
+                exception,
+                _get_max_rss_kb() - initial_rss_kb,
+                backend_stats,
+            )
+        )
+
+
+def _parse_html(
+    html, internal_link_host, backend=DEFAULT_PARSER_BACKEND, encoding=None
+):
+    tree = _parse_html_into_tree(html, backend, encoding)
+    extracted = _extract_from_tree(tree)
+
+    if extracted.title is None:
+        return None
+
+    parsed_html = ParsedHTML(
+        title=extracted.title,
+        language=tree.get("lang"),
+        html=html,
+        text=extracted.text,
     )
 
+    if extracted.text is None:
+        return parsed_html
+
+    hrefs = list(extracted.hrefs)
+
     # Remove any external link URL wrapping.
     for i, href in enumerate(hrefs):
         try:
@@ -113,39 +450,250 @@ def _parse_html(html, internal_link_host):
             hrefs[i] = ext_url[0]
 
     parsed_html.links = sorted(hrefs)
+    parsed_html.components = sorted(extracted.class_names)
 
-    body_html = lxml.etree.tostring(body, encoding="unicode")
+    return parsed_html
 
-    class_names = set(HTML_COMPONENT_SEARCH.findall(body_html))
-    parsed_html.components = sorted(class_names)
 
-    return parsed_html
+def _parse_html_into_tree(html, backend=DEFAULT_PARSER_BACKEND, encoding=None):
+    """Parse HTML with the given backend, falling back to others on failure."""
+    *backend_names, last_backend_name = [backend] + [
+        name for name in PARSER_BACKEND_FALLBACKS if name != backend
+    ]
+
+    for name in backend_names:
+        try:
+            return _parse_html_with_backend(html, name, encoding)
+        except Exception as e:
+            logger.debug(f"Parser backend {name} failed, falling back: {e!r}")
+
+    return _parse_html_with_backend(html, last_backend_name, encoding)
 
 
-def _parse_html_into_tree(html):
+def _parse_html_with_backend(html, name, encoding=None):
+    """Parse HTML with a backend, recording its timing in parser_backend_stats."""
+    stats = parser_backend_stats[name]
+    start = time.perf_counter()
+
     try:
-        return lxml.html.fromstring(html)
-    except lxml.etree.ParserError:
+        return PARSER_BACKENDS[name].parse(html, encoding)
+    except Exception:
+        stats.failures += 1
+        raise
+    finally:
+        stats.calls += 1
+        stats.seconds += time.perf_counter() - start
+
+
+@dataclass
+class _ExtractedContent:
+    title: str | None = None
+    text: str | None = None
+    hrefs: Set[str] = field(default_factory=set)
+    class_names: Set[str] = field(default_factory=set)
+
+
+def _extract_from_tree(tree):
+    """Extract the title and cleaned page body content in one traversal.
+
+    Text, links, and components are only collected from the body, skipping
+    any elements that match DROP_ELEMENT_SELECTORS. Dropped elements keep
+    their tail text, as lxml's drop_tree does.
+    """
+    extracted = _ExtractedContent()
+    text_parts = None
+    body = dropping = None
+    depth = 0
+
+    walker = lxml.etree.iterwalk(tree, events=("start", "end", "comment"))
+
+    for event, element in walker:
+        if event == "comment":
+            if text_parts is not None and dropping is None and element.tail:
+                text_parts.append(element.tail)
+
+            continue
+
+        if event == "end":
+            depth -= 1
+
+            if element is body:
+                text_parts, extracted.text = None, _join_text(text_parts)
+            elif text_parts is not None:
+                if element is dropping:
+                    dropping = None
+
+                if dropping is None and element.tail:
+                    text_parts.append(element.tail)
+
+            continue
+
+        depth += 1
+        tag = element.tag
+
+        if extracted.title is None and tag == "title" and element is not tree:
+            extracted.title = (element.text or "").strip()
+
+        if text_parts is None:
+            if body is None and depth == 2 and tag == "body":
+                body = element
+                text_parts = []
+            else:
+                continue
+
+        elif dropping is not None:
+            continue
+
+        elif _should_drop(element):
+            dropping = element
+
+            # Keep descending until the title is found, to find titles
+            # anywhere in the document, but otherwise skip the subtree.
+            if extracted.title is not None:
+                walker.skip_subtree()
+
+            continue
+
+        if element.text:
+            text_parts.append(element.text)
+
+        if tag == "a":
+            href = element.get("href")
+
+            if href is not None:
+                extracted.hrefs.add(href)
+
+        for class_name in element.get("class", "").split():
+            if component_match := HTML_COMPONENT_CLASS_NAME.match(class_name):
+                extracted.class_names.add(component_match.group())
+
+    return extracted
+
+
+def _should_drop(element):
+    if element.tag in DROP_TAGS:
+        return True
+
+    class_attribute = element.get("class")
+
+    return bool(class_attribute) and not DROP_CLASS_NAMES.isdisjoint(
+        class_attribute.split()
+    )
+
+
+def _join_text(text_parts):
+    return HTML_WHITESPACE.sub(" ", "".join(text_parts)).strip()
+
+
+def _compile_drop_selectors(selectors):
+    """Compile simple tag and class selectors into sets for fast lookup."""
+    tags = set()
+    class_names = set()
+
+    for selector in selectors:
+        if selector.startswith("."):
+            class_names.add(selector[1:])
+        else:
+            tags.add(selector)
+
+    return frozenset(tags), frozenset(class_names)
+
+
+DROP_TAGS, DROP_CLASS_NAMES = _compile_drop_selectors(DROP_ELEMENT_SELECTORS)
+
+
+class ParserBackend:
+    """Parses HTML into an lxml element tree.
+
+    HTML may be a string, or bytes in the given encoding.
+    """
+
+    name = None
+
+    def parse(self, html, encoding=None):
+        raise NotImplementedError
+
+
+class LxmlParserBackend(ParserBackend):
+    name = "lxml"
+
+    def parse(self, html, encoding=None):
+        return lxml.html.fromstring(html, parser=_get_lxml_parser(encoding))
+
+
+class Libxml2RecoverParserBackend(ParserBackend):
+    """Use libxml2's HTML parser in recover mode directly.
+
+    This skips lxml.html's document sniffing and removes libxml2's limits on
+    document depth and text size.
+    """
+
+    name = "libxml2-recover"
+
+    def parse(self, html, encoding=None):
+        tree = lxml.etree.fromstring(
+            html, _get_lxml_parser(encoding, recover=True, huge_tree=True)
+        )
+
+        if tree is None:
+            raise lxml.etree.ParserError("Document is empty")
+
+        return tree
+
+
+class HTML5ParserBackend(ParserBackend):
+    """Use the html5-parser package, which is installed along with wpull."""
+
+    name = "html5-parser"
+
+    def parse(self, html, encoding=None):
+        import html5_parser
+
+        return html5_parser.parse(
+            html, transport_encoding=encoding, treebuilder="lxml_html"
+        )
+
+
+class SoupParserBackend(ParserBackend):
+    name = "soupparser"
+
+    def parse(self, html, encoding=None):
         # https://bugs.launchpad.net/lxml/+bug/1949271
+        if encoding:
+            return lxml.html.soupparser.fromstring(html, from_encoding=encoding)
+
         return lxml.html.soupparser.fromstring(html)
 
 
-def _get_cleaned_body_from_tree(tree):
-    """Extract page body without header, footer, images, or scripts."""
-    body = tree.find("./body")
+@functools.cache
+def _get_lxml_parser(encoding=None, **kwargs):
+    return lxml.html.HTMLParser(encoding=encoding, **kwargs)
+
+
+PARSER_BACKENDS = {
+    backend.name: backend
+    for backend in [
+        LxmlParserBackend(),
+        Libxml2RecoverParserBackend(),
+        HTML5ParserBackend(),
+        SoupParserBackend(),
+    ]
+}
+
+# Backends to try, in order, if the configured backend fails.
+PARSER_BACKEND_FALLBACKS = ["lxml", "soupparser"]
+
+
+@dataclass
+class ParserBackendStats:
+    calls: int = 0
+    failures: int = 0
+    seconds: float = 0
 
-    if body is not None:
-        drop_element_selectors = [
-            ".o-header",
-            ".o-footer",
-            ".skip-nav",
-            "img",
-            "script",
-            "style",
-        ]
+    def add(self, other):
+        self.calls += other.calls
+        self.failures += other.failures
+        self.seconds += other.seconds
 
-        for drop_element_selector in drop_element_selectors:
-            for element in body.cssselect(drop_element_selector):
-                element.drop_tree()
 
-    return body
+parser_backend_stats = defaultdict(ParserBackendStats)
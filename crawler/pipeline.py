@@ -0,0 +1,68 @@
+import logging
+import queue
+import threading
+import time
+
+from crawler.stats import CrawlStats
+
+logger = logging.getLogger("crawler")
+
+
+class PipelineStage:
+    """Process items in a background thread, passing results to the next stage.
+
+    Calls to submit put arguments for process on a queue and return
+    immediately, unless max_queue_size items are already waiting. Then they
+    block until there's room, so that an earlier stage, like downloading
+    pages, can't get further ahead of this one than that. Each non-None
+    result of process is passed to output, which can itself be the submit
+    method of another stage.
+
+    The time that items spend waiting in the queue is recorded in stats as
+    the given stage. Call close to wait for queued items to be processed.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self, process, output, max_queue_size=100, stats=None, stage="parse_queue_wait"
+    ):
+        self.process = process
+        self.output = output
+        self.stats = stats or CrawlStats()
+        self.stage = stage
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.thread = threading.Thread(
+            target=self._run, name="PipelineStage", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, *args):
+        self.queue.put((args, time.perf_counter()))
+
+    def join(self):
+        """Wait until all submitted items have been processed."""
+        self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put((self._STOP, None))
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            args, submitted = self.queue.get()
+
+            try:
+                if args is self._STOP:
+                    break
+
+                self.stats.observe(self.stage, time.perf_counter() - submitted)
+                result = self.process(*args)
+
+                if result is not None:
+                    self.output(result)
+            except Exception:
+                logger.exception(f"Failed to process {args[0]!r}")
+            finally:
+                self.queue.task_done()
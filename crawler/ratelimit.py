@@ -0,0 +1,168 @@
+import email.utils
+import threading
+import time
+from dataclasses import dataclass
+
+# Responses with these status codes mean that a host wants us to slow down.
+BACKOFF_STATUS_CODES = {429, 503}
+
+# A response that takes this many times longer than a host's average
+# response time also causes the rate for that host to be reduced.
+LATENCY_BACKOFF_FACTOR = 2
+
+# Weight given to each new response time in a host's moving average.
+LATENCY_SMOOTHING = 0.2
+
+# Additive increase in requests per second after each fast response.
+RATE_INCREASE = 0.5
+
+# Multiplicative decrease in the request rate after a slow or failed response.
+RATE_DECREASE = 0.5
+
+# Never wait longer than this for a Retry-After header, in seconds.
+MAX_RETRY_AFTER = 600
+
+
+@dataclass
+class HostRate:
+    rate: float
+    requests: int = 0
+    first_request: float = None
+    last_request: float = None
+    average_latency: float = None
+    retry_at: float = 0
+
+    # When the latest request to this host that has been waited for is due.
+    next_request: float = None
+
+    @property
+    def achieved_rate(self):
+        """Average number of requests per second made to this host."""
+        if self.requests < 2 or self.last_request == self.first_request:
+            return 0
+
+        return (self.requests - 1) / (self.last_request - self.first_request)
+
+
+class AdaptiveRateController:
+    """Control the rate of requests made to each host.
+
+    The rate for a host starts at min_rate requests per second and increases
+    while the host responds quickly, up to max_rate. Errors, 429 and 503
+    responses, and responses much slower than the host's average halve the
+    rate, down to min_rate. Retry-After headers are respected.
+
+    The controller can be shared by several threads.
+    """
+
+    def __init__(self, min_rate=0.5, max_rate=2, clock=time.monotonic):
+        if not 0 < min_rate <= max_rate:
+            raise ValueError("Rates must satisfy 0 < min_rate <= max_rate")
+
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.clock = clock
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _get_host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostRate(rate=self.min_rate)
+
+        return self.hosts[host]
+
+    def get_delay(self, host):
+        """Return how many seconds to wait before the next request to host.
+
+        Each call reserves the next request to host, 1 / rate seconds after
+        the last request made or reserved, so that several requests waiting
+        for the same host at once together stay within its rate. The first
+        request to a host doesn't need to wait.
+        """
+        with self.lock:
+            host_rate = self._get_host(host)
+            now = self.clock()
+
+            previous_requests = [
+                t
+                for t in [host_rate.last_request, host_rate.next_request]
+                if t is not None
+            ]
+
+            host_rate.next_request = max(
+                now,
+                host_rate.retry_at,
+                *(t + 1 / host_rate.rate for t in previous_requests),
+            )
+
+            return host_rate.next_request - now
+
+    def record_response(self, host, status_code, latency, retry_after=None):
+        """Adjust the rate for host given a response from it."""
+        with self.lock:
+            self._record_response(host, status_code, latency, retry_after)
+
+    def _record_response(self, host, status_code, latency, retry_after):
+        host_rate = self._record_request(host)
+
+        if retry_after:
+            retry_after_seconds = parse_retry_after(retry_after)
+
+            if retry_after_seconds:
+                host_rate.retry_at = self.clock() + retry_after_seconds
+
+        slow = (
+            host_rate.average_latency is not None
+            and latency > host_rate.average_latency * LATENCY_BACKOFF_FACTOR
+        )
+
+        if host_rate.average_latency is None:
+            host_rate.average_latency = latency
+        else:
+            host_rate.average_latency += LATENCY_SMOOTHING * (
+                latency - host_rate.average_latency
+            )
+
+        if slow or status_code in BACKOFF_STATUS_CODES:
+            self._decrease(host_rate)
+        else:
+            host_rate.rate = min(self.max_rate, host_rate.rate + RATE_INCREASE)
+
+    def record_error(self, host):
+        """Reduce the rate for host after a request to it fails."""
+        with self.lock:
+            self._decrease(self._record_request(host))
+
+    def _record_request(self, host):
+        host_rate = self._get_host(host)
+        now = self.clock()
+
+        if host_rate.first_request is None:
+            host_rate.first_request = now
+
+        host_rate.last_request = now
+        host_rate.requests += 1
+
+        return host_rate
+
+    def _decrease(self, host_rate):
+        host_rate.rate = max(self.min_rate, host_rate.rate * RATE_DECREASE)
+
+
+def parse_retry_after(value):
+    """Convert a Retry-After header value into a number of seconds.
+
+    The header may contain either a number of seconds or an HTTP date.
+    Returns None if the value can't be parsed.
+    """
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+        seconds = retry_at.timestamp() - time.time()
+
+    return min(max(0, seconds), MAX_RETRY_AFTER)
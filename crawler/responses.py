@@ -0,0 +1,161 @@
+import logging
+
+from django.utils import timezone
+
+from crawler.models import Crawl, Page, PageRecord, get_content_hash
+from crawler.parser import DEFAULT_PARSER_BACKEND, get_content_type_charset
+from crawler.stats import CrawlStats
+from crawler.writer import UnchangedPage
+
+logger = logging.getLogger("crawler")
+
+
+def is_html(content_type):
+    return (content_type or "").startswith("text/html")
+
+
+def get_content_length(value):
+    """Parse a Content-Length header value, returning None if it's invalid."""
+    try:
+        content_length = int(value)
+    except (TypeError, ValueError):
+        return None
+
+    return content_length if content_length >= 0 else None
+
+
+def exceeds_max_page_size(size, max_page_size):
+    """Return whether a page of size bytes is too large to save.
+
+    A max_page_size of 0 means there's no limit, and pages of unknown size,
+    passed as None, can't be judged until they've been downloaded.
+    """
+    return bool(max_page_size) and size is not None and size > max_page_size
+
+
+def should_download(content_type, content_length, max_page_size):
+    """Decide from a successful response's headers whether to download its body.
+
+    Only HTML pages are parsed and saved, so there's no need to download
+    anything else, or pages whose Content-Length is already too large.
+    """
+    return is_html(content_type) and not exceeds_max_page_size(
+        content_length, max_page_size
+    )
+
+
+def make_skipped_page(url, size, max_page_size, etag=None, last_modified=None):
+    """Return a page without content, recording that it was too large."""
+    logger.info(f"Skipping {url} of {size} bytes")
+
+    return PageRecord(
+        timestamp=timezone.now(),
+        url=url,
+        title="",
+        html="",
+        text="",
+        etag=etag,
+        last_modified=last_modified,
+        skipped_reason=(
+            f"Size of {size} bytes exceeds the limit of {max_page_size} bytes"
+        ),
+    )
+
+
+def get_previous_pages(crawl_record):
+    """Return pages saved by the last finished crawl of the same start URL.
+
+    Pages are keyed by URL and include the validators needed to make
+    conditional requests for them.
+    """
+    previous_crawl = Crawl.objects.filter(
+        status=Crawl.Status.FINISHED,
+        config__start_url=crawl_record.config["start_url"],
+    ).first()
+
+    if not previous_crawl:
+        return {}
+
+    return {
+        page.url: page
+        for page in Page._base_manager.filter(crawl=previous_crawl).values_list(
+            "url",
+            "id",
+            "timestamp",
+            "etag",
+            "last_modified",
+            "content_hash",
+            named=True,
+        )
+    }
+
+
+def get_conditional_headers(previous_page):
+    """Return the headers to request a page saved by a previous crawl with.
+
+    The server can then respond with a 304 if the page hasn't changed.
+    """
+    headers = {}
+
+    if previous_page.etag:
+        headers["If-None-Match"] = previous_page.etag
+
+    if previous_page.last_modified:
+        headers["If-Modified-Since"] = previous_page.last_modified
+
+    return headers
+
+
+def is_unchanged_in_sitemap(sitemap_entry, previous_page):
+    """Return whether a sitemap says a page hasn't changed since it was saved."""
+    return bool(
+        sitemap_entry
+        and sitemap_entry.lastmod
+        and sitemap_entry.lastmod <= previous_page.timestamp
+    )
+
+
+def build_page(
+    url,
+    html,
+    internal_link_host,
+    parser_backend=DEFAULT_PARSER_BACKEND,
+    content_type=None,
+    etag=None,
+    last_modified=None,
+    previous_page=None,
+    stats=None,
+):
+    """Parse a downloaded page into a record to save.
+
+    Pages whose content is the same as when previous_page was saved aren't
+    parsed again, and an UnchangedPage is returned to copy it instead. This
+    catches unchanged pages even if the server doesn't support conditional
+    requests. Returns None if the page can't be parsed.
+    """
+    if previous_page and previous_page.content_hash == get_content_hash(html):
+        return UnchangedPage(
+            previous_page.id,
+            timezone.now(),
+            etag=etag,
+            last_modified=last_modified,
+        )
+
+    # Pass the raw response bytes to the parser, which decodes them using the
+    # declared charset, rather than decoding them here.
+    with (stats or CrawlStats()).timer("parse"):
+        page = PageRecord.from_html(
+            url,
+            html,
+            internal_link_host,
+            parser_backend,
+            get_content_type_charset(content_type),
+        )
+
+    if not page:
+        logger.debug(f"Unexpected response for {url}, skipping")
+        return None
+
+    page.etag = etag
+    page.last_modified = last_modified
+    return page
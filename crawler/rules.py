@@ -0,0 +1,273 @@
+import re
+from dataclasses import asdict, dataclass, field
+from urllib import parse
+
+ACTIONS = {
+    # Don't crawl or check the URL.
+    "skip",
+    # Check the URL, which must be on another domain, with a HEAD request.
+    "head",
+    # Crawl the URL, without applying any later rules.
+    "follow",
+    # Crawl the URL given by one of the URL's query string parameters instead,
+    # or the URL itself if it doesn't have that parameter.
+    "unwrap",
+}
+
+# Rules can apply to URLs on the start domain, on other domains, or both.
+SCOPES = {"any", "internal", "external"}
+
+# The rules used when a crawl doesn't configure its own. URLs that don't match
+# any rule are crawled if they're on the start domain, and checked with a GET
+# request if they're not.
+DEFAULT_URL_RULES = [
+    {"action": "skip", "prefix": "https://www.facebook.com/dialog/share?"},
+    {"action": "skip", "prefix": "https://twitter.com/intent/tweet?"},
+    {"action": "skip", "prefix": "https://x.com/intent/tweet?"},
+    {"action": "skip", "prefix": "https://www.linkedin.com/shareArticle?"},
+    {
+        "action": "head",
+        "prefix": "https://files.consumerfinance.gov/",
+        "scope": "external",
+    },
+    # Don't crawl URLs on the start domain that look like filenames.
+    {"action": "skip", "pattern": r"[^:/?#]+://[^/?#]*/[^?#]*\.", "scope": "internal"},
+    # Don't crawl external link URLs directly. Instead crawl to their ultimate
+    # destination.
+    {
+        "action": "unwrap",
+        "prefix": "/external-site/",
+        "param": "ext_url",
+        "scope": "internal",
+    },
+    # Only crawl URLs on the start domain whose only query string parameter
+    # is "page". Parameters with blank values, like "?page=1&sort=", don't
+    # count.
+    {
+        "action": "follow",
+        "pattern": r"[^?#]*\?page=[^&#]*(?:&page=[^&#]*)*(?:#|$)",
+        "scope": "internal",
+    },
+    {
+        "action": "skip",
+        "pattern": r"[^?#]*\?(?:[^&#]*&)*(?!page=)[^&#=]*=[^&#]",
+        "scope": "internal",
+    },
+]
+
+# Patterns are combined into a single regular expression, where groups are
+# numbered across all of them, so they can't refer back to their own groups.
+_BACKREFERENCE = re.compile(r"(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?P=|\(\?\()")
+
+# Flags set for the whole of a pattern, which must come at its start.
+_GLOBAL_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+# Group names must be unique across the combined expression.
+_NAMED_GROUP = re.compile(r"(?<!\\)((?:\\\\)*)\(\?P<\w+>")
+
+
+@dataclass
+class URLRule:
+    """A rule deciding what to do with URLs found during a crawl.
+
+    Rules match URLs either by prefix or by a regular expression matched
+    against the start of the URL. Prefixes without a scheme and host, like
+    "/search/", match the path and query string of URLs on any host.
+    """
+
+    action: str
+    prefix: str = None
+    pattern: str = None
+    scope: str = "any"
+    param: str = None
+    hits: int = field(default=0, compare=False)
+
+    def __post_init__(self):
+        if self.action not in ACTIONS:
+            raise ValueError(f"Unknown URL rule action {self.action!r}")
+
+        if (self.prefix is None) == (self.pattern is None):
+            raise ValueError("URL rules need either a prefix or a pattern")
+
+        if self.scope not in SCOPES:
+            raise ValueError(f"Unknown URL rule scope {self.scope!r}")
+
+        if self.action == "unwrap" and not self.param:
+            raise ValueError("Unwrap URL rules need a param")
+
+        if self.action != "unwrap" and self.param:
+            raise ValueError("Only unwrap URL rules can have a param")
+
+        if self.pattern is not None:
+            try:
+                re.compile(self.pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid URL rule pattern {self.pattern!r}: {e}")
+
+            if _BACKREFERENCE.search(self.pattern):
+                raise ValueError(
+                    f"URL rule pattern {self.pattern!r} can't use backreferences"
+                )
+
+    def __str__(self):
+        s = f"{self.action} {self.prefix or self.pattern}"
+
+        if self.scope != "any":
+            s += f" ({self.scope})"
+
+        return s
+
+    def to_dict(self):
+        return {
+            name: value
+            for name, value in asdict(self).items()
+            if name != "hits"
+            and value is not None
+            and (name, value) != ("scope", "any")
+        }
+
+    def unwrap(self, url):
+        """Return the URL wrapped by url, or None if it doesn't have one."""
+        values = parse.parse_qs(parse.urlsplit(url).query).get(self.param)
+        return values[0] if values else None
+
+
+def _split_url(url):
+    """Split a URL into its lowercased scheme and host, and the rest."""
+    scheme_end = url.find("://")
+
+    if scheme_end == -1:
+        return None, url
+
+    host_end = len(url)
+
+    for delimiter in "/?#":
+        i = url.find(delimiter, scheme_end + 3)
+
+        if i != -1:
+            host_end = min(host_end, i)
+
+    return url[:host_end].lower(), url[host_end:]
+
+
+def _make_combinable(pattern):
+    """Rewrite a pattern so that it can be combined with others.
+
+    Flags set for the whole pattern are scoped to it, and its named groups,
+    which it can't refer back to, are made anonymous.
+    """
+    flags = ""
+
+    while match := _GLOBAL_FLAGS.match(pattern):
+        flags += match.group(1)
+        pattern = pattern[match.end() :]
+
+    pattern = _NAMED_GROUP.sub(r"\1(?:", pattern)
+
+    if flags:
+        # A comment at the end of a verbose pattern mustn't hide the end of
+        # its group.
+        end = "\n)" if "x" in flags else ")"
+        pattern = f"(?{flags}:{pattern}{end}"
+
+    return pattern
+
+
+class _TrieNode:
+    __slots__ = ["children", "rule_indexes"]
+
+    def __init__(self):
+        self.children = {}
+        self.rule_indexes = []
+
+
+class _Matcher:
+    """Finds the first of a list of rules that matches a URL.
+
+    Prefix rules are stored in a character trie for each host, and patterns
+    are combined into a single regular expression, so that the cost of
+    matching doesn't grow with the number of rules.
+    """
+
+    def __init__(self, indexed_rules):
+        self.tries = {}
+        patterns = []
+
+        for i, rule in indexed_rules:
+            if rule.prefix is not None:
+                host, rest = _split_url(rule.prefix)
+                node = self.tries.setdefault(host, _TrieNode())
+
+                for char in rest:
+                    node = node.children.setdefault(char, _TrieNode())
+
+                node.rule_indexes.append(i)
+            else:
+                patterns.append(f"(?P<_rule{i}>{_make_combinable(rule.pattern)})")
+
+        try:
+            self.regex = re.compile("|".join(patterns)) if patterns else None
+        except re.error as e:
+            raise ValueError(f"Invalid URL rule patterns: {e}")
+
+    def match(self, url):
+        """Return the index of the first matching rule, or None."""
+        candidates = []
+        host, rest = _split_url(url)
+
+        for key in (host, None):
+            node = self.tries.get(key)
+
+            for char in rest if node else "":
+                candidates.extend(node.rule_indexes)
+                node = node.children.get(char)
+
+                if node is None:
+                    break
+            else:
+                if node:
+                    candidates.extend(node.rule_indexes)
+
+        if self.regex:
+            match = self.regex.match(url)
+
+            if match:
+                candidates.append(int(match.lastgroup.removeprefix("_rule")))
+
+        return min(candidates, default=None)
+
+
+class URLRuleSet:
+    """An ordered list of URL rules, compiled for fast matching.
+
+    The first rule, in order, that matches a URL applies to it. Each rule
+    counts how many URLs it has matched.
+    """
+
+    def __init__(self, rules):
+        self.rules = [
+            rule if isinstance(rule, URLRule) else URLRule(**rule) for rule in rules
+        ]
+
+        self.matchers = {
+            internal: _Matcher(
+                (i, rule)
+                for i, rule in enumerate(self.rules)
+                if rule.scope in ("any", "internal" if internal else "external")
+            )
+            for internal in (True, False)
+        }
+
+    def match(self, url, internal=True):
+        """Return the rule that applies to a URL, or None if none do.
+
+        internal says whether the URL is on the start domain of the crawl.
+        """
+        i = self.matchers[internal].match(url)
+
+        if i is None:
+            return None
+
+        rule = self.rules[i]
+        rule.hits += 1
+        return rule
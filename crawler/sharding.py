@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from crawler.models import Crawl, CrawlShard, FrontierURL
+from crawler.url_index import canonicalize_url
+
+logger = logging.getLogger("crawler")
+
+
+# How often idle shards check the frontier for new URLs, in seconds.
+FRONTIER_POLL_INTERVAL = 5
+
+
+def get_shard(url, num_shards):
+    """Return the index of the shard responsible for crawling a URL."""
+    digest = hashlib.blake2b(
+        canonicalize_url(url).encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "little") % num_shards
+
+
+def claim_frontier_urls(crawl, shard_index, limit=1000):
+    """Claim up to limit unclaimed frontier URLs for a shard."""
+    with transaction.atomic():
+        pks = list(
+            FrontierURL.objects.filter(
+                crawl=crawl, shard=shard_index, claimed=False
+            ).values_list("pk", flat=True)[:limit]
+        )
+
+        FrontierURL.objects.filter(pk__in=pks).update(claimed=True)
+
+        return list(FrontierURL.objects.filter(pk__in=pks))
+
+
+def wait_for_frontier(crawl, shard_index, poll_interval=FRONTIER_POLL_INTERVAL):
+    """Wait until a shard has frontier URLs to crawl, or the crawl is over.
+
+    Returns True if the shard has more URLs to crawl. While it waits, the
+    shard is marked as idle. Once every shard is idle and no unclaimed URLs
+    remain, the crawl is finished and False is returned. False is also
+    returned if the crawl has failed.
+    """
+    shard = CrawlShard.objects.filter(crawl=crawl, index=shard_index)
+
+    while True:
+        crawl.refresh_from_db(fields=["status"])
+
+        if crawl.status != Crawl.Status.STARTED:
+            return False
+
+        if FrontierURL.objects.filter(
+            crawl=crawl, shard=shard_index, claimed=False
+        ).exists():
+            shard.update(status=CrawlShard.Status.RUNNING)
+            return True
+
+        shard.update(status=CrawlShard.Status.IDLE)
+
+        # Decide whether the crawl has finished in a single UPDATE, so that
+        # no shard can start crawling or add to the frontier in between
+        # checking and finishing. Locking rows with select_for_update
+        # wouldn't do this, as it's a no-op on SQLite.
+        finished = (
+            Crawl.objects.filter(pk=crawl.pk, status=Crawl.Status.STARTED)
+            .exclude(
+                Exists(
+                    CrawlShard.objects.filter(crawl=OuterRef("pk")).exclude(
+                        status=CrawlShard.Status.IDLE
+                    )
+                )
+            )
+            .exclude(
+                Exists(FrontierURL.objects.filter(crawl=OuterRef("pk"), claimed=False))
+            )
+            .update(status=Crawl.Status.FINISHED)
+        )
+
+        if finished:
+            logger.info(f"All shards of crawl {crawl.pk} have finished")
+            crawl.status = Crawl.Status.FINISHED
+            return False
+
+        time.sleep(poll_interval)
+
+
+def fail_shard(crawl, shard_index, failure_message):
+    """Mark a shard, and so its whole crawl, as failed."""
+    CrawlShard.objects.filter(crawl=crawl, index=shard_index).update(
+        status=CrawlShard.Status.FAILED
+    )
+    crawl.fail(f"Shard {shard_index}: {failure_message}")
@@ -0,0 +1,143 @@
+import gzip
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from urllib import parse
+
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import make_aware
+
+import lxml.etree
+
+from crawler.linkcheck import build_opener
+from crawler.models import Page
+from crawler.parser import get_link_urls
+from crawler.url_index import canonicalize_url
+
+logger = logging.getLogger("crawler")
+
+
+# Stop following sitemap indexes after fetching this many sitemaps.
+MAX_SITEMAPS = 1000
+
+
+@dataclass
+class SitemapEntry:
+    url: str
+    lastmod: datetime = None
+    priority: float = None
+
+
+def parse_lastmod(value):
+    """Parse a sitemap lastmod value, which may be a date or a datetime."""
+    value = (value or "").strip()
+
+    try:
+        lastmod = parse_datetime(value)
+
+        if lastmod is None:
+            date = parse_date(value)
+            lastmod = date and datetime(date.year, date.month, date.day)
+    except ValueError:
+        return None
+
+    if lastmod and lastmod.tzinfo is None:
+        lastmod = make_aware(lastmod)
+
+    return lastmod
+
+
+def parse_priority(value):
+    """Parse a sitemap priority, which must be between 0 and 1."""
+    try:
+        priority = float(value)
+    except (TypeError, ValueError):
+        return None
+
+    return priority if 0 <= priority <= 1 else None
+
+
+def iter_sitemap(f):
+    """Parse a sitemap or sitemap index from a file-like object.
+
+    Yields (is_index, SitemapEntry) pairs for each <url> or <sitemap> element.
+    The file is parsed incrementally, so large sitemaps aren't held in memory.
+    """
+    for _, element in lxml.etree.iterparse(
+        f, events=("end",), resolve_entities=False, no_network=True
+    ):
+        tag = lxml.etree.QName(element).localname
+
+        if tag not in ("url", "sitemap"):
+            continue
+
+        values = {
+            lxml.etree.QName(child).localname: (child.text or "").strip()
+            for child in element
+            if isinstance(child.tag, str)
+        }
+
+        if values.get("loc"):
+            yield tag == "sitemap", SitemapEntry(
+                url=values["loc"],
+                lastmod=parse_lastmod(values.get("lastmod")),
+                priority=parse_priority(values.get("priority")),
+            )
+
+        # Free the memory used by elements that have been processed.
+        element.clear()
+
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def fetch_sitemap(sitemap_url, timeout=30):
+    """Fetch a sitemap, following any sitemap indexes, and yield its entries.
+
+    Sitemaps that can't be fetched or parsed are logged and skipped.
+    """
+    opener = build_opener()
+    queue = deque([sitemap_url])
+    seen = {sitemap_url}
+
+    while queue and len(seen) - len(queue) < MAX_SITEMAPS:
+        url = queue.popleft()
+        logger.info(f"Fetching sitemap {url}")
+
+        try:
+            with opener.open(url, timeout=timeout) as response:
+                f = (
+                    gzip.GzipFile(fileobj=response)
+                    if parse.urlsplit(url).path.endswith(".gz")
+                    else response
+                )
+
+                for is_index, entry in iter_sitemap(f):
+                    if not is_index:
+                        yield entry
+                    elif entry.url not in seen:
+                        seen.add(entry.url)
+                        queue.append(entry.url)
+        except (OSError, ValueError, lxml.etree.XMLSyntaxError) as e:
+            logger.warning(f"Failed to read sitemap {url}: {e}")
+
+
+def find_orphan_urls(crawl, sitemap_urls):
+    """Return sitemap URLs that weren't linked to by any page in a crawl.
+
+    Links are found in each page's saved HTML, like the crawler finds them,
+    rather than taken from its saved links, which leave out the site header
+    and footer.
+    """
+    linked_urls = {
+        canonicalize_url(url)
+        for page in Page._base_manager.filter(crawl=crawl)
+        .only("url", "html")
+        .iterator()
+        for url in get_link_urls(page.html, page.url)
+    }
+
+    return sorted(
+        url for url in sitemap_urls if canonicalize_url(url) not in linked_urls
+    )
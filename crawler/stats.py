@@ -0,0 +1,201 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Upper bounds, in seconds, of the buckets that stage timings are counted in.
+# Timings longer than the last bound are counted in an extra overflow bucket.
+HISTOGRAM_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30]
+
+# Stages of the crawl that are timed.
+STAGES = ["fetch", "parse_queue_wait", "parse", "queue_wait", "write"]
+
+# How often the stats file is updated during a crawl, in seconds.
+STATS_FILE_INTERVAL = 10
+
+
+class Histogram:
+    """Count timings in fixed buckets, keeping their total and count."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(HISTOGRAM_BUCKETS)
+
+        self.buckets[i] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "buckets": list(self.buckets)}
+
+
+class CrawlStats:
+    """Thread-safe timings and counters for one run of a crawl.
+
+    Each stage in STAGES has a histogram of how long it took. Counters track
+    totals like the number of pages saved and bytes downloaded.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.counters = {"pages": 0, "bytes_downloaded": 0}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.histograms[stage].observe(seconds)
+
+    def increment(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "seconds": self.clock() - self.started,
+                "counters": dict(self.counters),
+                "stages": {
+                    stage: histogram.to_dict()
+                    for stage, histogram in self.histograms.items()
+                },
+            }
+
+
+def merge_stats(a, b):
+    """Add together two stats dictionaries, as returned by CrawlStats.to_dict.
+
+    Either may be None. Runs of a crawl that are resumed, or run as several
+    shards, have their stats merged.
+    """
+    if not a or not b:
+        return a or b
+
+    counters = dict(a["counters"])
+
+    for name, value in b["counters"].items():
+        counters[name] = counters.get(name, 0) + value
+
+    stages = dict(a["stages"])
+
+    for stage, histogram in b["stages"].items():
+        if stage not in stages:
+            stages[stage] = histogram
+        else:
+            stages[stage] = {
+                "count": stages[stage]["count"] + histogram["count"],
+                "sum": stages[stage]["sum"] + histogram["sum"],
+                "buckets": [
+                    x + y
+                    for x, y in zip(stages[stage]["buckets"], histogram["buckets"])
+                ],
+            }
+
+    return {
+        "seconds": a["seconds"] + b["seconds"],
+        "counters": counters,
+        "stages": stages,
+    }
+
+
+def get_pages_per_second(stats):
+    if not stats or not stats["seconds"]:
+        return 0
+
+    return stats["counters"]["pages"] / stats["seconds"]
+
+
+def format_stats(stats):
+    """Summarize a stats dictionary in a single line."""
+    stages = ", ".join(
+        f"{stage} {histogram['sum']:.2f}s"
+        for stage, histogram in stats["stages"].items()
+    )
+
+    return (
+        f"{stats['counters']['pages']} pages in {stats['seconds']:.2f}s "
+        f"({get_pages_per_second(stats):.2f} pages/second), "
+        f"{stats['counters']['bytes_downloaded']} bytes downloaded, {stages}"
+    )
+
+
+def format_prometheus(stats, crawl_id):
+    """Format a stats dictionary in the Prometheus text exposition format."""
+    lines = [
+        "# HELP crawler_stage_seconds Time spent in each stage of the crawl.",
+        "# TYPE crawler_stage_seconds histogram",
+    ]
+
+    for stage, histogram in stats["stages"].items():
+        labels = f'crawl="{crawl_id}",stage="{stage}"'
+        cumulative = 0
+
+        for bound, count in zip(
+            [*map(str, HISTOGRAM_BUCKETS), "+Inf"], histogram["buckets"]
+        ):
+            cumulative += count
+            lines.append(
+                f'crawler_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+            )
+
+        lines.append(f"crawler_stage_seconds_sum{{{labels}}} {histogram['sum']}")
+        lines.append(f"crawler_stage_seconds_count{{{labels}}} {histogram['count']}")
+
+    for name, value in stats["counters"].items():
+        lines.append(f"# TYPE crawler_{name}_total counter")
+        lines.append(f'crawler_{name}_total{{crawl="{crawl_id}"}} {value}')
+
+    lines.append("# TYPE crawler_pages_per_second gauge")
+    lines.append(
+        f'crawler_pages_per_second{{crawl="{crawl_id}"}} '
+        f"{get_pages_per_second(stats)}"
+    )
+
+    return "\n".join(lines) + "\n"
+
+
+def write_stats_file(path, stats, crawl_id):
+    """Write stats to a file, replacing it atomically.
+
+    Files ending in .prom are written in the Prometheus text format, for use
+    with the node exporter's textfile collector. Other files are written as
+    JSON.
+    """
+    path = Path(path)
+
+    if path.suffix == ".prom":
+        content = format_prometheus(stats, crawl_id)
+    else:
+        content = json.dumps({"crawl": crawl_id, **stats}, indent=4)
+
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,268 @@
+import json
+import os.path
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+import click
+
+from crawler.benchmarks.crawl import get_database_size_kb
+from crawler.benchmarks.parser import (
+    compare_results,
+    generate_page,
+    get_benchmark_pages,
+    run_benchmarks,
+)
+from crawler.models import Crawl
+from crawler.parser import _parse_html
+
+
+class GeneratePageTests(SimpleTestCase):
+    def test_size(self):
+        html = generate_page(size=50 * 1024)
+        self.assertGreaterEqual(len(html), 50 * 1024)
+        self.assertLess(len(html), 51 * 1024)
+
+    def test_deterministic(self):
+        self.assertEqual(generate_page(seed=1), generate_page(seed=1))
+        self.assertNotEqual(generate_page(seed=1), generate_page(seed=2))
+
+    def test_depth_and_links(self):
+        parsed_html = _parse_html(generate_page(depth=100, links=500), "localhost")
+        self.assertEqual(parsed_html.title, "Generated page")
+        self.assertEqual(len(parsed_html.links), 500)
+        self.assertIn("m-nested", parsed_html.components)
+        self.assertNotIn("/header/", parsed_html.links)
+
+    def test_get_benchmark_pages(self):
+        names = [name for name, html in get_benchmark_pages(sizes=[1024])]
+        self.assertEqual(
+            names,
+            [
+                "sample/child/index.html",
+                "sample/index.html",
+                "generated/1kb",
+                "generated/depth-250",
+                "generated/links-5000",
+            ],
+        )
+
+
+class RunBenchmarksTests(SimpleTestCase):
+    def test_run_benchmarks(self):
+        results = run_benchmarks([("small", generate_page(size=1024))], iterations=3)
+
+        self.assertEqual(results["iterations"], 3)
+        self.assertCountEqual(
+            results["results"].keys(), ["in_process", "multiprocessing"]
+        )
+
+        for parser_results in results["results"].values():
+            result = parser_results["small"]
+            self.assertEqual(result["pages"], 3)
+            self.assertGreater(result["pages_per_second"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertGreaterEqual(result["rss_growth_kb"], 0)
+
+    def test_memory_is_measured_separately_for_each_page(self):
+        results = run_benchmarks(
+            [
+                ("large", generate_page(size=5 * 1024 * 1024)),
+                ("small", generate_page(size=1024)),
+            ],
+            iterations=1,
+            multiprocessing=False,
+        )["results"]["in_process"]
+
+        self.assertLess(
+            results["small"]["rss_growth_kb"], results["large"]["rss_growth_kb"]
+        )
+
+    def test_run_benchmarks_no_multiprocessing(self):
+        results = run_benchmarks(
+            [("small", generate_page(size=1024))], iterations=1, multiprocessing=False
+        )
+        self.assertEqual(list(results["results"].keys()), ["in_process"])
+
+
+class CompareResultsTests(SimpleTestCase):
+    def make_results(self, pages_per_second, p99_ms):
+        return {
+            "results": {
+                "in_process": {
+                    "page": {"pages_per_second": pages_per_second, "p99_ms": p99_ms}
+                }
+            }
+        }
+
+    def test_no_regressions(self):
+        self.assertEqual(
+            compare_results(self.make_results(90, 11), self.make_results(100, 10)),
+            [],
+        )
+
+    def test_regressions(self):
+        self.assertEqual(
+            compare_results(self.make_results(50, 20), self.make_results(100, 10)),
+            [
+                "in_process page: 50 pages/sec, baseline 100",
+                "in_process page: p99 20 ms, baseline 10",
+            ],
+        )
+
+    def test_missing_baseline(self):
+        self.assertEqual(
+            compare_results(self.make_results(50, 20), {"results": {}}),
+            [],
+        )
+
+
+@patch(
+    "crawler.management.commands.benchmark_parser.get_benchmark_pages",
+    return_value=[("small", generate_page(size=1024))],
+)
+class BenchmarkParserCommandTests(SimpleTestCase):
+    def test_output_and_baseline(self, _):
+        with tempfile.TemporaryDirectory() as tempdir:
+            output = os.path.join(tempdir, "results.json")
+
+            call_command("benchmark_parser", "--iterations=1", f"--output={output}")
+
+            with open(output) as f:
+                results = json.load(f)
+
+            self.assertIn("small", results["results"]["multiprocessing"])
+
+            # Comparing against a generous baseline finds no regressions.
+            call_command(
+                "benchmark_parser",
+                "--iterations=1",
+                "--no-multiprocessing",
+                f"--baseline={output}",
+                "--tolerance=1000",
+            )
+
+    def test_regression(self, _):
+        with tempfile.TemporaryDirectory() as tempdir:
+            baseline = os.path.join(tempdir, "baseline.json")
+
+            with open(baseline, "w") as f:
+                json.dump(
+                    {
+                        "results": {
+                            "in_process": {
+                                "small": {"pages_per_second": 1e12, "p99_ms": 0}
+                            }
+                        }
+                    },
+                    f,
+                )
+
+            with self.assertRaises(click.ClickException):
+                call_command(
+                    "benchmark_parser",
+                    "--iterations=1",
+                    "--no-multiprocessing",
+                    f"--baseline={baseline}",
+                )
+
+
+class GetDatabaseSizeTests(TestCase):
+    def patch_cursor(self, vendor, size=None):
+        cursor = MagicMock()
+        cursor.__enter__.return_value.fetchone.return_value = (size,)
+
+        patch_vendor = patch.object(connection, "vendor", vendor)
+        patch_vendor.start()
+        self.addCleanup(patch_vendor.stop)
+
+        patch_cursor = patch.object(connection, "cursor", return_value=cursor)
+        patch_cursor.start()
+        self.addCleanup(patch_cursor.stop)
+
+        return cursor.__enter__.return_value
+
+    def test_sqlite(self):
+        self.assertGreater(get_database_size_kb(), 0)
+
+    def test_postgresql(self):
+        cursor = self.patch_cursor("postgresql", size=2048 * 1024)
+        self.assertEqual(get_database_size_kb(), 2048)
+        cursor.execute.assert_called_once_with(
+            "SELECT pg_database_size(current_database())"
+        )
+
+    def test_other_database(self):
+        cursor = self.patch_cursor("mysql")
+        self.assertIsNone(get_database_size_kb())
+        cursor.execute.assert_not_called()
+
+
+class BenchmarkCrawlCommandTests(TransactionTestCase):
+    def test_output_and_baseline(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            output = os.path.join(tempdir, "results.json")
+
+            call_command("benchmark_crawl", f"--output={output}")
+
+            with open(output) as f:
+                result = json.load(f)
+
+            self.assertEqual(result["status"], Crawl.Status.FINISHED)
+            self.assertEqual(result["pages"], 2)
+            self.assertEqual(result["errors"], 0)
+            self.assertGreater(result["pages_per_second"], 0)
+            self.assertGreater(result["peak_rss_kb"], 0)
+
+            # The benchmark crawl is deleted afterwards.
+            self.assertFalse(Crawl.objects.exists())
+
+            # Comparing against a generous baseline finds no regressions.
+            call_command(
+                "benchmark_crawl",
+                "--keep-crawl",
+                f"--baseline={output}",
+                "--tolerance=1000",
+            )
+
+            # The crawl's stats are saved once it ends.
+            crawl = Crawl.objects.get()
+            self.assertEqual(crawl.stats["counters"]["pages"], 2)
+            self.assertEqual(crawl.stats["stages"]["fetch"]["count"], 2)
+            self.assertGreater(crawl.stats["stages"]["write"]["count"], 0)
+
+    def test_synthetic_site(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            output = os.path.join(tempdir, "results.json")
+
+            call_command(
+                "benchmark_crawl",
+                "--synthetic-pages=50",
+                "--fan-out=5",
+                f"--output={output}",
+            )
+
+            with open(output) as f:
+                result = json.load(f)
+
+            self.assertEqual(result["status"], Crawl.Status.FINISHED)
+
+            # Every page is found, along with the 10 pages listing them.
+            self.assertEqual(result["pages"], 60)
+            self.assertGreater(result["errors"], 0)
+
+    def test_regression(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            baseline = os.path.join(tempdir, "baseline.json")
+
+            with open(baseline, "w") as f:
+                json.dump(
+                    {"pages_per_second": 1e12, "db_write_seconds": 0, "peak_rss_kb": 0},
+                    f,
+                )
+
+            with self.assertRaises(click.ClickException):
+                call_command("benchmark_crawl", f"--baseline={baseline}")
@@ -0,0 +1,110 @@
+import itertools
+import tempfile
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from crawler.cache import SQLiteCache
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.cache = self.make_cache()
+
+        # Give every access a distinct time, so that eviction is predictable.
+        patcher = patch("crawler.cache.time.time", side_effect=itertools.count(1000))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_cache(self, **options):
+        cache = SQLiteCache(self.tempdir.name, {"TIMEOUT": None, "OPTIONS": options})
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_get_and_set(self):
+        self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(self.cache.get("key", "default"), "default")
+
+        self.cache.set("key", {"title": "Title", "links": ["/a/"]})
+        self.assertEqual(self.cache.get("key"), {"title": "Title", "links": ["/a/"]})
+        self.assertTrue(self.cache.has_key("key"))
+
+        self.cache.set("key", "replaced")
+        self.assertEqual(self.cache.get("key"), "replaced")
+
+    def test_values_are_shared_between_instances(self):
+        self.cache.set("key", "value")
+        self.assertEqual(self.make_cache().get("key"), "value")
+
+    def test_timeout(self):
+        self.cache.set("key", "value", timeout=0)
+        self.assertIsNone(self.cache.get("key"))
+        self.assertFalse(self.cache.touch("key"))
+
+        self.cache.set("key", "value", timeout=60)
+        self.assertEqual(self.cache.get("key"), "value")
+
+    def test_add(self):
+        self.assertTrue(self.cache.add("key", "value"))
+        self.assertFalse(self.cache.add("key", "other"))
+        self.assertEqual(self.cache.get("key"), "value")
+
+        self.cache.set("expired", "value", timeout=0)
+        self.assertTrue(self.cache.add("expired", "other"))
+        self.assertEqual(self.cache.get("expired"), "other")
+
+    def test_touch(self):
+        self.assertFalse(self.cache.touch("key"))
+
+        self.cache.set("key", "value")
+        self.assertTrue(self.cache.touch("key", timeout=0))
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_delete_and_clear(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+
+        self.assertTrue(self.cache.delete("a"))
+        self.assertFalse(self.cache.delete("a"))
+        self.assertEqual(self.cache.get_many(["a", "b"]), {"b": 2})
+
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("b"))
+
+    def test_evicts_least_recently_used(self):
+        cache = self.make_cache(MAX_ENTRIES=4, CULL_FREQUENCY=4)
+
+        for key in "abcd":
+            cache.set(key, key)
+
+        cache.get("a")
+        cache.set("e", "e")
+
+        self.assertEqual(cache.get_many(list("abcde")), {"a": "a", "d": "d", "e": "e"})
+
+    def test_entries_are_counted_periodically(self):
+        cache = self.make_cache(MAX_ENTRIES=4, CULL_FREQUENCY=2)
+
+        for key in "abcde":
+            cache.set(key, key)
+
+        self.assertEqual(len(cache.get_many(list("abcde"))), 5)
+
+        cache.set("f", "f")
+        self.assertEqual(cache.get_many(list("abcdef")), {"e": "e", "f": "f"})
+
+    def test_cull_frequency_zero_clears_cache(self):
+        cache = self.make_cache(MAX_ENTRIES=2, CULL_FREQUENCY=0)
+
+        for key in "abcd":
+            cache.set(key, key)
+
+        self.assertEqual(cache.get_many(list("abcd")), {})
+
+    def test_close(self):
+        self.cache.set("key", "value")
+        self.cache.close()
+        self.cache.close()
+        self.assertEqual(self.cache.get("key"), "value")
@@ -1,13 +1,21 @@
+import json
+import tempfile
 from unittest.mock import patch
 
 from django.core.management import call_command
-from django.test import TestCase
+from django.db import connection
+from django.db.models import TextField, Value
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
 
+import click
 import pytest
 from click.testing import CliRunner
 
+from crawler.compression import clear_dictionary_cache, decompress, get_dictionary_id
+from crawler.management.commands.compress_pages import command as compress_pages
 from crawler.management.commands.manage_crawls import cli
-from crawler.models import Crawl
+from crawler.models import CompressionDictionary, Crawl, Page
 
 
 class MockCrawlFailure(Exception):
@@ -34,6 +42,209 @@ class CrawlCommandTests(TestCase):
         self.assertEqual(crawl.status, Crawl.Status.FINISHED)
         self.assertIsNone(crawl.failure_message)
 
+    def test_crawl_command_parser_backend(self):
+        with self.patch_wpull(return_value=0):
+            call_command(
+                "crawl", "http://localhost:8000", "--parser-backend=libxml2-recover"
+            )
+
+        crawl = self.get_crawl()
+        self.assertEqual(crawl.config["parser_backend"], "libxml2-recover")
+
+    def test_crawl_command_bloom_filter_capacity(self):
+        with self.patch_wpull(return_value=0):
+            call_command(
+                "crawl", "http://localhost:8000", "--bloom-filter-capacity=100000"
+            )
+
+        crawl = self.get_crawl()
+        self.assertEqual(crawl.config["bloom_filter_capacity"], 100000)
+
+    def test_crawl_command_concurrency(self):
+        with self.patch_wpull(return_value=0):
+            call_command("crawl", "http://localhost:8000", "--concurrency=4")
+
+        crawl = self.get_crawl()
+        self.assertEqual(crawl.config["concurrency"], 4)
+
+    def test_crawl_command_rates(self):
+        with self.patch_wpull(return_value=0):
+            call_command(
+                "crawl", "http://localhost:8000", "--min-rate=1", "--max-rate=2"
+            )
+
+        crawl = self.get_crawl()
+        self.assertEqual(crawl.config["min_rate"], 1)
+        self.assertEqual(crawl.config["max_rate"], 2)
+
+    def test_crawl_command_incremental(self):
+        with self.patch_wpull(return_value=0):
+            call_command("crawl", "http://localhost:8000", "--incremental")
+
+        crawl = self.get_crawl()
+        self.assertTrue(crawl.config["incremental"])
+
+    def test_crawl_command_link_check_options(self):
+        with self.patch_wpull(return_value=0):
+            call_command(
+                "crawl",
+                "http://localhost:8000",
+                "--link-check-ttl=60",
+                "--link-check-workers=8",
+            )
+
+        crawl = self.get_crawl()
+        self.assertEqual(crawl.config["link_check_ttl"], 60)
+        self.assertEqual(crawl.config["link_check_workers"], 8)
+
+    def test_crawl_command_sitemap_url(self):
+        with self.patch_wpull(return_value=0):
+            call_command(
+                "crawl",
+                "http://localhost:8000",
+                "--sitemap-url=http://localhost:8000/sitemap.xml",
+            )
+
+        crawl = self.get_crawl()
+        self.assertEqual(
+            crawl.config["sitemap_url"], "http://localhost:8000/sitemap.xml"
+        )
+
+    def test_crawl_command_max_page_size(self):
+        with self.patch_wpull(return_value=0):
+            call_command("crawl", "http://localhost:8000", "--max-page-size=1000000")
+
+        crawl = self.get_crawl()
+        self.assertEqual(crawl.config["max_page_size"], 1000000)
+
+    def test_crawl_command_pipeline_queue_size(self):
+        with self.patch_wpull(return_value=0):
+            call_command("crawl", "http://localhost:8000", "--pipeline-queue-size=50")
+
+        crawl = self.get_crawl()
+        self.assertEqual(crawl.config["pipeline_queue_size"], 50)
+
+    def test_crawl_command_stats_file(self):
+        with self.patch_wpull(return_value=0):
+            call_command(
+                "crawl", "http://localhost:8000", "--stats-file=/tmp/crawl.prom"
+            )
+
+        crawl = self.get_crawl()
+        self.assertEqual(crawl.config["stats_file"], "/tmp/crawl.prom")
+
+    def test_crawl_command_prioritize(self):
+        with self.patch_wpull(return_value=0):
+            call_command("crawl", "http://localhost:8000", "--prioritize")
+
+        crawl = self.get_crawl()
+        self.assertTrue(crawl.config["prioritize"])
+
+    def test_crawl_command_url_rules(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump([{"action": "skip", "prefix": "/search/"}], f)
+            f.flush()
+
+            with self.patch_wpull(return_value=0):
+                call_command("crawl", "http://localhost:8000", f"--url-rules={f.name}")
+
+        crawl = self.get_crawl()
+        self.assertEqual(
+            crawl.config["url_rules"], [{"action": "skip", "prefix": "/search/"}]
+        )
+
+    def test_crawl_command_invalid_url_rules(self):
+        for rules in [
+            "not json",
+            "{}",
+            '[{"action": "skip"}]',
+            '[{"url": "/"}]',
+            r'[{"action": "skip", "pattern": "(b)\\1"}]',
+        ]:
+            with self.subTest(rules=rules):
+                with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+                    f.write(rules)
+                    f.flush()
+
+                    with self.assertRaises(click.BadParameter):
+                        call_command(
+                            "crawl", "http://localhost:8000", f"--url-rules={f.name}"
+                        )
+
+    @patch("crawler.wpull.crawler.WpullCrawler.crawl_shards")
+    def test_crawl_command_shards(self, crawl_shards):
+        call_command(
+            "crawl", "http://localhost:8000", "--shards=4", "--shard=0", "--shard=2"
+        )
+
+        crawl = self.get_crawl()
+        self.assertEqual(crawl.config["shards"], 4)
+        self.assertEqual(crawl.shards.count(), 4)
+        crawl_shards.assert_called_once_with(crawl, (0, 2))
+
+    @patch("crawler.wpull.crawler.WpullCrawler.crawl_shards")
+    def test_crawl_command_join(self, crawl_shards):
+        crawl = Crawl.objects.create(config={"shards": 2})
+
+        call_command("crawl", f"--join={crawl.pk}", "--shard=1")
+        crawl_shards.assert_called_once_with(crawl, (1,))
+
+    def test_crawl_command_invalid_shards(self):
+        crawl = Crawl.objects.create(config={"shards": 2})
+        unsharded_crawl = Crawl.objects.create(config={})
+
+        for args in [
+            ["http://localhost:8000", "--shards=0"],
+            ["http://localhost:8000", "--shards=2", "--shard=2"],
+            [f"--join={unsharded_crawl.pk}", "--shard=0"],
+            [f"--join={crawl.pk}"],
+            [f"--resume={crawl.pk}"],
+        ]:
+            with self.subTest(args=args):
+                with self.assertRaises(click.UsageError):
+                    call_command("crawl", *args)
+
+    def test_crawl_command_resume(self):
+        crawl = Crawl.objects.create(
+            config={"start_url": "http://localhost:8000"},
+            status=Crawl.Status.FAILED,
+            failure_message="Interrupted",
+        )
+
+        with self.patch_wpull(return_value=0):
+            call_command("crawl", f"--resume={crawl.pk}")
+
+        crawl = self.get_crawl()
+        self.assertEqual(crawl.status, Crawl.Status.FINISHED)
+        self.assertIsNone(crawl.failure_message)
+
+        # Options added since the crawl started get their defaults.
+        self.assertEqual(crawl.config["depth"], 0)
+        self.assertEqual(crawl.config["concurrency"], 1)
+
+    def test_crawl_command_resume_finished(self):
+        crawl = Crawl.objects.create(config={}, status=Crawl.Status.FINISHED)
+
+        with self.assertRaises(click.BadParameter):
+            call_command("crawl", f"--resume={crawl.pk}")
+
+    def test_crawl_command_missing_start_url(self):
+        with self.assertRaises(click.UsageError):
+            call_command("crawl")
+
+    def test_crawl_command_invalid_max_page_size(self):
+        with self.assertRaises(click.UsageError):
+            call_command("crawl", "http://localhost:8000", "--max-page-size=-1")
+
+        with self.assertRaises(click.UsageError):
+            call_command("crawl", "http://localhost:8000", "--pipeline-queue-size=-1")
+
+    def test_crawl_command_invalid_rates(self):
+        with self.assertRaises(click.UsageError):
+            call_command(
+                "crawl", "http://localhost:8000", "--min-rate=2", "--max-rate=1"
+            )
+
     def test_crawl_command_exception(self):
         with self.patch_wpull(side_effect=MockCrawlFailure()):
             with self.assertRaises(MockCrawlFailure):
@@ -71,6 +282,22 @@ class ManageCrawlsCommandTests(TestCase):
         stdout = self.invoke("list")
         self.assertEqual(stdout, f"{c2}\n{c1}\n")
 
+    def test_list_stats(self):
+        crawl = Crawl.objects.create(
+            config={},
+            stats={
+                "seconds": 2.0,
+                "counters": {"pages": 4, "bytes_downloaded": 1000},
+                "stages": {"fetch": {"count": 4, "sum": 1.5, "buckets": [4]}},
+            },
+        )
+        stdout = self.invoke("list")
+        self.assertEqual(
+            stdout,
+            f"{crawl}\n  4 pages in 2.00s (2.00 pages/second), "
+            "1000 bytes downloaded, fetch 1.50s\n",
+        )
+
     def test_delete(self):
         c1 = Crawl.objects.create(config={"foo": "bar"})
         c2 = Crawl.objects.create(config={"bar": "baz"})
@@ -137,3 +364,121 @@ class ManageCrawlsCommandTests(TestCase):
             f"Deleting 4 crawls\n{c5}\n{c3}\n{c2}\n{c1}\nDry run, skipping deletion\n",
         )
         self.assertEqual(Crawl.objects.count(), 6)
+
+
+class CompressPagesCommandTests(TestCase):
+    def setUp(self):
+        clear_dictionary_cache()
+        self.addCleanup(clear_dictionary_cache)
+
+        self.crawl = Crawl.objects.create(config={}, status=Crawl.Status.FINISHED)
+        self.other_crawl = Crawl.objects.create(config={})
+
+        for crawl in [self.crawl, self.other_crawl]:
+            for i in range(3):
+                Page.objects.create(
+                    crawl=crawl,
+                    timestamp=timezone.now(),
+                    url=f"/{i}/",
+                    title=f"Page {i}",
+                    html=self.get_html(i),
+                    text=f"Page {i}",
+                )
+
+        Page.objects.create(
+            crawl=self.crawl,
+            timestamp=timezone.now(),
+            url="/skipped/",
+            title="",
+            html="",
+            text="",
+        )
+
+        # Store pages as plain text, as they were before being compressed.
+        Page._base_manager.update(
+            html=Value("", output_field=TextField()),
+            text=Value("", output_field=TextField()),
+        )
+
+        for page in Page._base_manager.exclude(url="/skipped/"):
+            Page._base_manager.filter(pk=page.pk).update(
+                html=Value(self.get_html(page.url[1]), output_field=TextField()),
+                text=Value(page.title, output_field=TextField()),
+            )
+
+        # Pages may have HTML but no text.
+        Page._base_manager.filter(url="/0/").update(
+            text=Value("", output_field=TextField())
+        )
+
+    def get_html(self, i):
+        return (
+            "<html>\n<head>\n<title>Page %s</title>\n</head>\n<body>\n"
+            '<header class="o-header">Header</header>\n'
+            "<footer>Footer</footer>\n</body>\n</html>\n"
+        ) % i
+
+    def invoke(self, *args):
+        result = CliRunner().invoke(compress_pages, args)
+        self.assertEqual(result.exit_code, 0, result.output)
+        return result.output
+
+    def get_raw_values(self, crawl):
+        return list(
+            Page._base_manager.filter(crawl=crawl)
+            .exclude(url="/skipped/")
+            .values_list("html", "text")
+        )
+
+    def test_compress_pages(self):
+        stdout = self.invoke("--batch-size=2", f"--crawl={self.crawl.pk}")
+        dictionary = CompressionDictionary.objects.get()
+
+        self.assertIn(
+            f"Trained a {len(dictionary.data)} byte dictionary on 4 pages\n", stdout
+        )
+        self.assertIn("Compressed 2 pages\n", stdout)
+        self.assertRegex(stdout, r"Compressed 3 pages from \d+ to \d+ bytes, saving")
+
+        for html, _ in self.get_raw_values(self.crawl):
+            self.assertIsInstance(html, bytes)
+            self.assertEqual(get_dictionary_id(html), dictionary.pk)
+            self.assertTrue(decompress(html).startswith("<html>"))
+
+        # Other crawls aren't compressed.
+        for html, _ in self.get_raw_values(self.other_crawl):
+            self.assertIsInstance(html, str)
+
+        # Pages are still searchable.
+        self.assertEqual(Page.objects.filter(html__contains="Page 1").get().url, "/1/")
+
+        # Running again has nothing left to compress.
+        stdout = self.invoke()
+        self.assertNotIn("Trained", stdout)
+        self.assertIn("Compressed 3 pages", stdout)
+        self.assertEqual(
+            self.invoke(), "Compressed 0 pages from 0 to 0 bytes, saving 0 bytes\n"
+        )
+
+    def test_train(self):
+        CompressionDictionary.objects.create(data=b"<html>")
+        self.invoke("--train", "--sample-size=1")
+
+        # Dictionaries can't be trained on a single page.
+        self.assertEqual(CompressionDictionary.objects.count(), 1)
+
+        self.invoke("--train")
+        self.assertEqual(CompressionDictionary.objects.count(), 2)
+
+    def test_other_databases(self):
+        with patch.object(connection, "vendor", "postgresql"):
+            result = CliRunner().invoke(compress_pages, [])
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("only be compressed in SQLite", result.output)
+
+
+class CompressPagesVacuumTests(TransactionTestCase):
+    def test_vacuum(self):
+        result = CliRunner().invoke(compress_pages, ["--vacuum"])
+        self.assertEqual(result.exit_code, 0, result.output)
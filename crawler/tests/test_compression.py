@@ -0,0 +1,221 @@
+from unittest.mock import Mock, patch
+
+from django.db import connection
+from django.db.models import TextField, Value
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from crawler.compression import (
+    CompressedTextAttribute,
+    clear_dictionary_cache,
+    compress,
+    decompress,
+    get_current_dictionary,
+    get_dictionary,
+    get_dictionary_id,
+    register_sqlite_functions,
+    train_dictionary,
+)
+from crawler.models import CompressionDictionary, Crawl, Page
+from crawler.writer import DatabaseWriter, UnchangedPage
+
+TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head><title>{title}</title></head>
+<body>
+<header class="o-header">Consumer Financial Protection Bureau</header>
+<p>{body}</p>
+<footer class="o-footer">An official website of the United States government</footer>
+</body>
+</html>
+"""
+
+
+class CompressTests(SimpleTestCase):
+    def test_round_trip(self):
+        text = "Hé" * 1000
+        compressed = compress(text)
+
+        self.assertIsInstance(compressed, bytes)
+        self.assertLess(len(compressed), len(text))
+        self.assertEqual(get_dictionary_id(compressed), 0)
+        self.assertEqual(decompress(compressed), text)
+        self.assertEqual(decompress(memoryview(compressed)), text)
+
+    def test_round_trip_with_dictionary(self):
+        dictionary = TEMPLATE.format(title="", body="").encode("utf-8")
+        text = TEMPLATE.format(title="Test", body="Test")
+        compressed = compress(text, 5, dictionary)
+
+        self.assertLess(len(compressed), len(compress(text)))
+        self.assertEqual(get_dictionary_id(compressed), 5)
+        self.assertEqual(decompress(compressed, dictionary), text)
+
+    def test_decompress_uncompressed(self):
+        self.assertEqual(decompress("plain text"), "plain text")
+        self.assertIsNone(decompress(None))
+
+
+class TrainDictionaryTests(SimpleTestCase):
+    def test_train_dictionary(self):
+        samples = [TEMPLATE.format(title=i, body=i) for i in range(10)]
+        samples.append("<html>\n<body>Unique</body>\n</html>\n")
+
+        dictionary = train_dictionary(samples)
+
+        # Lines from the template are included, but not lines unique to a
+        # page. Lines in every page come last.
+        self.assertIn(b'<header class="o-header">', dictionary)
+        self.assertNotIn(b"<title>1</title>", dictionary)
+        self.assertNotIn(b"Unique", dictionary)
+        self.assertTrue(dictionary.endswith(b"</html>\n"))
+
+    def test_size(self):
+        samples = [TEMPLATE.format(title=i, body=i) for i in range(10)]
+        self.assertEqual(len(train_dictionary(samples, size=100)), 100)
+
+    def test_nothing_in_common(self):
+        self.assertIsNone(train_dictionary(["a", "b"]))
+        self.assertIsNone(train_dictionary([]))
+
+
+class RegisterSQLiteFunctionsTests(SimpleTestCase):
+    def test_other_databases(self):
+        other_connection = Mock(vendor="postgresql")
+        register_sqlite_functions(None, other_connection)
+        other_connection.connection.create_function.assert_not_called()
+
+
+class CompressedTextFieldTests(TestCase):
+    def setUp(self):
+        clear_dictionary_cache()
+        self.addCleanup(clear_dictionary_cache)
+
+        self.crawl = Crawl.objects.create(config={}, status=Crawl.Status.FINISHED)
+        self.html = TEMPLATE.format(title="Test page", body="Some text")
+
+    def make_page(self, url="/", **kwargs):
+        return Page.objects.create(
+            crawl=self.crawl,
+            timestamp=timezone.now(),
+            url=url,
+            title="Test page",
+            **{"html": self.html, "text": "Some text", **kwargs},
+        )
+
+    def get_raw_values(self, field_name="html"):
+        return list(
+            Page._base_manager.order_by("pk").values_list(field_name, flat=True)
+        )
+
+    def test_save(self):
+        self.make_page()
+
+        [html] = self.get_raw_values()
+        self.assertIsInstance(html, bytes)
+        self.assertEqual(decompress(html), self.html)
+
+    def test_save_empty(self):
+        self.make_page(html="", text="")
+        self.assertEqual(self.get_raw_values(), [""])
+
+    def test_save_with_dictionary(self):
+        dictionary = CompressionDictionary.objects.create(
+            data=TEMPLATE.format(title="", body="").encode("utf-8")
+        )
+        self.assertEqual(
+            str(dictionary),
+            f"Compression dictionary {dictionary.pk} ({len(dictionary.data)} bytes)",
+        )
+        self.assertEqual(get_current_dictionary()[0], dictionary.pk)
+
+        self.make_page()
+        clear_dictionary_cache()
+
+        [html] = self.get_raw_values()
+        self.assertEqual(get_dictionary_id(html), dictionary.pk)
+        self.assertEqual(Page.objects.get().html, self.html)
+        self.assertEqual(get_dictionary(dictionary.pk), bytes(dictionary.data))
+
+    def test_no_dictionary(self):
+        self.assertEqual(get_current_dictionary(), (0, None))
+        self.assertIsNone(get_dictionary(0))
+
+    def test_lazy_decompression(self):
+        self.make_page()
+
+        page = Page.objects.get()
+        self.assertIsInstance(page.__dict__["html"], bytes)
+        self.assertEqual(page.html, self.html)
+        self.assertEqual(page.__dict__["html"], self.html)
+
+        # Deferred values are loaded and decompressed when accessed.
+        self.assertEqual(Page.objects.defer("text").get().text, "Some text")
+        self.assertIsInstance(Page.html, CompressedTextAttribute)
+
+    def test_pre_save_deferred(self):
+        self.make_page()
+
+        field = Page._meta.get_field("html")
+        page = Page.objects.defer("html").get()
+        self.assertEqual(field.pre_save(page, add=False), self.html)
+
+    def test_copy_keeps_compressed_values(self):
+        page = self.make_page()
+        [html] = self.get_raw_values()
+
+        crawl = Crawl.objects.create(config={}, status=Crawl.Status.FINISHED)
+        writer = DatabaseWriter(crawl)
+        writer.write(UnchangedPage(page.pk, timezone.now()))
+        writer.flush()
+
+        self.assertEqual(self.get_raw_values(), [html, html])
+
+    def test_lookups(self):
+        self.make_page("/compressed/")
+        self.make_page("/plain/")
+
+        # Pages saved before compression was added are stored as plain text.
+        Page.objects.filter(url="/plain/").update(
+            html=Value(self.html, output_field=TextField()),
+            text=Value("Other text", output_field=TextField()),
+        )
+
+        for lookups, expected in [
+            ({"html__icontains": "TEST PAGE"}, ["/compressed/", "/plain/"]),
+            ({"html__contains": "Test page"}, ["/compressed/", "/plain/"]),
+            ({"html__contains": "Missing"}, []),
+            ({"text": "Some text"}, ["/compressed/"]),
+            ({"text__iexact": "other TEXT"}, ["/plain/"]),
+            ({"text__startswith": "Some"}, ["/compressed/"]),
+            ({"text__iendswith": "TEXT"}, ["/compressed/", "/plain/"]),
+        ]:
+            with self.subTest(lookups=lookups):
+                self.assertEqual(
+                    list(Page.objects.filter(**lookups).values_list("url", flat=True)),
+                    expected,
+                )
+
+    def test_lookups_other_databases(self):
+        query = Page.objects.filter(html__icontains="test").query
+
+        with patch.object(connection, "vendor", "postgresql"):
+            sql, _ = query.get_compiler(connection=connection).as_sql()
+
+        self.assertNotIn("crawler_decompress", sql)
+
+    def test_other_databases(self):
+        field = Page._meta.get_field("html")
+
+        with patch.object(connection, "vendor", "postgresql"):
+            self.assertEqual(field.get_db_prep_save("text", connection), "text")
+
+    def test_to_python(self):
+        field = Page._meta.get_field("html")
+        self.assertEqual(field.to_python(compress("text")), "text")
+        self.assertEqual(field.to_python("text"), "text")
+
+    def test_dumpdata_value(self):
+        self.make_page()
+        field = Page._meta.get_field("html")
+        self.assertEqual(field.value_to_string(Page.objects.get()), self.html)
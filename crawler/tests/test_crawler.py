@@ -0,0 +1,245 @@
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest.mock import call, patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import pytest
+from wpull.database.base import AddURLInfo
+from wpull.database.sqltable import SQLiteURLTable
+from wpull.pipeline.item import Status, URLProperties
+
+from crawler.models import Crawl, CrawlConfig, CrawlShard, Error, Page, Redirect
+from crawler.sitemap import SitemapEntry
+from crawler.wpull.crawler import (
+    WpullCrawler,
+    get_checkpoint_path,
+    reset_unsaved_urls,
+)
+
+
+def add_urls(url_table, urls, level=0, parent_url="https://example.com/"):
+    url_properties = URLProperties()
+    url_properties.parent_url = parent_url
+    url_properties.root_url = "https://example.com/"
+    url_properties.level = level
+    return url_table.add_many(AddURLInfo(url, url_properties, None) for url in urls)
+
+
+@pytest.mark.filterwarnings("ignore::sqlalchemy.exc.MovedIn20Warning")
+class ResetUnsavedURLsTests(TestCase):
+    def setUp(self):
+        checkpoint_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(checkpoint_dir.cleanup)
+        settings_override = override_settings(
+            CRAWL_CHECKPOINT_DIR=Path(checkpoint_dir.name)
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.crawl = Crawl.objects.create(config={"start_url": "https://example.com/"})
+
+    def test_no_checkpoint(self):
+        self.assertEqual(reset_unsaved_urls(self.crawl), 0)
+
+    def test_reset_unsaved_urls(self):
+        now = timezone.now()
+        Page.objects.create(
+            crawl=self.crawl,
+            timestamp=now,
+            url="https://example.com/page/",
+            title="test",
+            html="test",
+            text="test",
+        )
+        Error.objects.create(
+            crawl=self.crawl,
+            timestamp=now,
+            url="https://example.com/error/",
+            status_code=404,
+        )
+        Redirect.objects.create(
+            crawl=self.crawl,
+            timestamp=now,
+            url="https://example.com/redirect/",
+            status_code=301,
+            location="https://example.com/page/",
+        )
+
+        # Results saved by another crawl don't count.
+        other_crawl = Crawl.objects.create(config={})
+        Page.objects.create(
+            crawl=other_crawl,
+            timestamp=now,
+            url="https://example.com/other/",
+            title="test",
+            html="test",
+            text="test",
+        )
+
+        url_table = SQLiteURLTable(str(get_checkpoint_path(self.crawl)))
+        statuses = {
+            "https://example.com/page/": Status.done,
+            "https://example.com/error/": Status.error,
+            "https://example.com/redirect/": Status.done,
+            "https://example.com/other/": Status.done,
+            "https://example.com/unsaved/": Status.done,
+            "https://example.com/unsaved-error/": Status.error,
+            "https://example.com/skipped/": Status.skipped,
+            "https://example.com/todo/": Status.todo,
+        }
+        add_urls(url_table, statuses)
+        url_table.close()
+
+        # Mark the URLs as wpull would have after handling them.
+        with sqlite3.connect(get_checkpoint_path(self.crawl)) as connection:
+            connection.executemany(
+                "UPDATE queued_urls SET status = ? WHERE url_string_id = "
+                "(SELECT id FROM url_strings WHERE url = ?)",
+                [(status.value, url) for url, status in statuses.items()],
+            )
+
+        connection.close()
+
+        self.assertEqual(reset_unsaved_urls(self.crawl), 4)
+
+        url_table = SQLiteURLTable(str(get_checkpoint_path(self.crawl)))
+        self.addCleanup(url_table.close)
+        self.assertEqual(
+            {url_record.url: url_record.status for url_record in url_table.get_all()},
+            {
+                "https://example.com/page/": Status.done,
+                "https://example.com/error/": Status.error,
+                "https://example.com/redirect/": Status.done,
+                "https://example.com/other/": Status.todo,
+                "https://example.com/unsaved/": Status.todo,
+                "https://example.com/unsaved-error/": Status.todo,
+                "https://example.com/skipped/": Status.todo,
+                "https://example.com/todo/": Status.todo,
+            },
+        )
+
+        # Nothing is left to reset.
+        self.assertEqual(reset_unsaved_urls(self.crawl), 0)
+
+
+class MockCrawlFailure(Exception):
+    pass
+
+
+@pytest.mark.filterwarnings("ignore::sqlalchemy.exc.MovedIn20Warning")
+class ShardedCrawlTests(TestCase):
+    def setUp(self):
+        self.crawler = WpullCrawler()
+        self.crawl = Crawl.start(
+            CrawlConfig(start_url="https://example.com/", shards=2)
+        )
+
+    def patch_do_crawl(self, **kwargs):
+        return patch.object(WpullCrawler, "_do_crawl", **kwargs)
+
+    def patch_wait_for_frontier(self, **kwargs):
+        return patch("crawler.wpull.crawler.wait_for_frontier", **kwargs)
+
+    @patch("crawler.wpull.crawler.multiprocessing.Process")
+    def test_crawl_shards(self, process):
+        Crawl.objects.filter(pk=self.crawl.pk).update(status=Crawl.Status.FINISHED)
+
+        self.crawler.crawl_shards(self.crawl, [0, 1])
+
+        self.assertEqual(
+            process.call_args_list,
+            [
+                call(target=self.crawler.crawl_shard, args=(self.crawl, 0)),
+                call(target=self.crawler.crawl_shard, args=(self.crawl, 1)),
+            ],
+        )
+        self.assertEqual(process.return_value.start.call_count, 2)
+        self.assertEqual(process.return_value.join.call_count, 2)
+
+        # The crawl's status is reloaded once its shards have finished.
+        self.assertEqual(self.crawl.status, Crawl.Status.FINISHED)
+
+    def test_crawl_shard_until_finished(self):
+        with self.patch_do_crawl(return_value=0) as do_crawl:
+            with self.patch_wait_for_frontier(
+                side_effect=[True, True, False]
+            ) as wait_for_frontier:
+                self.crawler.crawl_shard(self.crawl, 1)
+
+        self.assertEqual(do_crawl.call_args_list, [call(self.crawl, 1)] * 3)
+        self.assertEqual(wait_for_frontier.call_args_list, [call(self.crawl, 1)] * 3)
+        self.assertEqual(self.crawl.status, Crawl.Status.STARTED)
+
+    def test_crawl_shard_exit_code(self):
+        with self.patch_do_crawl(return_value=1):
+            with self.patch_wait_for_frontier() as wait_for_frontier:
+                self.crawler.crawl_shard(self.crawl, 1)
+
+        wait_for_frontier.assert_not_called()
+
+        self.crawl.refresh_from_db()
+        self.assertEqual(self.crawl.status, Crawl.Status.FAILED)
+        self.assertEqual(
+            self.crawl.failure_message,
+            "Shard 1: Crawler finished with non-zero exit code 1",
+        )
+        self.assertEqual(
+            self.crawl.shards.get(index=1).status, CrawlShard.Status.FAILED
+        )
+
+    def test_crawl_shard_exception(self):
+        with self.patch_do_crawl(side_effect=MockCrawlFailure()):
+            with self.assertRaises(MockCrawlFailure):
+                self.crawler.crawl_shard(self.crawl, 0)
+
+        self.crawl.refresh_from_db()
+        self.assertEqual(self.crawl.status, Crawl.Status.FAILED)
+        self.assertIn("MockCrawlFailure", self.crawl.failure_message)
+        self.assertEqual(
+            self.crawl.shards.get(index=0).status, CrawlShard.Status.FAILED
+        )
+
+    @patch("crawler.wpull.crawler.Builder")
+    def test_do_crawl_shard(self, builder):
+        builder.return_value.build.return_value.run_sync.return_value = 0
+
+        self.assertEqual(self.crawler._do_crawl(self.crawl, 1), 0)
+
+        # Shards don't keep a checkpoint of their queue.
+        (args,) = builder.call_args.args
+        self.assertEqual(args.plugin_args, f"{self.crawl.pk}:1")
+        self.assertEqual(args.database, ":memory:")
+
+    @patch("crawler.wpull.crawler.Builder")
+    def test_do_crawl_unsharded(self, builder):
+        self.crawler._do_crawl(self.crawl)
+
+        (args,) = builder.call_args.args
+        self.assertEqual(args.plugin_args, str(self.crawl.pk))
+        self.assertEqual(args.database, str(get_checkpoint_path(self.crawl)))
+
+    @patch("crawler.wpull.crawler.Builder")
+    def test_do_crawl_no_sitemap(self, builder):
+        self.crawler._do_crawl(self.crawl)
+
+        (args,) = builder.call_args.args
+        self.assertIsNone(args.sitemap_entries)
+
+    @patch("crawler.wpull.crawler.Builder")
+    @patch("crawler.wpull.crawler.fetch_sitemap")
+    def test_do_crawl_fetches_sitemap_once(self, fetch_sitemap, builder):
+        self.crawl.config["sitemap_url"] = "https://example.com/sitemap.xml"
+        entries = [SitemapEntry("https://example.com/a/")]
+        fetch_sitemap.return_value = iter(entries)
+
+        for shard_index in [0, 0, 1]:
+            self.crawler._do_crawl(self.crawl, shard_index)
+
+            (args,) = builder.call_args.args
+            self.assertEqual(args.sitemap_entries, entries if not shard_index else None)
+
+        # Only the first shard reads the sitemap, and only once.
+        fetch_sitemap.assert_called_once_with("https://example.com/sitemap.xml")
@@ -0,0 +1,111 @@
+from django.test import SimpleTestCase
+
+from crawler.frontier import PriorityFrontier, get_section
+
+
+class GetSectionTests(SimpleTestCase):
+    def test_get_section(self):
+        for url, expected in [
+            ("https://example.com/", ("example.com", "")),
+            ("https://example.com/about-us/", ("example.com", "about-us")),
+            ("https://example.com/about-us/team/?page=2", ("example.com", "about-us")),
+            ("https://example.org/about-us", ("example.org", "about-us")),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(get_section(url), expected)
+
+
+class PriorityFrontierTests(SimpleTestCase):
+    def pop_all(self, frontier):
+        return list(iter(frontier.pop, None))
+
+    def test_empty(self):
+        frontier = PriorityFrontier()
+        self.assertEqual(len(frontier), 0)
+        self.assertIsNone(frontier.pop())
+
+    def test_depth(self):
+        frontier = PriorityFrontier()
+        frontier.add("https://example.com/a/b/", 2)
+        frontier.add("https://example.com/c/", 1)
+        frontier.add("https://example.com/", 0)
+
+        self.assertEqual(len(frontier), 3)
+        self.assertEqual(
+            self.pop_all(frontier),
+            [
+                "https://example.com/",
+                "https://example.com/c/",
+                "https://example.com/a/b/",
+            ],
+        )
+        self.assertEqual(len(frontier), 0)
+
+    def test_in_links(self):
+        frontier = PriorityFrontier()
+        frontier.add("https://example.com/a/", 1)
+        frontier.add("https://example.com/b/", 1)
+
+        # Links found to URLs that are already queued raise their priority.
+        frontier.add("https://example.com/b/", 2, queued=False)
+        frontier.add("https://example.com/b/", 3, queued=False)
+
+        self.assertEqual(
+            self.pop_all(frontier),
+            ["https://example.com/b/", "https://example.com/a/"],
+        )
+        self.assertEqual(frontier.in_links["https://example.com/b/"], 3)
+
+    def test_superseded_entries_are_compacted(self):
+        frontier = PriorityFrontier()
+        frontier.add("https://example.com/a/", 1)
+        frontier.add("https://example.com/b/", 1)
+
+        for _ in range(100):
+            frontier.add("https://example.com/b/", 2, queued=False)
+
+        self.assertLessEqual(len(frontier.heap), 4)
+        self.assertEqual(
+            self.pop_all(frontier),
+            ["https://example.com/b/", "https://example.com/a/"],
+        )
+
+    def test_not_queued(self):
+        frontier = PriorityFrontier()
+        frontier.add("https://example.com/", 0, queued=False)
+
+        self.assertEqual(len(frontier), 0)
+        self.assertEqual(frontier.in_links["https://example.com/"], 1)
+
+    def test_sitemap_priority(self):
+        frontier = PriorityFrontier()
+        frontier.sitemap_priorities["https://example.com/b/"] = 1.0
+        frontier.add("https://example.com/a/", 1)
+        frontier.add("https://EXAMPLE.com/b/#top", 1)
+
+        self.assertEqual(
+            self.pop_all(frontier),
+            ["https://EXAMPLE.com/b/#top", "https://example.com/a/"],
+        )
+
+    def test_section(self):
+        frontier = PriorityFrontier()
+
+        for page in range(1, 5):
+            frontier.add(f"https://example.com/blog/?page={page}", 1)
+
+        frontier.add("https://example.com/about-us/", 1)
+
+        self.assertEqual(
+            self.pop_all(frontier)[:2],
+            ["https://example.com/blog/?page=1", "https://example.com/about-us/"],
+        )
+
+    def test_remove(self):
+        frontier = PriorityFrontier()
+        frontier.add("https://example.com/a/", 1)
+        frontier.add("https://example.com/b/", 1)
+        frontier.remove("https://example.com/a/")
+        frontier.remove("https://example.com/missing/")
+
+        self.assertEqual(self.pop_all(frontier), ["https://example.com/b/"])
@@ -0,0 +1,254 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, patch
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from crawler.linkcheck import (
+    LINK_CHECK_TRIES,
+    LinkChecker,
+    LinkStatus,
+    fetch_link_status,
+    get_cache_key,
+    get_cached_link_status,
+    set_cached_link_status,
+)
+from crawler.ratelimit import AdaptiveRateController
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/redirect/":
+            self.send_response(301)
+            self.send_header("Location", "/target/")
+        elif self.path == "/missing/":
+            self.send_response(404)
+        elif self.path == "/busy/":
+            self.send_response(429)
+            self.send_header("Retry-After", "5")
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchLinkStatusTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_fetch_link_status(self):
+        for path, method, expected in [
+            ("/", "GET", LinkStatus(200)),
+            ("/", "HEAD", LinkStatus(204)),
+            ("/redirect/", "GET", LinkStatus(301, "/target/")),
+            ("/missing/", "GET", LinkStatus(404)),
+            ("/busy/", "GET", LinkStatus(429, retry_after="5")),
+        ]:
+            with self.subTest(path=path, method=method):
+                self.assertEqual(fetch_link_status(self.url + path, method), expected)
+
+    def test_network_failures(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+        server.server_close()
+
+        for url in [f"http://127.0.0.1:{server.server_port}/", "invalid"]:
+            with self.subTest(url=url):
+                self.assertEqual(fetch_link_status(url), LinkStatus(0))
+
+
+class LinkStatusCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches["links"].clear()
+
+    def test_cache(self):
+        self.assertIsNone(get_cached_link_status("https://example.com/"))
+
+        set_cached_link_status("https://example.com/", LinkStatus(301, "/a/"), 60)
+        self.assertEqual(
+            get_cached_link_status("HTTPS://EXAMPLE.COM:443/#fragment"),
+            LinkStatus(301, "/a/"),
+        )
+
+    def test_cache_key(self):
+        self.assertRegex(get_cache_key("https://example.com/"), r"^link-status:\w{64}$")
+
+    def test_cacheable(self):
+        self.assertTrue(LinkStatus(404).cacheable)
+        self.assertFalse(LinkStatus(0).cacheable)
+        self.assertFalse(LinkStatus(429).cacheable)
+        self.assertFalse(LinkStatus(503).cacheable)
+
+
+@patch("crawler.linkcheck.fetch_link_status", return_value=LinkStatus(404))
+class LinkCheckerTests(SimpleTestCase):
+    def setUp(self):
+        caches["links"].clear()
+        self.callback = Mock()
+
+        # One request per second, by a clock that never moves.
+        self.rate_controller = AdaptiveRateController(
+            min_rate=1, max_rate=1, clock=lambda: 0
+        )
+        sleep_patcher = patch("crawler.linkcheck.time.sleep")
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def test_check(self, fetch_link_status):
+        checker = LinkChecker(self.callback)
+        checker.check("https://example.com/", "HEAD", "https://example.org/")
+        checker.close()
+
+        fetch_link_status.assert_called_once_with("https://example.com/", "HEAD")
+        self.callback.assert_called_once_with(
+            "https://example.com/", LinkStatus(404), "https://example.org/"
+        )
+        self.assertEqual(checker.requests, 1)
+        self.assertEqual(
+            get_cached_link_status("https://example.com/"), LinkStatus(404)
+        )
+
+    def test_check_cached(self, fetch_link_status):
+        set_cached_link_status("https://example.com/", LinkStatus(301, "/a/"), 60)
+
+        checker = LinkChecker(self.callback)
+        checker.check("https://example.com/")
+        checker.close()
+
+        fetch_link_status.assert_not_called()
+        self.callback.assert_called_once_with(
+            "https://example.com/", LinkStatus(301, "/a/"), None
+        )
+        self.assertEqual(checker.cache_hits, 1)
+
+    def test_no_cache(self, fetch_link_status):
+        set_cached_link_status("https://example.com/", LinkStatus(301, "/a/"), 60)
+
+        checker = LinkChecker(self.callback, ttl=0)
+        checker.check("https://example.com/")
+        checker.check("https://example.org/")
+        checker.close()
+
+        self.assertEqual(fetch_link_status.call_count, 2)
+        self.assertIsNone(get_cached_link_status("https://example.org/"))
+
+    def test_uncacheable_status(self, fetch_link_status):
+        fetch_link_status.return_value = LinkStatus(0)
+
+        checker = LinkChecker(self.callback)
+        checker.check("https://example.com/")
+        checker.close()
+
+        self.callback.assert_called_once()
+        self.assertIsNone(get_cached_link_status("https://example.com/"))
+
+    def test_callback_failure_is_logged(self, fetch_link_status):
+        self.callback.side_effect = RuntimeError
+
+        checker = LinkChecker(self.callback)
+
+        with self.assertLogs("crawler", level="ERROR"):
+            checker.check("https://example.com/")
+            checker.close()
+
+    def test_rate_limit(self, fetch_link_status):
+        checker = LinkChecker(
+            self.callback, max_workers=1, rate_controller=self.rate_controller
+        )
+
+        for path in ["a", "b", "c"]:
+            checker.check(f"https://example.com/{path}/")
+
+        checker.check("https://EXAMPLE.org/")
+        checker.close()
+
+        self.assertEqual(
+            [sleep_call.args for sleep_call in self.sleep.call_args_list],
+            [(0,), (1,), (2,), (0,)],
+        )
+        self.assertEqual(self.rate_controller.hosts["example.com"].requests, 3)
+        self.assertEqual(self.rate_controller.hosts["example.org"].requests, 1)
+
+    def test_retries(self, fetch_link_status):
+        fetch_link_status.side_effect = [
+            LinkStatus(503, retry_after="5"),
+            LinkStatus(0),
+            LinkStatus(200),
+        ]
+
+        checker = LinkChecker(self.callback, rate_controller=self.rate_controller)
+        checker.check("https://example.com/")
+        checker.close()
+
+        self.assertEqual(fetch_link_status.call_count, 3)
+        self.callback.assert_called_once_with(
+            "https://example.com/", LinkStatus(200), None
+        )
+
+        # Retries wait for Retry-After, and are then spaced by the host's rate.
+        self.assertEqual(
+            [sleep_call.args for sleep_call in self.sleep.call_args_list],
+            [(0,), (5,), (6,)],
+        )
+
+    def test_retries_give_up(self, fetch_link_status):
+        fetch_link_status.return_value = LinkStatus(0)
+
+        checker = LinkChecker(self.callback, rate_controller=self.rate_controller)
+        checker.check("https://example.com/")
+        checker.close()
+
+        self.assertEqual(fetch_link_status.call_count, LINK_CHECK_TRIES)
+        self.callback.assert_called_once_with(
+            "https://example.com/", LinkStatus(0), None
+        )
+
+    @patch("crawler.linkcheck.LINK_CHECK_QUEUE_SIZE", 1)
+    def test_queue_is_bounded(self, fetch_link_status):
+        fetched = threading.Event()
+        release = threading.Event()
+
+        def block(url, method):
+            fetched.set()
+            release.wait(5)
+            return LinkStatus(404)
+
+        fetch_link_status.side_effect = block
+
+        checker = LinkChecker(self.callback, max_workers=1)
+        checker.check("https://example.com/a/")
+        fetched.wait(5)
+
+        # The queue is full, so checking another link waits for the first.
+        second_check = threading.Thread(
+            target=checker.check, args=("https://example.com/b/",)
+        )
+        second_check.start()
+        second_check.join(0.1)
+        self.assertTrue(second_check.is_alive())
+        self.assertEqual(fetch_link_status.call_count, 1)
+
+        release.set()
+        second_check.join(5)
+        self.assertFalse(second_check.is_alive())
+        checker.close()
+
+        self.assertEqual(fetch_link_status.call_count, 2)
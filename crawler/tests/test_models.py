@@ -2,10 +2,20 @@ from unittest.mock import patch
 
 import lxml.etree
 
+from django.core.cache import caches
 from django.test import SimpleTestCase, TestCase
 from django.utils import timezone
 
-from crawler.models import Crawl, CrawlConfig, Error, Page, Redirect
+from crawler.models import (
+    Crawl,
+    CrawlConfig,
+    CrawlShard,
+    Error,
+    Page,
+    PageRecord,
+    Redirect,
+    get_content_hash,
+)
 
 
 class CrawlTests(TestCase):
@@ -16,7 +26,26 @@ class CrawlTests(TestCase):
         crawl = Crawl.start(config)
         self.assertEqual(
             crawl.config,
-            {"start_url": "https://example.com", "max_pages": 0, "depth": 0},
+            {
+                "start_url": "https://example.com",
+                "max_pages": 0,
+                "depth": 0,
+                "parser_backend": "lxml",
+                "bloom_filter_capacity": 0,
+                "concurrency": 1,
+                "min_rate": 0.5,
+                "max_rate": 2.0,
+                "incremental": False,
+                "link_check_ttl": 86400,
+                "link_check_workers": 4,
+                "sitemap_url": None,
+                "shards": 1,
+                "stats_file": None,
+                "max_page_size": 0,
+                "pipeline_queue_size": 0,
+                "url_rules": None,
+                "prioritize": False,
+            },
         )
         self.assertEqual(crawl.status, Crawl.Status.STARTED)
 
@@ -28,6 +57,54 @@ class CrawlTests(TestCase):
         self.assertEqual(crawl.status, Crawl.Status.FAILED)
         self.assertEqual(crawl.failure_message, "Testing crawl failure")
 
+        crawl.resume()
+        self.assertEqual(crawl.status, Crawl.Status.STARTED)
+        self.assertIsNone(crawl.failure_message)
+
+    def test_add_stats(self):
+        crawl = Crawl.start(CrawlConfig(start_url="https://example.com"))
+        stats = {
+            "seconds": 2.0,
+            "counters": {"pages": 3, "bytes_downloaded": 100},
+            "stages": {"fetch": {"count": 3, "sum": 1.5, "buckets": [1, 2]}},
+        }
+
+        crawl.add_stats(stats)
+        self.assertEqual(crawl.stats, stats)
+
+        crawl.add_stats(stats)
+        crawl.refresh_from_db()
+        self.assertEqual(
+            crawl.stats,
+            {
+                "seconds": 4.0,
+                "counters": {"pages": 6, "bytes_downloaded": 200},
+                "stages": {"fetch": {"count": 6, "sum": 3.0, "buckets": [2, 4]}},
+            },
+        )
+
+    def test_finish_keeps_stats(self):
+        crawl = Crawl.start(CrawlConfig(start_url="https://example.com"))
+        stats = {"seconds": 1.0, "counters": {"pages": 1}, "stages": {}}
+
+        # Stats are saved by the crawler through a different instance.
+        Crawl.objects.get(pk=crawl.pk).add_stats(stats)
+
+        crawl.finish()
+        crawl.refresh_from_db()
+        self.assertEqual(crawl.status, Crawl.Status.FINISHED)
+        self.assertEqual(crawl.stats, stats)
+
+    def test_start_sharded(self):
+        crawl = Crawl.start(CrawlConfig(start_url="https://example.com", shards=3))
+        self.assertQuerySetEqual(
+            crawl.shards.values_list("index", "status"),
+            [(i, CrawlShard.Status.RUNNING) for i in range(3)],
+        )
+        self.assertEqual(
+            str(crawl.shards.first()), f"Crawl {crawl.pk} shard 0 (Running)"
+        )
+
     def test_repr(self):
         now = timezone.now()
 
@@ -53,6 +130,9 @@ class CrawlTests(TestCase):
 
 
 class PageTests(SimpleTestCase):
+    def setUp(self):
+        caches["parser"].clear()
+
     def test_from_html_no_title_returns_none(self):
         self.assertIsNone(
             Page.from_html(
@@ -93,6 +173,7 @@ class PageTests(SimpleTestCase):
         self.assertEqual(page.title, "Test page")
         self.assertEqual(page.language, "en")
         self.assertEqual(page.html, html)
+        self.assertEqual(page.content_hash, get_content_hash(html.encode("utf-8")))
         self.assertEqual(
             page.text,
             (
@@ -139,6 +220,58 @@ class PageTests(SimpleTestCase):
         self.assertIsNone(page.text)
 
 
+class PageRecordTests(SimpleTestCase):
+    def setUp(self):
+        caches["parser"].clear()
+
+    def test_from_html(self):
+        html = (
+            '<html lang="en"><head><title>Test page</title></head><body>'
+            '<div class="m-links"><a href="/page/">A link</a></div></body></html>'
+        )
+
+        record = PageRecord.from_html("https://example.com/", html, "example.com")
+        self.assertEqual(str(record), "https://example.com/")
+        self.assertEqual(record.title, "Test page")
+        self.assertEqual(record.language, "en")
+        self.assertEqual(record.content_hash, get_content_hash(html))
+        self.assertEqual(record.links, ["/page/"])
+        self.assertEqual(record.components, ["m-links"])
+
+    def test_from_html_no_title_returns_none(self):
+        self.assertIsNone(
+            PageRecord.from_html(
+                "https://example.com/", "<html><body></body></html>", "example.com"
+            )
+        )
+
+    def test_slots(self):
+        record = PageRecord("/", timezone.now(), "", "", "")
+
+        with self.assertRaises(AttributeError):
+            record.extra = True
+
+    def test_to_page(self):
+        crawl = Crawl(config={})
+        record = PageRecord(
+            url="/",
+            timestamp=timezone.now(),
+            title="",
+            html="",
+            text="",
+            links=["/a/"],
+            skipped_reason="Too large",
+            crawl=crawl,
+        )
+
+        page = record.to_page()
+        self.assertIsInstance(page, Page)
+        self.assertEqual(page.url, "/")
+        self.assertEqual(page.crawl, crawl)
+        self.assertEqual(page.skipped_reason, "Too large")
+        self.assertEqual(page.links.count(), 0)
+
+
 class PageQuerySetTestsNoPages(TestCase):
     def test_no_crawls_no_pages(self):
         self.assertFalse(Page.objects.exists())
@@ -0,0 +1,498 @@
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+import lxml.etree
+
+from crawler import parser
+from crawler.parser import (
+    PARSER_BACKENDS,
+    ParserBackend,
+    ParserBackendStats,
+    ParserPool,
+    ParserWorkerError,
+    _compile_drop_selectors,
+    _get_cache_key,
+    _parse_html,
+    _parse_html_into_tree,
+    _parser_worker_main,
+    get_content_type_charset,
+    get_html_encoding,
+    get_link_urls,
+    get_parser_pool,
+    parse_html,
+    parser_backend_stats,
+)
+
+
+class ParseHTMLTests(SimpleTestCase):
+    def setUp(self):
+        caches["parser"].clear()
+
+    def test_sample_site_matches_fixture(self):
+        with open(Path(__file__).parents[1] / "fixtures" / "sample.json") as f:
+            fixture = json.load(f)
+
+        links = {
+            record["pk"]: record["fields"]["href"]
+            for record in fixture
+            if record["model"] == "crawler.link"
+        }
+
+        components = {
+            record["pk"]: record["fields"]["class_name"]
+            for record in fixture
+            if record["model"] == "crawler.component"
+        }
+
+        pages = {
+            record["fields"]["url"]: record["fields"]
+            for record in fixture
+            if record["model"] == "crawler.page"
+        }
+
+        for path, url in [
+            ("index.html", "http://localhost:8000/"),
+            ("child/index.html", "http://localhost:8000/child/"),
+        ]:
+            with self.subTest(path=path):
+                html = (settings.BASE_DIR / "sample" / "src" / path).read_text()
+                parsed_html = parse_html(html, "localhost:8000")
+                page = pages[url]
+
+                self.assertEqual(parsed_html.title, page["title"])
+                self.assertEqual(parsed_html.language, page["language"])
+                self.assertEqual(parsed_html.text, page["text"])
+                self.assertCountEqual(
+                    set(parsed_html.links), [links[pk] for pk in page["links"]]
+                )
+                self.assertEqual(
+                    parsed_html.components,
+                    sorted(components[pk] for pk in page["components"]),
+                )
+
+    def test_title_and_drops(self):
+        html = """
+<html>
+<head></head>
+<body class="o-page">
+    <div class="o-header">
+        <title>Title in a dropped element</title>
+        <a href="/header/">Header</a>
+    </div>Header tail
+    <!-- A comment -->Comment tail
+    <!-- A comment without a tail --><a name="anchor">Anchor</a>
+    <p class="m-card  a-btn__primary other">Text mentioning a-text</p>
+    <div class="o-footer"><a href="/footer/" class="m-footer">Footer</a></div>
+</body>
+</html>
+        """.strip()
+
+        parsed_html = parse_html(html, "example.com")
+        self.assertEqual(parsed_html.title, "Title in a dropped element")
+        self.assertEqual(
+            parsed_html.text, "Header tail Comment tail Anchor Text mentioning a-text"
+        )
+        self.assertEqual(parsed_html.links, [])
+        self.assertEqual(parsed_html.components, ["a-btn__primary", "m-card", "o-page"])
+
+    def test_compile_drop_selectors(self):
+        self.assertEqual(
+            _compile_drop_selectors([".o-header", "img", ".skip-nav"]),
+            (frozenset(["img"]), frozenset(["o-header", "skip-nav"])),
+        )
+
+
+@override_settings(
+    CACHES={
+        **settings.CACHES,
+        "parser": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+)
+class ParseHTMLCacheTests(SimpleTestCase):
+    html = '<html lang="en"><head><title>Cached</title></head><body>Hi</body></html>'
+
+    def setUp(self):
+        caches["parser"].clear()
+
+    def test_cache_hit_skips_parsing(self):
+        first = parse_html(self.html, "example.com")
+
+        with patch("crawler.parser._parse_html_into_tree") as parse_into_tree:
+            second = parse_html(self.html, "example.com")
+
+        parse_into_tree.assert_not_called()
+        self.assertEqual(second.html, self.html)
+        self.assertEqual(
+            (second.title, second.language, second.text),
+            ("Cached", "en", "Hi"),
+        )
+        self.assertGreaterEqual(second.timestamp, first.timestamp)
+
+    def test_cache_hit_no_title(self):
+        html = "<html><head></head><body>No title</body></html>"
+        self.assertIsNone(parse_html(html, "example.com"))
+
+        with patch("crawler.parser._parse_html_into_tree") as parse_into_tree:
+            self.assertIsNone(parse_html(html, "example.com"))
+
+        parse_into_tree.assert_not_called()
+
+    def test_cache_key_depends_on_host_backend_and_parser_version(self):
+        key = _get_cache_key(self.html, "example.com", "lxml", None)
+
+        for other_key in [
+            _get_cache_key(self.html, "example.org", "lxml", None),
+            _get_cache_key(self.html, "example.com", "other", None),
+            _get_cache_key(self.html.encode(), "example.com", "lxml", "latin-1"),
+        ]:
+            self.assertNotEqual(key, other_key)
+
+        with patch("crawler.parser.PARSER_VERSION", "changed"):
+            self.assertNotEqual(
+                key, _get_cache_key(self.html, "example.com", "lxml", None)
+            )
+
+    def test_cache_hit_bytes(self):
+        html = self.html.encode("utf-8")
+        parse_html(html, "example.com")
+
+        with patch("crawler.parser._parse_html_into_tree") as parse_into_tree:
+            parsed_html = parse_html(html, "example.com")
+
+        parse_into_tree.assert_not_called()
+        self.assertEqual(parsed_html.html, self.html)
+
+    def test_worker_failure_is_not_cached(self):
+        with patch(
+            "crawler.parser._parse_html", side_effect=ParserWorkerError("failed")
+        ), self.assertLogs("crawler", "ERROR"):
+            self.assertIsNone(parse_html(self.html, "example.com"))
+
+        self.assertEqual(parse_html(self.html, "example.com").title, "Cached")
+
+
+def parse_in_child(parse):
+    """Replace _parse_html in parser workers, but not in this process."""
+    test_pid = os.getpid()
+
+    def side_effect(*args):
+        if os.getpid() == test_pid:
+            return _parse_html(*args)
+
+        return parse(*args)
+
+    return patch("crawler.parser._parse_html", side_effect=side_effect)
+
+
+class ParserPoolTests(SimpleTestCase):
+    html = (
+        '<html><head><title>Pooled</title></head><body class="o-page">Hi</body></html>'
+    )
+
+    def setUp(self):
+        self.pool = ParserPool(timeout=1)
+        self.addCleanup(self.pool.close)
+
+    def get_worker(self):
+        return self.pool._workers.queue[0]
+
+    def test_parse(self):
+        parser_backend_stats.clear()
+        parsed_html = self.pool.parse(self.html, "example.com")
+
+        self.assertEqual(parsed_html.html, self.html)
+        self.assertEqual(
+            (parsed_html.title, parsed_html.text, parsed_html.components),
+            ("Pooled", "Hi", ["o-page"]),
+        )
+        self.assertIsNone(self.pool.parse("<html></html>", "example.com"))
+
+        # Workers are reused, and their backend stats are collected here.
+        self.assertEqual(self.get_worker().pages_parsed, 2)
+        self.assertEqual(parser_backend_stats["lxml"].calls, 2)
+
+    def test_parse_bytes(self):
+        parsed_html = self.pool.parse(self.html.encode("utf-8"), "example.com", "lxml")
+        self.assertEqual(parsed_html.title, "Pooled")
+
+    def test_recycle_after_max_pages(self):
+        self.pool.max_pages_per_worker = 2
+
+        self.pool.parse(self.html, "example.com")
+        worker = self.get_worker()
+        self.pool.parse(self.html, "example.com")
+
+        self.assertIsNone(self.get_worker())
+        self.assertFalse(worker.process.is_alive())
+
+        self.pool.parse(self.html, "example.com")
+        self.assertNotEqual(self.get_worker().pid, worker.pid)
+
+    def test_recycle_after_rss_growth(self):
+        self.pool.max_rss_growth_kb = 0
+        self.pool.parse(self.html, "example.com")
+        self.assertIsNone(self.get_worker())
+
+    def test_killed_worker_is_replaced(self):
+        self.pool.parse(self.html, "example.com")
+        worker = self.get_worker()
+        os.kill(worker.pid, signal.SIGKILL)
+        worker.process.join()
+
+        with self.assertLogs("crawler", "WARNING") as logs:
+            parsed_html = self.pool.parse(self.html, "example.com")
+
+        self.assertEqual(parsed_html.title, "Pooled")
+        self.assertNotEqual(self.get_worker().pid, worker.pid)
+        self.assertIn(f"Restarting parser worker {worker.pid}", logs.output[0])
+
+    def test_timeout_gives_up(self):
+        parser_backend_stats.clear()
+        self.pool.timeout = 0.1
+
+        def parse_slowly(*args):
+            time.sleep(10)
+
+        with parse_in_child(parse_slowly), self.assertLogs(
+            "crawler", "WARNING"
+        ) as logs, self.assertRaisesRegex(ParserWorkerError, "giving up"):
+            self.pool.parse(self.html, "example.com")
+
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn("timed out", logs.output[0])
+        self.assertIsNone(self.get_worker())
+        self.assertEqual(parser_backend_stats["lxml"].calls, 1)
+        self.assertEqual(parser_backend_stats["lxml"].failures, 1)
+
+    def test_worker_exception(self):
+        def fail(*args):
+            raise ValueError("Parsing failed")
+
+        with parse_in_child(fail), self.assertRaisesRegex(ValueError, "failed"):
+            self.pool.parse(self.html, "example.com")
+
+        # The worker itself is still usable.
+        self.assertEqual(self.get_worker().pages_parsed, 1)
+
+    def test_close(self):
+        self.pool.size = 2
+        self.pool._workers.put(None)
+        self.pool.parse(self.html, "example.com")
+        worker = self.pool._workers.queue[-1]
+
+        self.pool.close()
+
+        self.assertFalse(worker.process.is_alive())
+        self.assertEqual(list(self.pool._workers.queue), [None, None])
+
+    def test_worker_main_stops_when_parent_closes_pipe(self):
+        parser_backend_stats.clear()
+        connection, child_connection = multiprocessing.Pipe()
+
+        # Run the worker in a thread, where it can't change signal handling.
+        with patch("signal.signal"):
+            thread = threading.Thread(
+                target=_parser_worker_main, args=(child_connection,)
+            )
+            thread.start()
+
+            connection.send((self.html, "example.com", "lxml", None))
+            parsed_html, exception, rss_growth_kb, backend_stats = connection.recv()
+            connection.close()
+            thread.join()
+
+        self.assertEqual(parsed_html.title, "Pooled")
+        self.assertIsNone(parsed_html.html)
+        self.assertIsNone(exception)
+        self.assertGreaterEqual(rss_growth_kb, 0)
+        self.assertEqual(backend_stats["lxml"].calls, 1)
+
+    def test_get_parser_pool(self):
+        with patch.object(parser, "_parser_pool", None), patch(
+            "atexit.register"
+        ) as register:
+            pool = get_parser_pool()
+            self.assertIs(get_parser_pool(), pool)
+
+        register.assert_called_once_with(pool.close)
+
+
+class ParserBackendTests(SimpleTestCase):
+    html = (settings.BASE_DIR / "sample" / "src" / "index.html").read_text()
+
+    def setUp(self):
+        parser_backend_stats.clear()
+
+    def tearDown(self):
+        parser_backend_stats.clear()
+
+    def test_backend_interface(self):
+        with self.assertRaises(NotImplementedError):
+            ParserBackend().parse(self.html)
+
+    def test_backends_match_lxml(self):
+        expected = _parse_html(self.html, "localhost:8000", "lxml")
+
+        for name in ["libxml2-recover", "soupparser"]:
+            with self.subTest(backend=name):
+                self.assertEqual(
+                    _parse_html(self.html, "localhost:8000", name).text,
+                    expected.text,
+                )
+                self.assertEqual(parser_backend_stats[name].calls, 1)
+                self.assertEqual(parser_backend_stats[name].failures, 0)
+                self.assertGreater(parser_backend_stats[name].seconds, 0)
+
+    def test_libxml2_recover_empty_document_falls_back(self):
+        _parse_html_into_tree("", "libxml2-recover")
+
+        self.assertEqual(
+            {
+                name: (stats.calls, stats.failures)
+                for name, stats in parser_backend_stats.items()
+            },
+            {"libxml2-recover": (1, 1), "lxml": (1, 1), "soupparser": (1, 0)},
+        )
+
+    def test_all_backends_fail(self):
+        with patch(
+            "lxml.html.soupparser.fromstring",
+            side_effect=lxml.etree.ParserError("testing parser error"),
+        ):
+            with self.assertRaises(lxml.etree.ParserError):
+                _parse_html_into_tree("", "lxml")
+
+    def test_html5_parser(self):
+        html5_parser = Mock()
+
+        with patch.dict(sys.modules, {"html5_parser": html5_parser}):
+            tree = _parse_html_into_tree(self.html, "html5-parser")
+
+        html5_parser.parse.assert_called_once_with(
+            self.html, transport_encoding=None, treebuilder="lxml_html"
+        )
+        self.assertEqual(tree, html5_parser.parse.return_value)
+
+    def test_unavailable_html5_parser_falls_back(self):
+        with patch.dict(sys.modules, {"html5_parser": None}):
+            tree = _parse_html_into_tree(self.html, "html5-parser")
+
+        self.assertEqual(tree.find(".//title").text, "Sample homepage")
+        self.assertEqual(parser_backend_stats["html5-parser"].failures, 1)
+        self.assertEqual(parser_backend_stats["lxml"].failures, 0)
+
+    def test_registry(self):
+        self.assertEqual(
+            list(PARSER_BACKENDS),
+            ["lxml", "libxml2-recover", "html5-parser", "soupparser"],
+        )
+
+    def test_stats_add(self):
+        stats = ParserBackendStats(calls=1, failures=0, seconds=1.5)
+        stats.add(ParserBackendStats(calls=2, failures=1, seconds=0.5))
+        self.assertEqual(stats, ParserBackendStats(calls=3, failures=1, seconds=2))
+
+
+class ParseHTMLBytesTests(SimpleTestCase):
+    html = (
+        '<html><head><title>Café</title></head><body><p class="m-card">Naïve</p> '
+        '<a href="/café/">Link</a></body></html>'
+    )
+
+    def setUp(self):
+        caches["parser"].clear()
+
+    def check_parsed_html(self, parsed_html):
+        self.assertEqual(parsed_html.html, self.html)
+        self.assertEqual(parsed_html.title, "Café")
+        self.assertEqual(parsed_html.text, "Naïve Link")
+        self.assertEqual(parsed_html.links, ["/café/"])
+        self.assertEqual(parsed_html.components, ["m-card"])
+
+    def test_utf8_bytes(self):
+        self.check_parsed_html(parse_html(self.html.encode("utf-8"), "example.com"))
+
+    def test_declared_encoding(self):
+        self.check_parsed_html(
+            parse_html(self.html.encode("latin-1"), "example.com", encoding="latin-1")
+        )
+
+    def test_meta_charset(self):
+        html = self.html.replace("<head>", '<head><meta charset="iso-8859-1">')
+        parsed_html = parse_html(html.encode("latin-1"), "example.com")
+        self.assertEqual(parsed_html.html, html)
+        self.assertEqual(parsed_html.title, "Café")
+
+    def test_invalid_bytes_do_not_raise(self):
+        parsed_html = parse_html(self.html.encode("latin-1"), "example.com")
+        self.assertEqual(parsed_html.title, "Caf\ufffd")
+
+    def test_backends_with_encoding(self):
+        for backend in ["lxml", "libxml2-recover", "soupparser"]:
+            for encoding in ["utf-8", "latin-1"]:
+                with self.subTest(backend=backend, encoding=encoding):
+                    self.check_parsed_html(
+                        parse_html(
+                            self.html.encode(encoding),
+                            "example.com",
+                            backend,
+                            encoding=encoding,
+                        )
+                    )
+
+    def test_get_html_encoding(self):
+        html = b'<html><head><meta charset="latin-1"></head></html>'
+        self.assertEqual(get_html_encoding(html), "latin-1")
+        self.assertEqual(get_html_encoding(html, "utf-16"), "utf-16")
+        self.assertEqual(get_html_encoding(html, "invalid"), "latin-1")
+        self.assertEqual(get_html_encoding(b"<html></html>"), "utf-8")
+        self.assertEqual(
+            get_html_encoding(b'<meta charset="invalid">', "also-invalid"), "utf-8"
+        )
+
+    def test_get_content_type_charset(self):
+        self.assertEqual(
+            get_content_type_charset("text/html; charset=ISO-8859-1"), "iso-8859-1"
+        )
+        self.assertIsNone(get_content_type_charset("text/html"))
+
+
+class GetLinkURLsTests(SimpleTestCase):
+    def test_includes_dropped_elements(self):
+        html = """<html><body>
+            <div class="o-header"><a href="/header/">Header</a></div>
+            <p><a href="child/">Child</a> <a href="https://example.org/">External</a></p>
+            <div class="o-footer"><a href="/footer/">Footer</a></div>
+            <a>No href</a> <a href=" ">Blank</a> <a href="http://[invalid">Invalid</a>
+        </body></html>"""
+
+        self.assertEqual(
+            get_link_urls(html, "https://example.com/page/"),
+            [
+                "https://example.com/header/",
+                "https://example.com/page/child/",
+                "https://example.org/",
+                "https://example.com/footer/",
+            ],
+        )
+
+    def test_base_href(self):
+        html = '<html><head><base href="/base/"></head><a href="child/">a</a></html>'
+        self.assertEqual(
+            get_link_urls(html, "https://example.com/page/"),
+            ["https://example.com/base/child/"],
+        )
+
+    def test_empty(self):
+        self.assertEqual(get_link_urls("", "https://example.com/"), [])
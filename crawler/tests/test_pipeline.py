@@ -0,0 +1,77 @@
+import threading
+from unittest.mock import Mock
+
+from django.test import SimpleTestCase
+
+from crawler.pipeline import PipelineStage
+
+
+class PipelineStageTests(SimpleTestCase):
+    def test_process(self):
+        results = []
+        stage = PipelineStage(lambda x, y: x + y if x else None, results.append)
+
+        stage.submit(1, 2)
+        stage.submit(0, 1)
+        stage.submit(3, 4)
+        stage.join()
+
+        self.assertEqual(results, [3, 7])
+        self.assertEqual(stage.stats.histograms["parse_queue_wait"].count, 3)
+
+        stage.close()
+        self.assertFalse(stage.thread.is_alive())
+
+        # Closing again does nothing.
+        stage.close()
+
+    def test_chained_stages(self):
+        results = []
+        second = PipelineStage(str, results.append, stage="queue_wait")
+        first = PipelineStage(lambda x: x * 2, second.submit, stats=second.stats)
+
+        for i in range(3):
+            first.submit(i)
+
+        first.close()
+        second.close()
+
+        self.assertEqual(results, ["0", "2", "4"])
+        self.assertEqual(second.stats.histograms["parse_queue_wait"].count, 3)
+        self.assertEqual(second.stats.histograms["queue_wait"].count, 3)
+
+    def test_backpressure(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def process(x):
+            started.set()
+            release.wait()
+
+        stage = PipelineStage(process, Mock(), max_queue_size=1)
+        stage.submit(1)
+        started.wait()
+
+        # One item fills the queue while the first is being processed.
+        stage.submit(2)
+
+        submitted = threading.Event()
+        threading.Thread(target=lambda: (stage.submit(3), submitted.set())).start()
+        self.assertFalse(submitted.wait(0.1))
+
+        release.set()
+        self.assertTrue(submitted.wait(5))
+        stage.close()
+
+    def test_failure_is_logged(self):
+        output = Mock()
+        stage = PipelineStage(lambda x: 1 / x, output)
+
+        with self.assertLogs("crawler", level="ERROR") as logs:
+            stage.submit(0)
+            stage.submit(1)
+            stage.join()
+
+        self.assertIn("Failed to process 0", logs.output[0])
+        output.assert_called_once_with(1.0)
+        stage.close()
@@ -0,0 +1,125 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from crawler.ratelimit import (
+    MAX_RETRY_AFTER,
+    AdaptiveRateController,
+    HostRate,
+    parse_retry_after,
+)
+
+
+class MockClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class AdaptiveRateControllerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = MockClock()
+        self.controller = AdaptiveRateController(
+            min_rate=1, max_rate=2, clock=self.clock
+        )
+
+    def test_invalid_rates(self):
+        for min_rate, max_rate in [(0, 1), (2, 1)]:
+            with self.subTest(min_rate=min_rate, max_rate=max_rate):
+                with self.assertRaises(ValueError):
+                    AdaptiveRateController(min_rate, max_rate)
+
+    def test_starts_at_min_rate(self):
+        self.assertEqual(
+            [self.controller.get_delay("example.com") for _ in range(2)], [0, 1]
+        )
+
+    def test_speeds_up_while_fast(self):
+        for _ in range(5):
+            self.controller.record_response("example.com", 200, 0.1)
+
+        self.assertEqual(self.controller.get_delay("example.com"), 0.5)
+
+        # Other hosts aren't affected.
+        self.assertEqual(
+            [self.controller.get_delay("example.org") for _ in range(2)], [0, 1]
+        )
+
+    def test_backs_off(self):
+        for status_code, latency in [(429, 0.1), (503, 0.1), (200, 1)]:
+            with self.subTest(status_code=status_code, latency=latency):
+                controller = AdaptiveRateController(
+                    min_rate=1, max_rate=8, clock=self.clock
+                )
+
+                for _ in range(20):
+                    controller.record_response("example.com", 200, 0.1)
+
+                controller.record_response("example.com", status_code, latency)
+                self.assertEqual(controller.get_delay("example.com"), 0.25)
+
+    def test_backs_off_on_error(self):
+        self.controller.record_response("example.com", 200, 0.1)
+        self.controller.record_response("example.com", 200, 0.1)
+        self.controller.record_error("example.com")
+        self.assertEqual(self.controller.get_delay("example.com"), 1)
+
+    def test_concurrent_requests_are_spaced(self):
+        self.assertEqual(
+            [self.controller.get_delay("example.com") for _ in range(3)], [0, 1, 2]
+        )
+        self.assertEqual(self.controller.get_delay("example.org"), 0)
+
+        # Requests are spaced from the last one made, too.
+        self.clock.now = 3.5
+        self.controller.record_error("example.com")
+        self.assertEqual(self.controller.get_delay("example.com"), 1)
+
+        # Hosts that haven't been requested for a while don't need to wait.
+        self.clock.now = 10
+        self.assertEqual(self.controller.get_delay("example.com"), 0)
+
+    def test_retry_after(self):
+        self.controller.record_response("example.com", 429, 0.1, "30")
+        self.assertEqual(self.controller.get_delay("example.com"), 30)
+
+        # Later requests are spaced after the one waiting for Retry-After.
+        self.clock.now = 20
+        self.assertEqual(self.controller.get_delay("example.com"), 11)
+
+    def test_invalid_retry_after_ignored(self):
+        self.controller.record_response("example.com", 503, 0.1, "invalid")
+        self.assertEqual(self.controller.get_delay("example.com"), 1)
+
+    def test_achieved_rate(self):
+        for now in range(5):
+            self.clock.now = now / 2
+            self.controller.record_response("example.com", 200, 0.1)
+
+        host_rate = self.controller.hosts["example.com"]
+        self.assertEqual(host_rate.requests, 5)
+        self.assertEqual(host_rate.achieved_rate, 2)
+
+    def test_achieved_rate_too_few_requests(self):
+        self.assertEqual(HostRate(rate=1).achieved_rate, 0)
+        self.assertEqual(
+            HostRate(rate=1, requests=2, first_request=1, last_request=1).achieved_rate,
+            0,
+        )
+
+
+class ParseRetryAfterTests(SimpleTestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("120"), 120)
+        self.assertEqual(parse_retry_after("-1"), 0)
+        self.assertEqual(parse_retry_after("86400"), MAX_RETRY_AFTER)
+
+    @patch("time.time", return_value=784111717)
+    def test_http_date(self, _):
+        self.assertEqual(parse_retry_after("Sun, 06 Nov 1994 08:49:37 GMT"), 60)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_retry_after("invalid"))
+        self.assertIsNone(parse_retry_after(""))
@@ -0,0 +1,159 @@
+import io
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from crawler.benchmarks.replay import (
+    SAMPLE_WARC_PATH,
+    ReplayResponse,
+    ReplayServer,
+    get_replay_key,
+    iter_warc_records,
+    parse_http_response,
+    read_warc_responses,
+)
+
+WARC_RECORD = (
+    b"WARC/1.0\r\n"
+    b"WARC-Type: response\r\n"
+    b"WARC-Target-URI: http://example.com/page/?page=2\r\n"
+    b"Content-Length: %d\r\n"
+    b"\r\n"
+    b"%s\r\n\r\n"
+)
+
+HTTP_RESPONSE = (
+    b"HTTP/1.1 301 Moved Permanently\r\n"
+    b"Location: /target/\r\n"
+    b"Content-Length: 4\r\n"
+    b"Date: Fri, 05 Aug 2022 20:29:05 GMT\r\n"
+    b"\r\n"
+    b"body"
+)
+
+
+def make_warc_record(block):
+    return WARC_RECORD % (len(block), block)
+
+
+class WARCTests(SimpleTestCase):
+    def test_iter_warc_records(self):
+        f = io.BytesIO(
+            make_warc_record(b"first") + make_warc_record(b"second") + b"WARC/1.0\r\n"
+        )
+
+        self.assertEqual(
+            [(headers["warc-type"], block) for headers, block in iter_warc_records(f)],
+            [("response", b"first"), ("response", b"second")],
+        )
+
+    def test_parse_http_response(self):
+        self.assertEqual(
+            parse_http_response(HTTP_RESPONSE),
+            ReplayResponse(301, [("Location", "/target/")], b"body"),
+        )
+
+    def test_parse_chunked_http_response(self):
+        response = (
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/html\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"\r\n"
+            b"5;name=value\r\n<html\r\n"
+            b"8\r\n></html>\r\n"
+            b"0\r\n"
+            b"Trailer: value\r\n"
+            b"\r\n"
+        )
+
+        self.assertEqual(
+            parse_http_response(response),
+            ReplayResponse(200, [("Content-Type", "text/html")], b"<html></html>"),
+        )
+
+        # A truncated recording replays as much of the body as was recorded.
+        self.assertEqual(
+            parse_http_response(response[: response.index(b"0\r\n")]).body,
+            b"<html></html>",
+        )
+
+    def test_get_replay_key(self):
+        self.assertEqual(get_replay_key("http://example.com"), "/")
+        self.assertEqual(get_replay_key("http://example.com/a/?b=c#d"), "/a/?b=c")
+
+    def test_read_warc_responses(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "test.warc"
+            path.write_bytes(
+                make_warc_record(HTTP_RESPONSE)
+                + make_warc_record(HTTP_RESPONSE).replace(b"response", b"request", 1)
+            )
+
+            self.assertEqual(
+                read_warc_responses(path),
+                {"/page/?page=2": parse_http_response(HTTP_RESPONSE)},
+            )
+
+    def test_read_sample_warc(self):
+        responses = read_warc_responses(SAMPLE_WARC_PATH)
+        self.assertEqual(sorted(responses), ["/", "/child/"])
+        self.assertEqual(responses["/"].status, 200)
+        self.assertIn(b"Sample homepage", responses["/"].body)
+
+
+class ReplayServerTests(SimpleTestCase):
+    responses = {
+        "/": ReplayResponse(200, [("Content-Type", "text/html")], b"<html></html>"),
+    }
+
+    def fetch(self, url, method="GET"):
+        request = urllib.request.Request(url, method=method)
+
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    def test_replay(self):
+        with ReplayServer(self.responses) as server:
+            status, headers, body = self.fetch(server.url)
+            self.assertEqual(status, 200)
+            self.assertEqual(headers["Content-Type"], "text/html")
+            self.assertEqual(body, b"<html></html>")
+
+            status, headers, body = self.fetch(server.url, "HEAD")
+            self.assertEqual(status, 200)
+            self.assertEqual(headers["Content-Length"], "13")
+            self.assertEqual(body, b"")
+
+            status, _, _ = self.fetch(server.url + "missing/")
+            self.assertEqual(status, 404)
+
+            self.assertEqual(server.requests, 3)
+
+    def test_latency(self):
+        with ReplayServer(self.responses, latency=0.05) as server:
+            start = time.perf_counter()
+            self.fetch(server.url)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+
+    def test_error_rate(self):
+        with ReplayServer(self.responses, error_rate=1, error_status=500) as server:
+            status, _, body = self.fetch(server.url)
+            self.assertEqual(status, 500)
+            self.assertEqual(body, b"")
+
+    def test_error_rate_is_deterministic(self):
+        statuses = []
+
+        for _ in range(2):
+            with ReplayServer(self.responses, error_rate=0.5, seed=1) as server:
+                statuses.append([self.fetch(server.url)[0] for _ in range(10)])
+
+        self.assertEqual(statuses[0], statuses[1])
+        self.assertCountEqual(set(statuses[0]), [200, 503])
@@ -0,0 +1,240 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from crawler.models import Crawl, Page, PageRecord, get_content_hash
+from crawler.pipeline import PipelineStage
+from crawler.responses import (
+    build_page,
+    exceeds_max_page_size,
+    get_conditional_headers,
+    get_content_length,
+    get_previous_pages,
+    is_html,
+    is_unchanged_in_sitemap,
+    make_skipped_page,
+    should_download,
+)
+from crawler.sitemap import SitemapEntry
+from crawler.stats import CrawlStats
+from crawler.writer import UnchangedPage
+
+HTML = b'<html><head><title>Test</title></head><body><a href="/a/">A</a></body></html>'
+
+
+def make_previous_page(html=HTML, etag=None, last_modified=None, timestamp=None, id=1):
+    return SimpleNamespace(
+        url="https://example.com/",
+        id=id,
+        timestamp=timestamp or timezone.now(),
+        etag=etag,
+        last_modified=last_modified,
+        content_hash=get_content_hash(html),
+    )
+
+
+class DownloadDecisionTests(SimpleTestCase):
+    def test_is_html(self):
+        self.assertTrue(is_html("text/html"))
+        self.assertTrue(is_html("text/html; charset=utf-8"))
+        self.assertFalse(is_html("application/pdf"))
+        self.assertFalse(is_html(None))
+
+    def test_get_content_length(self):
+        for value, expected in [
+            ("123", 123),
+            ("0", 0),
+            ("-1", None),
+            ("many", None),
+            (None, None),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(get_content_length(value), expected)
+
+    def test_exceeds_max_page_size(self):
+        self.assertTrue(exceeds_max_page_size(101, 100))
+        self.assertFalse(exceeds_max_page_size(100, 100))
+        self.assertFalse(exceeds_max_page_size(None, 100))
+        self.assertFalse(exceeds_max_page_size(101, 0))
+
+    def test_should_download(self):
+        for content_type, content_length, max_page_size, expected in [
+            ("text/html", 100, 0, True),
+            ("text/html", 100, 100, True),
+            ("text/html", None, 100, True),
+            ("text/html", 101, 100, False),
+            ("application/pdf", 100, 0, False),
+            (None, None, 0, False),
+        ]:
+            with self.subTest(
+                content_type=content_type,
+                content_length=content_length,
+                max_page_size=max_page_size,
+            ):
+                self.assertEqual(
+                    should_download(content_type, content_length, max_page_size),
+                    expected,
+                )
+
+    def test_make_skipped_page(self):
+        with self.assertLogs("crawler", "INFO"):
+            page = make_skipped_page(
+                "https://example.com/", 200, 100, etag='"abc"', last_modified="x"
+            )
+
+        self.assertEqual(
+            (page.url, page.html, page.text), ("https://example.com/", "", "")
+        )
+        self.assertEqual((page.etag, page.last_modified), ('"abc"', "x"))
+        self.assertEqual(
+            page.skipped_reason, "Size of 200 bytes exceeds the limit of 100 bytes"
+        )
+
+
+class IncrementalDecisionTests(SimpleTestCase):
+    def test_get_conditional_headers(self):
+        self.assertEqual(get_conditional_headers(make_previous_page()), {})
+        self.assertEqual(
+            get_conditional_headers(
+                make_previous_page(etag='"abc"', last_modified="x")
+            ),
+            {"If-None-Match": '"abc"', "If-Modified-Since": "x"},
+        )
+        self.assertEqual(
+            get_conditional_headers(make_previous_page(last_modified="x")),
+            {"If-Modified-Since": "x"},
+        )
+
+    def test_is_unchanged_in_sitemap(self):
+        saved = timezone.now()
+        previous_page = make_previous_page(timestamp=saved)
+        url = "https://example.com/"
+
+        for sitemap_entry, expected in [
+            (None, False),
+            (SitemapEntry(url), False),
+            (SitemapEntry(url, lastmod=saved - timedelta(days=1)), True),
+            (SitemapEntry(url, lastmod=saved), True),
+            (SitemapEntry(url, lastmod=saved + timedelta(days=1)), False),
+        ]:
+            with self.subTest(sitemap_entry=sitemap_entry):
+                self.assertEqual(
+                    is_unchanged_in_sitemap(sitemap_entry, previous_page), expected
+                )
+
+
+class BuildPageTests(SimpleTestCase):
+    def test_new_page(self):
+        stats = CrawlStats()
+        page = build_page(
+            "https://example.com/",
+            HTML,
+            "example.com",
+            content_type="text/html; charset=utf-8",
+            etag='"abc"',
+            last_modified="x",
+            stats=stats,
+        )
+
+        self.assertIsInstance(page, PageRecord)
+        self.assertEqual((page.title, page.links), ("Test", ["/a/"]))
+        self.assertEqual((page.etag, page.last_modified), ('"abc"', "x"))
+        self.assertEqual(stats.to_dict()["stages"]["parse"]["count"], 1)
+
+    def test_changed_page(self):
+        page = build_page(
+            "https://example.com/",
+            HTML,
+            "example.com",
+            previous_page=make_previous_page(b"<html>Old</html>"),
+        )
+
+        self.assertIsInstance(page, PageRecord)
+
+    def test_unchanged_page(self):
+        stats = CrawlStats()
+        page = build_page(
+            "https://example.com/",
+            HTML,
+            "example.com",
+            etag='"def"',
+            previous_page=make_previous_page(etag='"abc"', id=5),
+            stats=stats,
+        )
+
+        # Unchanged pages are copied rather than parsed again, with any new
+        # validators.
+        self.assertIsInstance(page, UnchangedPage)
+        self.assertEqual(page.previous_page_id, 5)
+        self.assertEqual((page.etag, page.last_modified), ('"def"', None))
+        self.assertEqual(stats.to_dict()["stages"]["parse"]["count"], 0)
+
+    def test_unparseable_page(self):
+        with self.assertLogs("crawler", "DEBUG"):
+            self.assertIsNone(
+                build_page("https://example.com/", b"<html></html>", "example.com")
+            )
+
+    def test_parse_stage(self):
+        previous_page = make_previous_page()
+        results = []
+        stage = PipelineStage(
+            lambda url, html: build_page(
+                url, html, "example.com", previous_page=previous_page
+            ),
+            results.append,
+        )
+        self.addCleanup(stage.close)
+
+        with self.assertLogs("crawler", "DEBUG"):
+            stage.submit("https://example.com/", HTML)
+            stage.submit("https://example.com/b/", b"<html></html>")
+            stage.submit("https://example.com/c/", HTML.replace(b"Test", b"C"))
+            stage.join()
+
+        # Pages that can't be parsed aren't passed on to be saved.
+        self.assertEqual(
+            [type(result) for result in results], [UnchangedPage, PageRecord]
+        )
+        self.assertEqual(results[1].title, "C")
+
+
+class GetPreviousPagesTests(TestCase):
+    def setUp(self):
+        self.crawl = Crawl.objects.create(config={"start_url": "https://example.com/"})
+
+    def make_crawl(
+        self, start_url="https://example.com/", status=Crawl.Status.FINISHED
+    ):
+        crawl = Crawl.objects.create(config={"start_url": start_url}, status=status)
+        Page.objects.create(
+            crawl=crawl,
+            timestamp=timezone.now(),
+            url=f"{start_url}page/",
+            title="test",
+            html="test",
+            text="test",
+            etag='"abc"',
+        )
+        return crawl
+
+    def test_no_previous_crawl(self):
+        self.make_crawl(status=Crawl.Status.FAILED)
+        self.make_crawl("https://example.org/")
+
+        self.assertEqual(get_previous_pages(self.crawl), {})
+
+    def test_previous_crawl(self):
+        self.make_crawl()
+        previous_crawl = self.make_crawl()
+        page = Page._base_manager.get(crawl=previous_crawl)
+
+        previous_pages = get_previous_pages(self.crawl)
+
+        self.assertEqual(list(previous_pages), ["https://example.com/page/"])
+        previous_page = previous_pages["https://example.com/page/"]
+        self.assertEqual(previous_page.id, page.pk)
+        self.assertEqual(previous_page.etag, '"abc"')
+        self.assertEqual(previous_page.content_hash, page.content_hash)
@@ -0,0 +1,158 @@
+from django.test import SimpleTestCase
+
+from crawler.rules import DEFAULT_URL_RULES, URLRule, URLRuleSet
+
+
+class URLRuleTests(SimpleTestCase):
+    def test_invalid_rules(self):
+        for kwargs in [
+            {"action": "delete", "prefix": "/"},
+            {"action": "skip"},
+            {"action": "skip", "prefix": "/", "pattern": "/"},
+            {"action": "skip", "prefix": "/", "scope": "everywhere"},
+            {"action": "unwrap", "prefix": "/"},
+            {"action": "skip", "prefix": "/", "param": "url"},
+            {"action": "skip", "pattern": "("},
+            {"action": "skip", "pattern": r"(b)\1"},
+            {"action": "skip", "pattern": r"(?P<b>b)(?P=b)"},
+            {"action": "skip", "pattern": r"(b)?(?(1)c|d)"},
+        ]:
+            with self.subTest(kwargs=kwargs):
+                with self.assertRaises(ValueError):
+                    URLRule(**kwargs)
+
+    def test_str(self):
+        self.assertEqual(str(URLRule("skip", prefix="/search/")), "skip /search/")
+        self.assertEqual(
+            str(URLRule("head", pattern="https://", scope="external")),
+            "head https:// (external)",
+        )
+
+    def test_to_dict(self):
+        rule = URLRule("unwrap", prefix="/external-site/", param="ext_url")
+        rule.hits = 5
+
+        self.assertEqual(
+            rule.to_dict(),
+            {"action": "unwrap", "prefix": "/external-site/", "param": "ext_url"},
+        )
+        self.assertEqual(URLRule(**rule.to_dict()), rule)
+
+    def test_unwrap(self):
+        rule = URLRule("unwrap", prefix="/external-site/", param="ext_url")
+
+        self.assertEqual(
+            rule.unwrap("/external-site/?ext_url=https%3A%2F%2Fexample.org%2F"),
+            "https://example.org/",
+        )
+        self.assertIsNone(rule.unwrap("/external-site/?page=2"))
+
+
+class URLRuleSetTests(SimpleTestCase):
+    def setUp(self):
+        self.rules = URLRuleSet(DEFAULT_URL_RULES)
+
+    def get_action(self, url, internal=True):
+        rule = self.rules.match(url, internal=internal)
+        return rule.action if rule else None
+
+    def test_default_rules(self):
+        for url, internal, action in [
+            ("https://example.com/", True, None),
+            ("https://example.com/about-us/", True, None),
+            ("https://example.com/data.csv", True, "skip"),
+            ("https://example.com/v1.0/page/", True, "skip"),
+            ("https://example.com/?page=2", True, "follow"),
+            ("https://example.com/?page=2&page=3", True, "follow"),
+            ("https://example.com/?page=2#top", True, "follow"),
+            ("https://example.com/?page=2&q=loans", True, "skip"),
+            ("https://example.com/?q=loans", True, "skip"),
+            ("https://example.com/?page=2&q=&sort=title", True, "skip"),
+            ("https://example.com/?=loans", True, "skip"),
+            ("https://example.com/?foo=", True, None),
+            ("https://example.com/?page=1&foo=", True, None),
+            ("https://example.com/?foo&page=1", True, None),
+            ("https://example.com/?pages=", True, None),
+            ("https://example.com/?", True, None),
+            ("https://example.com/#top", True, None),
+            (
+                "https://example.com/external-site/?ext_url=https://x.org",
+                True,
+                "unwrap",
+            ),
+            ("https://example.com/external-site/", True, "unwrap"),
+            ("https://www.facebook.com/dialog/share?u=x", True, "skip"),
+            ("https://www.facebook.com/dialog/share?u=x", False, "skip"),
+            ("https://www.facebook.com/cfpb", False, None),
+            ("https://X.com/intent/tweet?text=x", False, "skip"),
+            ("https://files.consumerfinance.gov/f/report.pdf", False, "head"),
+            ("https://files.consumerfinance.gov/f/report.pdf", True, "skip"),
+            ("https://example.org/data.csv", False, None),
+            ("https://example.org/?q=loans", False, None),
+        ]:
+            with self.subTest(url=url, internal=internal):
+                self.assertEqual(self.get_action(url, internal), action)
+
+    def test_first_matching_rule_applies(self):
+        rules = URLRuleSet(
+            [
+                {"action": "follow", "pattern": r"https://example\.com/a/b/"},
+                {"action": "skip", "prefix": "https://example.com/a/"},
+                {"action": "head", "prefix": "/a/"},
+                {"action": "skip", "pattern": r".*/b/"},
+            ]
+        )
+
+        self.assertEqual(rules.match("https://example.com/a/b/").action, "follow")
+        self.assertEqual(rules.match("https://example.com/a/c/").action, "skip")
+        self.assertEqual(rules.match("https://example.org/a/b/").action, "head")
+        self.assertEqual(rules.match("https://example.org/c/b/").action, "skip")
+        self.assertIsNone(rules.match("https://example.org/c/"))
+        self.assertIsNone(rules.match("https://example.com/a"))
+
+    def test_pattern_flags_and_groups(self):
+        rules = URLRuleSet(
+            [
+                {"action": "skip", "pattern": r"(?i)https://example\.com/A/"},
+                {"action": "head", "pattern": r"(?P<scheme>https)://example\.org/"},
+                {"action": "follow", "pattern": r"(?P<scheme>http)://example\.org/"},
+                {"action": "skip", "pattern": r"(?x) .*/b/  # Verbose."},
+                {"action": "head", "pattern": r"\\1"},
+            ]
+        )
+
+        # Each pattern's flags only apply to that pattern.
+        self.assertEqual(rules.match("https://example.com/a/").action, "skip")
+        self.assertIsNone(rules.match("https://EXAMPLE.org/"))
+        self.assertEqual(rules.match("https://example.org/").action, "head")
+        self.assertEqual(rules.match("http://example.org/").action, "follow")
+        self.assertEqual(rules.match("https://example.net/b/").action, "skip")
+        self.assertIsNone(rules.match("https://example.net/ b/"))
+        self.assertEqual(rules.match("\\1").action, "head")
+
+    def test_invalid_combined_patterns(self):
+        rule = URLRule("skip", pattern="/")
+        rule.pattern = "("
+
+        with self.assertRaises(ValueError):
+            URLRuleSet([rule])
+
+    def test_no_rules(self):
+        self.assertIsNone(URLRuleSet([]).match("https://example.com/"))
+
+    def test_hits(self):
+        for url in [
+            "https://example.com/data.csv",
+            "https://example.com/data.json",
+            "https://example.com/?page=2",
+            "https://example.com/",
+        ]:
+            self.rules.match(url)
+
+        self.assertEqual(
+            {str(rule): rule.hits for rule in self.rules.rules if rule.hits},
+            {
+                r"skip [^:/?#]+://[^/?#]*/[^?#]*\. (internal)": 2,
+                r"follow [^?#]*\?page=[^&#]*(?:&page=[^&#]*)*(?:#|$) (internal)": 1,
+            },
+        )
@@ -0,0 +1,98 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase
+
+from crawler.models import Crawl, CrawlConfig, CrawlShard, FrontierURL
+from crawler.sharding import (
+    claim_frontier_urls,
+    fail_shard,
+    get_shard,
+    wait_for_frontier,
+)
+
+
+class GetShardTests(SimpleTestCase):
+    def test_get_shard(self):
+        shards = [get_shard(f"https://example.com/{i}/", 4) for i in range(100)]
+        self.assertEqual(set(shards), {0, 1, 2, 3})
+
+    def test_canonicalized(self):
+        self.assertEqual(
+            get_shard("https://example.com/a/", 16),
+            get_shard("HTTPS://EXAMPLE.COM:443/a/#fragment", 16),
+        )
+
+
+class ShardingTests(TestCase):
+    def setUp(self):
+        self.crawl = Crawl.start(CrawlConfig(start_url="https://example.com", shards=2))
+
+    def get_statuses(self):
+        return list(self.crawl.shards.values_list("status", flat=True))
+
+    def add_frontier_url(self, url, shard=0, claimed=False):
+        return FrontierURL.objects.create(
+            crawl=self.crawl, shard=shard, url=url, claimed=claimed
+        )
+
+    def test_claim_frontier_urls(self):
+        self.add_frontier_url("/a/")
+        self.add_frontier_url("/b/")
+        self.add_frontier_url("/c/")
+        self.add_frontier_url("/d/", shard=1)
+
+        self.assertEqual(
+            [u.url for u in claim_frontier_urls(self.crawl, 0, limit=2)],
+            ["/a/", "/b/"],
+        )
+        self.assertEqual([u.url for u in claim_frontier_urls(self.crawl, 0)], ["/c/"])
+        self.assertEqual(claim_frontier_urls(self.crawl, 0), [])
+        self.assertTrue(all(u.claimed for u in claim_frontier_urls(self.crawl, 1)))
+
+    def test_wait_for_frontier_with_urls(self):
+        self.crawl.shards.update(status=CrawlShard.Status.IDLE)
+        self.add_frontier_url("/a/")
+
+        self.assertTrue(wait_for_frontier(self.crawl, 0))
+        self.assertEqual(
+            self.get_statuses(), [CrawlShard.Status.RUNNING, CrawlShard.Status.IDLE]
+        )
+
+    def test_wait_for_frontier_all_shards_drained(self):
+        self.crawl.shards.filter(index=1).update(status=CrawlShard.Status.IDLE)
+        self.add_frontier_url("/a/", claimed=True)
+
+        self.assertFalse(wait_for_frontier(self.crawl, 0))
+        self.assertEqual(self.crawl.status, Crawl.Status.FINISHED)
+        self.assertEqual(self.get_statuses(), [CrawlShard.Status.IDLE] * 2)
+
+    @patch("crawler.sharding.time.sleep")
+    def test_wait_for_frontier_waits_for_other_shards(self, sleep):
+        # While shard 0 waits, shard 1 hands it a URL.
+        sleep.side_effect = lambda _: self.add_frontier_url("/a/")
+
+        self.assertTrue(wait_for_frontier(self.crawl, 0, poll_interval=1))
+        sleep.assert_called_once_with(1)
+        self.assertEqual(self.crawl.status, Crawl.Status.STARTED)
+
+    @patch("crawler.sharding.time.sleep")
+    def test_wait_for_frontier_other_shard_has_urls(self, sleep):
+        # Shard 1 is idle but hasn't yet claimed the URLs handed to it.
+        self.crawl.shards.filter(index=1).update(status=CrawlShard.Status.IDLE)
+        self.add_frontier_url("/a/", shard=1)
+        sleep.side_effect = lambda _: self.add_frontier_url("/b/")
+
+        self.assertTrue(wait_for_frontier(self.crawl, 0, poll_interval=1))
+        sleep.assert_called_once_with(1)
+        self.assertEqual(self.crawl.status, Crawl.Status.STARTED)
+
+    def test_wait_for_frontier_failed_crawl(self):
+        fail_shard(self.crawl, 1, "Testing shard failure")
+        self.add_frontier_url("/a/")
+
+        self.assertFalse(wait_for_frontier(self.crawl, 0))
+        self.assertEqual(self.crawl.status, Crawl.Status.FAILED)
+        self.assertEqual(self.crawl.failure_message, "Shard 1: Testing shard failure")
+        self.assertEqual(
+            self.get_statuses(), [CrawlShard.Status.RUNNING, CrawlShard.Status.FAILED]
+        )
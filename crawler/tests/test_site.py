@@ -0,0 +1,117 @@
+from unittest.mock import patch
+
+from click.testing import CliRunner
+from django.test import SimpleTestCase
+
+from crawler.benchmarks.replay import ReplayServer
+from crawler.benchmarks.site import SyntheticSite
+from crawler.management.commands.serve_synthetic_site import command
+from crawler.parser import _parse_html
+
+
+class SyntheticSiteTests(SimpleTestCase):
+    def setUp(self):
+        self.site = SyntheticSite(pages=100, fan_out=3, listing_pages=4)
+
+    def parse(self, path):
+        response = self.site.get(path)
+        self.assertEqual(response.status, 200)
+        return _parse_html(response.body, "localhost:8000")
+
+    def test_homepage(self):
+        parsed_html = self.parse("/")
+        self.assertEqual(parsed_html.title, "Synthetic page 0")
+        self.assertEqual(len(parsed_html.components), 4)
+        self.assertIn("/pages/1/", parsed_html.links)
+        self.assertIn("/list/?page=1", parsed_html.links)
+
+    def test_deterministic(self):
+        self.assertEqual(self.site.get("/pages/5/"), self.site.get("/pages/5/"))
+        self.assertNotEqual(
+            self.site.get("/pages/5/"),
+            SyntheticSite(pages=100, seed=1).get("/pages/5/"),
+        )
+
+    def test_every_page_is_reachable(self):
+        seen = {"/"}
+        queue = ["/"]
+
+        while queue:
+            for link in self.parse(queue.pop()).links:
+                if link.startswith("/pages/") and link not in seen:
+                    seen.add(link)
+                    queue.append(link)
+
+        self.assertEqual(len(seen), 100)
+
+    def test_missing_pages(self):
+        for path in [
+            "/pages/100/",
+            "/pages/0/",
+            "/pages/01/",
+            "/pages/abc/",
+            "/pages/1/2/",
+            "/other/",
+            "/redirect/1/3/",
+            "/redirect/0/1/",
+            "/list/?page=5",
+            "/list/?other=1",
+        ]:
+            with self.subTest(path=path):
+                self.assertIsNone(self.site.get(path))
+
+    def test_link_types(self):
+        site = SyntheticSite(
+            pages=10,
+            random_links=1000,
+            broken_link_rate=0.1,
+            redirect_rate=0.1,
+            external_link_rate=0.1,
+            external_url="http://other.example.com/",
+        )
+        response = site.get("/")
+        links = _parse_html(response.body, "localhost:8000").links
+
+        self.assertTrue(any(link.startswith("/missing/") for link in links))
+        self.assertTrue(any(link.startswith("/redirect/") for link in links))
+        self.assertTrue(any(link.startswith("/pages/") for link in links))
+        self.assertEqual(site.get("/external/0-1/").status, 200)
+
+    def test_redirect_chain(self):
+        response = self.site.get("/redirect/7/2/")
+        self.assertEqual(response.status, 301)
+        self.assertEqual(response.headers, [("Location", "/redirect/7/1/")])
+
+        response = self.site.get("/redirect/7/1/")
+        self.assertEqual(response.headers, [("Location", "/pages/7/")])
+
+    def test_listing(self):
+        links = self.parse("/list/?page=1").links
+        self.assertEqual(len(links), 26)
+        self.assertIn("/", links)
+        self.assertIn("/pages/24/", links)
+        self.assertIn("/list/?page=2", links)
+
+        self.assertEqual(self.parse("/list/").links, links)
+
+        last_links = self.parse("/list/?page=4").links
+        self.assertEqual(len(last_links), 25)
+        self.assertIn("/pages/99/", last_links)
+
+    def test_no_components(self):
+        site = SyntheticSite(
+            pages=1, random_links=0, components_per_page=0, listing_pages=0
+        )
+        parsed_html = _parse_html(site.get("/").body, "localhost:8000")
+        self.assertEqual(parsed_html.components, [])
+        self.assertEqual(parsed_html.links, [])
+
+
+class ServeSyntheticSiteCommandTests(SimpleTestCase):
+    @patch.object(ReplayServer, "serve_forever")
+    def test_command(self, serve_forever):
+        result = CliRunner().invoke(command, ["--pages=10", "--port=0"])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue(result.output.startswith("Serving 10 synthetic pages at"))
+        serve_forever.assert_called_once()
@@ -0,0 +1,210 @@
+import gzip
+import io
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone as django_timezone
+
+from crawler.models import Crawl, Page
+from crawler.sitemap import (
+    SitemapEntry,
+    fetch_sitemap,
+    find_orphan_urls,
+    iter_sitemap,
+    parse_lastmod,
+    parse_priority,
+)
+
+URLSET = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+    <url><loc>https://example.com/</loc><lastmod>2024-01-02</lastmod></url>
+    <!-- A comment -->
+    <url>
+        <loc> https://example.com/a/ </loc>
+        <lastmod>2024-01-02T03:04:05+00:00</lastmod>
+        <changefreq>daily</changefreq>
+        <priority>0.8</priority>
+    </url>
+    <url><lastmod>2024-01-02</lastmod></url>
+</urlset>
+"""
+
+SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+    <sitemap><loc>%s/urlset.xml</loc></sitemap>
+    <sitemap><loc>%s/urlset.xml.gz</loc></sitemap>
+    <sitemap><loc>%s/index.xml</loc></sitemap>
+    <sitemap><loc>%s/missing.xml</loc></sitemap>
+    <sitemap><loc>%s/invalid.xml</loc></sitemap>
+</sitemapindex>
+"""
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        base_url = f"http://127.0.0.1:{self.server.server_port}".encode()
+
+        content = {
+            "/index.xml": SITEMAP_INDEX.replace(b"%s", base_url),
+            "/urlset.xml": URLSET,
+            "/urlset.xml.gz": gzip.compress(
+                URLSET.replace(b"example.com", b"example.org")
+            ),
+            "/invalid.xml": b"<urlset><url>",
+        }.get(self.path)
+
+        if content is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class ParseLastmodTests(SimpleTestCase):
+    def test_parse_lastmod(self):
+        for value, expected in [
+            (
+                "2024-01-02T03:04:05Z",
+                datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+            ),
+            (" 2024-01-02 ", django_timezone.make_aware(datetime(2024, 1, 2))),
+            ("2024-13-45", None),
+            ("invalid", None),
+            ("", None),
+            (None, None),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(parse_lastmod(value), expected)
+
+    def test_parse_priority(self):
+        for value, expected in [
+            ("0.5", 0.5),
+            ("1", 1.0),
+            ("0", 0.0),
+            ("1.5", None),
+            ("-0.1", None),
+            ("high", None),
+            (None, None),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(parse_priority(value), expected)
+
+
+class IterSitemapTests(SimpleTestCase):
+    def test_urlset(self):
+        self.assertEqual(
+            list(iter_sitemap(io.BytesIO(URLSET))),
+            [
+                (
+                    False,
+                    SitemapEntry("https://example.com/", parse_lastmod("2024-01-02")),
+                ),
+                (
+                    False,
+                    SitemapEntry(
+                        "https://example.com/a/",
+                        parse_lastmod("2024-01-02T03:04:05+00:00"),
+                        priority=0.8,
+                    ),
+                ),
+            ],
+        )
+
+    def test_sitemap_index(self):
+        entries = list(iter_sitemap(io.BytesIO(SITEMAP_INDEX % ((b"x",) * 5))))
+        self.assertEqual(len(entries), 5)
+        self.assertEqual(entries[0], (True, SitemapEntry("x/urlset.xml")))
+
+
+class FetchSitemapTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_fetch_sitemap_index(self):
+        with self.assertLogs("crawler", level="WARNING") as logs:
+            urls = [entry.url for entry in fetch_sitemap(f"{self.url}/index.xml")]
+
+        self.assertEqual(
+            urls,
+            [
+                "https://example.com/",
+                "https://example.com/a/",
+                "https://example.org/",
+                "https://example.org/a/",
+            ],
+        )
+
+        # The missing and invalid sitemaps are logged and skipped.
+        self.assertEqual(len(logs.records), 2)
+
+    @patch("crawler.sitemap.MAX_SITEMAPS", 2)
+    def test_max_sitemaps(self):
+        with self.assertLogs("crawler", level="INFO") as logs:
+            urls = [entry.url for entry in fetch_sitemap(f"{self.url}/index.xml")]
+
+        self.assertEqual(urls, ["https://example.com/", "https://example.com/a/"])
+        self.assertEqual(len(logs.records), 2)
+
+
+class FindOrphanURLsTests(TestCase):
+    def test_find_orphan_urls(self):
+        crawl = Crawl.objects.create(config={})
+        now = django_timezone.now()
+
+        # Links in the site header count, even though they aren't saved with
+        # the page's links.
+        Page.objects.create(
+            crawl=crawl,
+            timestamp=now,
+            url="https://example.com/",
+            title="Home",
+            html=(
+                '<html><body><div class="o-header"><a href="/a/">A</a></div>'
+                '<a href="https://EXAMPLE.com/b/#section">B</a></body></html>'
+            ),
+        )
+        Page.objects.create(
+            crawl=crawl, timestamp=now, url="https://example.com/c/", title="C"
+        )
+
+        # Links from other crawls don't count.
+        Page.objects.create(
+            crawl=Crawl.objects.create(config={}),
+            timestamp=now,
+            url="https://example.com/",
+            title="Home",
+            html='<html><body><a href="/c/">C</a></body></html>',
+        )
+
+        self.assertEqual(
+            find_orphan_urls(
+                crawl,
+                [
+                    "https://example.com/",
+                    "https://example.com/a/",
+                    "https://example.com/b/",
+                    "https://example.com/c/",
+                ],
+            ),
+            ["https://example.com/", "https://example.com/c/"],
+        )
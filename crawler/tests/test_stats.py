@@ -0,0 +1,179 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from crawler.stats import (
+    CrawlStats,
+    Histogram,
+    format_prometheus,
+    format_stats,
+    get_pages_per_second,
+    merge_stats,
+    write_stats_file,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class HistogramTests(SimpleTestCase):
+    def test_observe(self):
+        histogram = Histogram()
+        histogram.observe(0.001)
+        histogram.observe(0.002)
+        histogram.observe(100)
+
+        self.assertEqual(histogram.count, 3)
+        self.assertAlmostEqual(histogram.sum, 100.003)
+        self.assertEqual(histogram.buckets, [1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1])
+
+
+class CrawlStatsTests(SimpleTestCase):
+    def test_to_dict(self):
+        clock = FakeClock()
+        stats = CrawlStats(clock=clock)
+        stats.observe("fetch", 0.2)
+        stats.increment("pages")
+        stats.increment("bytes_downloaded", 1000)
+        stats.increment("skipped", 2)
+
+        with stats.timer("parse"):
+            pass
+
+        clock.now = 4
+        result = stats.to_dict()
+
+        self.assertEqual(result["seconds"], 4)
+        self.assertEqual(
+            result["counters"], {"pages": 1, "bytes_downloaded": 1000, "skipped": 2}
+        )
+        self.assertEqual(result["stages"]["fetch"]["count"], 1)
+        self.assertEqual(result["stages"]["fetch"]["sum"], 0.2)
+        self.assertEqual(result["stages"]["parse"]["count"], 1)
+        self.assertEqual(result["stages"]["write"]["count"], 0)
+
+    def test_timer_records_exceptions(self):
+        stats = CrawlStats()
+
+        with self.assertRaises(ValueError):
+            with stats.timer("write"):
+                raise ValueError
+
+        self.assertEqual(stats.histograms["write"].count, 1)
+
+
+class MergeStatsTests(SimpleTestCase):
+    def test_merge_none(self):
+        stats = CrawlStats().to_dict()
+        self.assertIs(merge_stats(None, stats), stats)
+        self.assertIs(merge_stats(stats, None), stats)
+
+    def test_merge(self):
+        a = {
+            "seconds": 1,
+            "counters": {"pages": 1},
+            "stages": {"fetch": {"count": 1, "sum": 0.5, "buckets": [1, 0]}},
+        }
+        b = {
+            "seconds": 2,
+            "counters": {"pages": 2, "skipped": 1},
+            "stages": {
+                "fetch": {"count": 2, "sum": 1.0, "buckets": [1, 1]},
+                "parse": {"count": 1, "sum": 0.1, "buckets": [1, 0]},
+            },
+        }
+
+        self.assertEqual(
+            merge_stats(a, b),
+            {
+                "seconds": 3,
+                "counters": {"pages": 3, "skipped": 1},
+                "stages": {
+                    "fetch": {"count": 3, "sum": 1.5, "buckets": [2, 1]},
+                    "parse": {"count": 1, "sum": 0.1, "buckets": [1, 0]},
+                },
+            },
+        )
+
+
+class FormatStatsTests(SimpleTestCase):
+    def setUp(self):
+        clock = FakeClock()
+        stats = CrawlStats(clock=clock)
+        stats.observe("fetch", 0.02)
+        stats.observe("fetch", 2)
+        stats.increment("pages", 10)
+        stats.increment("bytes_downloaded", 5000)
+        clock.now = 5
+        self.stats = stats.to_dict()
+
+    def test_pages_per_second(self):
+        self.assertEqual(get_pages_per_second(self.stats), 2)
+        self.assertEqual(get_pages_per_second(None), 0)
+        self.assertEqual(
+            get_pages_per_second(CrawlStats().to_dict() | {"seconds": 0}), 0
+        )
+
+    def test_format_stats(self):
+        self.assertEqual(
+            format_stats(self.stats),
+            "10 pages in 5.00s (2.00 pages/second), 5000 bytes downloaded, "
+            "fetch 2.02s, parse_queue_wait 0.00s, parse 0.00s, queue_wait 0.00s, "
+            "write 0.00s",
+        )
+
+    def test_format_prometheus(self):
+        lines = format_prometheus(self.stats, 123).splitlines()
+
+        self.assertIn("# TYPE crawler_stage_seconds histogram", lines)
+        self.assertIn(
+            'crawler_stage_seconds_bucket{crawl="123",stage="fetch",le="0.05"} 1',
+            lines,
+        )
+        self.assertIn(
+            'crawler_stage_seconds_bucket{crawl="123",stage="fetch",le="5"} 2', lines
+        )
+        self.assertIn(
+            'crawler_stage_seconds_bucket{crawl="123",stage="fetch",le="+Inf"} 2',
+            lines,
+        )
+        self.assertIn('crawler_stage_seconds_count{crawl="123",stage="fetch"} 2', lines)
+        self.assertIn('crawler_pages_total{crawl="123"} 10', lines)
+        self.assertIn('crawler_bytes_downloaded_total{crawl="123"} 5000', lines)
+        self.assertIn('crawler_pages_per_second{crawl="123"} 2.0', lines)
+
+    def test_write_stats_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = Path(tmp_dir) / "stats.json"
+            write_stats_file(json_path, self.stats, 123)
+            self.assertEqual(
+                json.loads(json_path.read_text()), {"crawl": 123, **self.stats}
+            )
+
+            prom_path = Path(tmp_dir) / "stats.prom"
+            write_stats_file(prom_path, self.stats, 123)
+            self.assertEqual(prom_path.read_text(), format_prometheus(self.stats, 123))
+
+            # Only the stats files are left behind.
+            self.assertEqual(
+                sorted(path.name for path in Path(tmp_dir).iterdir()),
+                ["stats.json", "stats.prom"],
+            )
+
+    def test_write_stats_file_failure(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "stats.json"
+
+            with patch("os.replace", side_effect=OSError):
+                with self.assertRaises(OSError):
+                    write_stats_file(path, self.stats, 123)
+
+            self.assertEqual(list(Path(tmp_dir).iterdir()), [])
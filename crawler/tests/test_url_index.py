@@ -0,0 +1,66 @@
+from django.test import SimpleTestCase
+
+from crawler.url_index import (
+    BloomFilterURLIndex,
+    URLIndex,
+    canonicalize_url,
+    make_url_index,
+)
+
+
+class CanonicalizeURLTests(SimpleTestCase):
+    def test_canonicalize_url(self):
+        for url, expected in [
+            ("https://example.com/path/", "https://example.com/path/"),
+            ("HTTPS://Example.COM", "https://example.com/"),
+            ("https://example.com:443/a/?b=c#d", "https://example.com/a/?b=c"),
+            ("http://example.com:80/", "http://example.com/"),
+            ("http://example.com:8000/", "http://example.com:8000/"),
+            ("https://example.com:80/", "https://example.com:80/"),
+            ("http://[::1]:8000/", "http://[::1]:8000/"),
+            ("http://User@Example.com/#a", "http://User@Example.com/"),
+            ("http://[invalid/", "http://[invalid/"),
+            ("http://example.com:invalid/", "http://example.com:invalid/"),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(canonicalize_url(url), expected)
+
+
+class URLIndexTests(SimpleTestCase):
+    def check_index(self, index):
+        self.assertEqual(len(index), 0)
+        self.assertNotIn("https://example.com/", index)
+
+        self.assertTrue(index.add("https://example.com/"))
+        self.assertFalse(index.add("HTTPS://EXAMPLE.COM:443/#fragment"))
+        self.assertTrue(index.add("https://example.com/other/"))
+
+        self.assertIn("https://example.com", index)
+        self.assertIn("https://example.com/other/", index)
+        self.assertNotIn("https://example.com/missing/", index)
+        self.assertEqual(len(index), 2)
+
+    def test_url_index(self):
+        self.check_index(URLIndex())
+
+    def test_bloom_filter_url_index(self):
+        self.check_index(BloomFilterURLIndex(capacity=1000))
+
+    def test_bloom_filter_error_rate(self):
+        index = BloomFilterURLIndex(capacity=10000, error_rate=0.01)
+
+        for i in range(10000):
+            index.add(f"https://example.com/{i}/")
+
+        false_positives = sum(
+            f"https://example.org/{i}/" in index for i in range(10000)
+        )
+        self.assertLess(false_positives, 200)
+
+    def test_bloom_filter_size(self):
+        index = BloomFilterURLIndex(capacity=1000000)
+        self.assertLess(len(index._bits), 2 * 1024 * 1024)
+
+    def test_make_url_index(self):
+        self.assertIsInstance(make_url_index(), URLIndex)
+        self.assertIsInstance(make_url_index(1000), BloomFilterURLIndex)
@@ -0,0 +1,161 @@
+import os.path
+import tempfile
+
+from django.test import SimpleTestCase
+
+import pytest
+from wpull.database.base import AddURLInfo, NotFound
+from wpull.database.sqlmodel import QueuedURL
+from wpull.database.sqltable import SQLiteURLTable
+from wpull.pipeline.item import Status, URLProperties
+
+from crawler.wpull.urltable import PriorityURLTable
+
+
+def add_urls(url_table, urls, level=1, parent_url="https://example.com/"):
+    url_properties = URLProperties()
+    url_properties.parent_url = parent_url
+    url_properties.root_url = "https://example.com/"
+    url_properties.level = level
+    return url_table.add_many(AddURLInfo(url, url_properties, None) for url in urls)
+
+
+def set_status(url_table, url, status):
+    with url_table._session() as session:
+        session.query(QueuedURL).filter_by(url=url).one().status = status.value
+
+
+@pytest.mark.filterwarnings("ignore::sqlalchemy.exc.MovedIn20Warning")
+class PriorityURLTableTests(SimpleTestCase):
+    def setUp(self):
+        self.url_table = PriorityURLTable()
+        self.addCleanup(self.url_table.close)
+
+    def check_out_all(self, url_table=None):
+        url_table = url_table or self.url_table
+        urls = []
+
+        while True:
+            try:
+                url_record = url_table.check_out(Status.todo)
+            except NotFound:
+                return urls
+
+            self.assertEqual(url_record.status, Status.in_progress)
+            urls.append(url_record.url)
+
+    def test_priority_order(self):
+        add_urls(self.url_table, ["https://example.com/a/b/"], level=2)
+        add_urls(self.url_table, ["https://example.com/a/", "https://example.com/b/"])
+        add_urls(self.url_table, ["https://example.com/"], level=0)
+
+        # Links to a URL that's already queued raise its priority.
+        self.assertEqual(
+            add_urls(
+                self.url_table,
+                ["https://example.com/b/"],
+                parent_url="https://example.com/a/",
+            ),
+            [],
+        )
+
+        self.assertEqual(
+            self.check_out_all(),
+            [
+                "https://example.com/",
+                "https://example.com/b/",
+                "https://example.com/a/",
+                "https://example.com/a/b/",
+            ],
+        )
+
+    def test_skips_urls_no_longer_queued(self):
+        add_urls(self.url_table, ["https://example.com/a/"], level=0)
+        add_urls(self.url_table, ["https://example.com/b/"])
+        set_status(self.url_table, "https://example.com/a/", Status.done)
+
+        self.assertEqual(self.check_out_all(), ["https://example.com/b/"])
+
+    def test_falls_back_to_wpull_order(self):
+        # URLs added without going through the frontier are still crawled,
+        # in the order wpull added them.
+        SQLiteURLTable.add_many(
+            self.url_table,
+            [
+                AddURLInfo("https://example.com/b/", None, None),
+                AddURLInfo("https://example.com/a/", None, None),
+            ],
+        )
+        add_urls(self.url_table, ["https://example.com/c/"], level=2)
+
+        self.assertEqual(
+            self.check_out_all(),
+            [
+                "https://example.com/c/",
+                "https://example.com/b/",
+                "https://example.com/a/",
+            ],
+        )
+
+    def test_other_check_outs_use_wpull_order(self):
+        add_urls(self.url_table, ["https://example.com/a/b/"], level=2)
+        add_urls(self.url_table, ["https://example.com/a/"])
+
+        url_record = self.url_table.check_out(Status.todo, level=3)
+        self.assertEqual(url_record.url, "https://example.com/a/b/")
+
+        set_status(self.url_table, "https://example.com/a/b/", Status.error)
+        url_record = self.url_table.check_out(Status.error)
+        self.assertEqual(url_record.url, "https://example.com/a/b/")
+
+        self.assertEqual(self.check_out_all(), ["https://example.com/a/"])
+
+    def test_remove_many(self):
+        add_urls(
+            self.url_table,
+            ["https://example.com/a/", "https://example.com/b/"],
+        )
+        self.url_table.remove_many(["https://example.com/a/"])
+
+        self.assertEqual(len(self.url_table.frontier), 1)
+        self.assertEqual(
+            [url_record.url for url_record in self.url_table.get_all()],
+            ["https://example.com/b/"],
+        )
+        self.assertEqual(self.check_out_all(), ["https://example.com/b/"])
+
+    def test_release_rebuilds_frontier(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "crawl.db")
+
+            url_table = PriorityURLTable(path)
+            add_urls(url_table, ["https://example.com/"], level=0)
+            add_urls(
+                url_table,
+                [
+                    "https://example.com/a/b/c/",
+                    "https://example.com/a/b/",
+                    "https://example.com/a/",
+                ],
+                level=3,
+            )
+            set_status(url_table, "https://example.com/a/", Status.done)
+            self.assertEqual(
+                url_table.check_out(Status.todo).url, "https://example.com/"
+            )
+            url_table.close()
+
+            # Resuming the crawl releases URLs that were being crawled, and
+            # queues every URL still to be crawled in priority order.
+            url_table = PriorityURLTable(path)
+            self.addCleanup(url_table.close)
+            url_table.release()
+
+            self.assertEqual(
+                self.check_out_all(url_table),
+                [
+                    "https://example.com/",
+                    "https://example.com/a/b/c/",
+                    "https://example.com/a/b/",
+                ],
+            )
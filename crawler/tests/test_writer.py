@@ -1,8 +1,24 @@
-from django.test import TestCase
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
 from django.utils import timezone
 
-from crawler.models import Component, Crawl, Error, Page
-from crawler.writer import DatabaseWriter
+from crawler.models import (
+    Component,
+    Crawl,
+    Error,
+    FrontierURL,
+    Link,
+    Page,
+    PageRecord,
+    Redirect,
+)
+from crawler.writer import (
+    DatabaseWriter,
+    LRUCache,
+    ThreadedDatabaseWriter,
+    UnchangedPage,
+)
 
 
 class DatabaseWriterTests(TestCase):
@@ -11,14 +27,18 @@ class DatabaseWriterTests(TestCase):
         self.writer = DatabaseWriter(self.crawl)
         self.now = timezone.now()
 
+    def make_page(self, url="/", components=("o-test",), links=()):
+        page = Page(timestamp=self.now, url=url, title="test", html="test", text="test")
+        page.components = [Component(class_name=c) for c in components]
+        page.links = [Link(href=href) for href in links]
+        return page
+
     def test_write_page(self):
         self.assertEqual(Page.objects.count(), 0)
         self.assertEqual(Component.objects.count(), 0)
 
-        page = Page(timestamp=self.now, title="test", html="test", text="test")
-        page.components = [Component(class_name="o-test")]
-
-        self.writer.write(page)
+        self.writer.write(self.make_page())
+        self.writer.flush()
 
         self.assertEqual(Page.objects.count(), 1)
         page = Page.objects.first()
@@ -36,8 +56,302 @@ class DatabaseWriterTests(TestCase):
         error = Error(timestamp=self.now, status_code=500)
 
         self.writer.write(error)
+        self.writer.flush()
 
         self.assertEqual(Error.objects.count(), 1)
         error = Error.objects.first()
         self.assertEqual(error.crawl, self.crawl)
         self.assertEqual(error.status_code, 500)
+
+    def test_write_batch(self):
+        Component.objects.create(class_name="o-existing")
+
+        self.writer.write(self.make_page("/a/", ["o-existing", "o-a"], ["/b/"]))
+        self.writer.write(self.make_page("/b/", ["o-a"], ["/a/", "/b/"]))
+        self.writer.write(
+            Redirect(timestamp=self.now, url="/c", status_code=301, location="/c/")
+        )
+        self.writer.write(Error(timestamp=self.now, url="/d/", status_code=404))
+
+        with self.assertNumQueries(11):
+            self.writer.flush()
+
+        self.assertQuerySetEqual(
+            Page.objects.get(url="/a/").components.values_list("class_name", flat=True),
+            ["o-a", "o-existing"],
+        )
+        self.assertQuerySetEqual(
+            Page.objects.get(url="/b/").links.values_list("href", flat=True),
+            ["/a/", "/b/"],
+        )
+        self.assertEqual(Component.objects.count(), 2)
+        self.assertEqual(Link.objects.count(), 2)
+        self.assertEqual(Redirect.objects.get().crawl, self.crawl)
+        self.assertEqual(Error.objects.get().crawl, self.crawl)
+
+    def test_write_page_records(self):
+        self.writer.write(self.make_page("/a/", ["o-a"], ["/b/"]))
+        self.writer.write(
+            PageRecord(
+                url="/b/",
+                timestamp=self.now,
+                title="test",
+                html="test",
+                text="test",
+                links=["/a/", "/b/"],
+                components=["o-a", "o-b"],
+                etag='"abc"',
+            )
+        )
+
+        # Records are saved in the same queries as pages.
+        with self.assertNumQueries(9):
+            self.writer.flush()
+
+        page = Page.objects.get(url="/b/")
+        self.assertEqual(page.crawl, self.crawl)
+        self.assertEqual(page.etag, '"abc"')
+        self.assertQuerySetEqual(
+            page.components.values_list("class_name", flat=True), ["o-a", "o-b"]
+        )
+        self.assertQuerySetEqual(
+            page.links.values_list("href", flat=True), ["/a/", "/b/"]
+        )
+
+    def test_write_duplicate_frontier_urls(self):
+        self.writer.write(FrontierURL(shard=1, url="/a/"))
+        self.writer.write(FrontierURL(shard=1, url="/a/"))
+        self.writer.flush()
+
+        frontier_url = FrontierURL.objects.get()
+        self.assertEqual(frontier_url.crawl, self.crawl)
+        self.assertEqual(str(frontier_url), "/a/ (shard 1)")
+
+    def test_flush_when_batch_is_full(self):
+        writer = DatabaseWriter(self.crawl, batch_size=2)
+
+        writer.write(Error(timestamp=self.now, url="/a/", status_code=404))
+        self.assertEqual(Error.objects.count(), 0)
+
+        writer.write(Error(timestamp=self.now, url="/b/", status_code=404))
+        self.assertEqual(Error.objects.count(), 2)
+
+    def test_flush_after_interval(self):
+        writer = DatabaseWriter(self.crawl, flush_interval=0)
+        writer.write(Error(timestamp=self.now, url="/a/", status_code=404))
+        self.assertEqual(Error.objects.count(), 1)
+
+    def test_flush_empty(self):
+        with self.assertNumQueries(0):
+            self.writer.flush()
+
+    def test_failed_batch_saves_records_individually(self):
+        self.writer.write(Error(timestamp=self.now, url="/a/", status_code=404))
+        self.writer.write(Error(timestamp=None, url="/b/", status_code=404))
+        self.writer.write(self.make_page())
+
+        with self.assertLogs("crawler", level="ERROR") as logs:
+            self.writer.flush()
+
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(Error.objects.get().url, "/a/")
+        self.assertEqual(Page.objects.count(), 1)
+
+    def test_cached_ids_skip_lookups(self):
+        self.writer.write(self.make_page("/a/", ["o-a"], ["/a/"]))
+        self.writer.flush()
+
+        self.writer.write(self.make_page("/b/", ["o-a"], ["/a/"]))
+
+        # Savepoint, pages, components, links, and release savepoint.
+        with self.assertNumQueries(5):
+            self.writer.flush()
+
+        self.assertEqual(Page.objects.get(url="/b/").components.count(), 1)
+        self.assertEqual(Page.objects.get(url="/b/").links.count(), 1)
+
+    def test_id_caches_preloaded(self):
+        Component.objects.create(class_name="o-a")
+        Component.objects.create(class_name="o-b")
+        Link.objects.create(href="/a/")
+
+        writer = DatabaseWriter(self.crawl, id_cache_size=1)
+        self.assertEqual(writer.id_caches[Component].get("o-a"), None)
+        self.assertEqual(
+            writer.id_caches[Component].get("o-b"),
+            Component.objects.get(class_name="o-b").pk,
+        )
+        self.assertEqual(
+            writer.id_caches[Link].get("/a/"), Link.objects.get(href="/a/").pk
+        )
+
+    def test_id_caches_cleared_after_failure(self):
+        self.writer.write(self.make_page("/a/", ["o-a"], ["/a/"]))
+        self.writer.write(Error(timestamp=None, url="/b/", status_code=404))
+
+        with self.assertLogs("crawler", level="ERROR"):
+            self.writer.flush()
+
+        self.assertEqual(len(self.writer.id_caches[Component]), 0)
+        self.assertEqual(len(self.writer.id_caches[Link]), 0)
+
+        self.writer.write(self.make_page("/c/", ["o-a"], ["/a/"]))
+        self.writer.flush()
+        self.assertEqual(Page.objects.get(url="/c/").components.count(), 1)
+
+    def test_write_unchanged_page(self):
+        previous_crawl = Crawl.objects.create(config={})
+        previous_writer = DatabaseWriter(previous_crawl)
+        previous_writer.write(self.make_page("/a/", ["o-a", "o-b"], ["/b/"]))
+        previous_writer.flush()
+        previous_page = Page._base_manager.get(crawl=previous_crawl)
+        previous_page.etag = '"abc"'
+        previous_page.save()
+
+        self.writer.write(UnchangedPage(previous_page.pk, self.now))
+        self.writer.flush()
+
+        page = Page.objects.get()
+        self.assertNotEqual(page.pk, previous_page.pk)
+        self.assertEqual(page.crawl, self.crawl)
+        self.assertEqual(page.url, "/a/")
+        self.assertEqual(page.timestamp, self.now)
+        self.assertEqual(page.etag, '"abc"')
+        self.assertQuerySetEqual(
+            page.components.values_list("class_name", flat=True), ["o-a", "o-b"]
+        )
+        self.assertQuerySetEqual(page.links.values_list("href", flat=True), ["/b/"])
+        self.assertEqual(previous_page.components.count(), 2)
+
+    def test_write_unchanged_page_with_new_validators(self):
+        previous_crawl = Crawl.objects.create(config={})
+        previous_writer = DatabaseWriter(previous_crawl)
+
+        for url in ["/a/", "/b/"]:
+            page = self.make_page(url)
+            page.etag = '"abc"'
+            page.last_modified = "Mon, 01 Aug 2022 00:00:00 GMT"
+            previous_writer.write(page)
+
+        previous_writer.flush()
+        previous_pages = Page._base_manager.filter(crawl=previous_crawl)
+
+        # Only the headers sent again replace the previous page's.
+        self.writer.write(
+            UnchangedPage(previous_pages.get(url="/a/").pk, self.now, etag='"def"')
+        )
+        self.writer.write(
+            UnchangedPage(
+                previous_pages.get(url="/b/").pk,
+                self.now,
+                last_modified="Tue, 02 Aug 2022 00:00:00 GMT",
+            )
+        )
+        self.writer.flush()
+
+        self.assertQuerySetEqual(
+            Page.objects.order_by("url").values_list("etag", "last_modified"),
+            [
+                ('"def"', "Mon, 01 Aug 2022 00:00:00 GMT"),
+                ('"abc"', "Tue, 02 Aug 2022 00:00:00 GMT"),
+            ],
+        )
+
+    def test_stats(self):
+        previous_page = self.make_page("/a/")
+        self.writer.write(previous_page)
+        self.writer.flush()
+
+        self.writer.write(self.make_page("/b/"))
+        self.writer.write(UnchangedPage(previous_page.pk, self.now))
+        self.writer.write(Error(timestamp=self.now, url="/c/", status_code=404))
+        self.writer.flush()
+
+        stats = self.writer.stats.to_dict()
+        self.assertEqual(stats["counters"]["pages"], 3)
+        self.assertEqual(stats["stages"]["write"]["count"], 2)
+
+    def test_analyze(self):
+        self.writer.write(Error(timestamp=self.now, url="/a/", status_code=404))
+        self.writer.analyze()
+        self.assertEqual(Error.objects.count(), 1)
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_lru_cache(self):
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+
+        # Reading "a" makes "b" the least recently used item.
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class ThreadedDatabaseWriterTests(TransactionTestCase):
+    def setUp(self):
+        self.crawl = Crawl.objects.create(config={}, status=Crawl.Status.FINISHED)
+        self.writer = ThreadedDatabaseWriter(self.crawl)
+        self.now = timezone.now()
+
+    def tearDown(self):
+        self.writer.close()
+
+    def test_write(self):
+        self.writer.write(Error(timestamp=self.now, status_code=500))
+
+        page = Page(timestamp=self.now, title="test", html="test", text="test")
+        page.components = [Component(class_name="o-test")]
+        self.writer.write(page)
+
+        self.writer.analyze()
+        self.writer.close()
+
+        self.assertFalse(self.writer.thread.is_alive())
+        self.assertEqual(Error.objects.get().crawl, self.crawl)
+        self.assertEqual(Page.objects.get().components.count(), 1)
+
+        # Closing again does nothing.
+        self.writer.close()
+
+    def test_flush(self):
+        self.writer.write(Error(timestamp=self.now, status_code=500))
+        self.writer.flush()
+
+        self.assertTrue(self.writer.thread.is_alive())
+        self.assertEqual(Error.objects.count(), 1)
+
+        # Both the error and the flush waited in the queue.
+        self.assertEqual(self.writer.stats.histograms["queue_wait"].count, 2)
+
+    def test_flush_after_interval(self):
+        writer = ThreadedDatabaseWriter(self.crawl, flush_interval=0.01)
+        writer.write(Error(timestamp=self.now, status_code=500))
+
+        # The writer thread saves the error without being asked to. Wait for
+        # it by its stats, since reading the database while the thread is
+        # writing to it can make the write fail on SQLite.
+        for _ in range(500):
+            if writer.stats.to_dict()["stages"]["write"]["count"]:
+                break
+
+            writer.thread.join(0.01)
+
+        self.assertEqual(Error.objects.count(), 1)
+        writer.close()
+
+    def test_write_failure_is_logged(self):
+        with patch.object(self.writer.writer, "analyze", side_effect=RuntimeError):
+            with self.assertLogs("crawler", level="ERROR"):
+                self.writer.analyze()
+                self.writer.queue.join()
+
+        self.assertTrue(self.writer.thread.is_alive())
@@ -0,0 +1,113 @@
+import hashlib
+import math
+from urllib import parse
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url):
+    """Normalize a URL for use as a visited URL index key.
+
+    Lowercases the scheme and hostname, drops default ports and fragments,
+    and uses "/" for an empty path. URLs that can't be parsed are returned
+    unchanged.
+    """
+    try:
+        parts = parse.urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+
+    # Leave URLs with credentials alone, apart from removing the fragment.
+    if "@" in parts.netloc:
+        return parse.urlunsplit(parts._replace(fragment=""))
+
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+
+    if ":" in netloc:
+        netloc = f"[{netloc}]"
+
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc += f":{port}"
+
+    return parse.urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+class URLIndex:
+    """An exact set of canonicalized URLs."""
+
+    def __init__(self):
+        self._urls = set()
+
+    def __contains__(self, url):
+        return canonicalize_url(url) in self._urls
+
+    def __len__(self):
+        return len(self._urls)
+
+    def add(self, url):
+        """Add a URL to the index, returning True if it wasn't already there."""
+        url = canonicalize_url(url)
+
+        if url in self._urls:
+            return False
+
+        self._urls.add(url)
+        return True
+
+
+class BloomFilterURLIndex:
+    """A memory-bounded set of canonicalized URLs, backed by a Bloom filter.
+
+    Membership tests may return false positives at roughly the configured
+    error rate once capacity URLs have been added, but never false negatives.
+    The length is the number of URLs added that weren't reported as present.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.num_bits = max(
+            8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray(math.ceil(self.num_bits / 8))
+        self._count = 0
+
+    def _get_bit_indexes(self, url):
+        digest = hashlib.blake2b(
+            canonicalize_url(url).encode("utf-8"), digest_size=16
+        ).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, url):
+        return all(
+            self._bits[i >> 3] & (1 << (i & 7)) for i in self._get_bit_indexes(url)
+        )
+
+    def __len__(self):
+        return self._count
+
+    def add(self, url):
+        """Add a URL to the index, returning True if it wasn't already there."""
+        added = False
+
+        for i in self._get_bit_indexes(url):
+            byte, bit = i >> 3, 1 << (i & 7)
+
+            if not self._bits[byte] & bit:
+                self._bits[byte] |= bit
+                added = True
+
+        self._count += added
+        return added
+
+
+def make_url_index(bloom_filter_capacity=0):
+    """Return an exact URL index, or a Bloom filter if a capacity is given."""
+    if bloom_filter_capacity:
+        return BloomFilterURLIndex(bloom_filter_capacity)
+
+    return URLIndex()
@@ -1,18 +1,144 @@
+import logging
+import multiprocessing
 import os
 import os.path
+import sqlite3
 import traceback
 
+from django.conf import settings
+from django.db import connections
+
 from wpull.application.builder import Builder
 from wpull.application.options import AppArgumentParser
 
 from crawler.wpull import plugin
-from crawler.models import Crawl, CrawlConfig
+from crawler.wpull.urltable import PriorityURLTable
+from crawler.models import Crawl, CrawlConfig, Error, Page, Redirect
+from crawler.sharding import fail_shard, wait_for_frontier
+from crawler.sitemap import fetch_sitemap
+
+logger = logging.getLogger("crawler")
+
+
+def get_checkpoint_path(crawl_record):
+    return settings.CRAWL_CHECKPOINT_DIR / f"crawl-{crawl_record.pk}.db"
+
+
+def reset_unsaved_urls(crawl_record):
+    """Queue again any checkpointed URLs whose results were never saved.
+
+    wpull marks URLs as done in its checkpoint as soon as it has handled them,
+    but their results may still have been waiting to be written when the crawl
+    was interrupted. Returns the number of URLs queued again.
+    """
+    checkpoint_path = get_checkpoint_path(crawl_record)
+
+    if not checkpoint_path.exists():
+        return 0
+
+    saved_urls = set()
+
+    for model in (Page, Error, Redirect):
+        saved_urls.update(
+            model._base_manager.filter(crawl=crawl_record)
+            .values_list("url", flat=True)
+            .iterator()
+        )
+
+    connection = sqlite3.connect(checkpoint_path)
+
+    try:
+        with connection:
+            unsaved_ids = [
+                (queued_url_id,)
+                for queued_url_id, url in connection.execute(
+                    "SELECT queued_urls.id, url_strings.url FROM queued_urls "
+                    "JOIN url_strings ON url_strings.id = queued_urls.url_string_id "
+                    "WHERE queued_urls.status IN ('done', 'error', 'skipped')"
+                )
+                if url not in saved_urls
+            ]
+            connection.executemany(
+                "UPDATE queued_urls SET status = 'todo' WHERE id = ?", unsaved_ids
+            )
+    finally:
+        connection.close()
+
+    if unsaved_ids:
+        logger.info(f"Queued {len(unsaved_ids)} URLs again whose results weren't saved")
+
+    return len(unsaved_ids)
 
 
 class WpullCrawler:
-    def crawl(self, config: CrawlConfig):
+    def __init__(self):
+        # Sitemap entries of each crawl, keyed by its ID, so that shards
+        # that run wpull repeatedly only fetch the sitemap once.
+        self.sitemap_entries = {}
+
+    def crawl(self, config: CrawlConfig, shard_indexes=None):
         crawl_record = Crawl.start(config)
 
+        if config.shards > 1:
+            self.crawl_shards(crawl_record, shard_indexes or range(config.shards))
+        else:
+            self._run(crawl_record)
+
+    def crawl_shards(self, crawl_record: Crawl, shard_indexes):
+        """Run some of the shards of a sharded crawl, each in its own process.
+
+        Other shards of the same crawl can be run elsewhere, for example on
+        other machines sharing the same database.
+        """
+        # Child processes must not share the parent's database connections.
+        connections.close_all()
+
+        processes = [
+            multiprocessing.Process(
+                target=self.crawl_shard, args=(crawl_record, shard_index)
+            )
+            for shard_index in shard_indexes
+        ]
+
+        for process in processes:
+            process.start()
+
+        for process in processes:
+            process.join()
+
+        crawl_record.refresh_from_db()
+
+    def crawl_shard(self, crawl_record: Crawl, shard_index):
+        """Run one shard of a sharded crawl until every shard has finished.
+
+        Each run of wpull crawls the URLs that other shards have handed off to
+        this one. Between runs, the shard waits for more URLs to be handed off.
+        """
+        while True:
+            try:
+                exit_code = self._do_crawl(crawl_record, shard_index)
+            except Exception:
+                fail_shard(crawl_record, shard_index, traceback.format_exc())
+                raise
+
+            if exit_code:
+                fail_shard(
+                    crawl_record,
+                    shard_index,
+                    f"Crawler finished with non-zero exit code {exit_code}",
+                )
+                return
+
+            if not wait_for_frontier(crawl_record, shard_index):
+                return
+
+    def resume(self, crawl_record: Crawl):
+        """Continue an interrupted crawl from its last checkpoint."""
+        crawl_record.resume()
+        reset_unsaved_urls(crawl_record)
+        self._run(crawl_record)
+
+    def _run(self, crawl_record):
         try:
             exit_code = self._do_crawl(crawl_record)
         except Exception:
@@ -24,7 +150,33 @@ class WpullCrawler:
         else:
             crawl_record.finish()
 
-    def _do_crawl(self, crawl_record):
+            # A finished crawl can't be resumed, so its checkpoint isn't needed.
+            get_checkpoint_path(crawl_record).unlink(missing_ok=True)
+
+    def get_sitemap_entries(self, crawl_record):
+        sitemap_url = crawl_record.config["sitemap_url"]
+
+        if not sitemap_url:
+            return None
+
+        if crawl_record.pk not in self.sitemap_entries:
+            self.sitemap_entries[crawl_record.pk] = list(fetch_sitemap(sitemap_url))
+
+        return self.sitemap_entries[crawl_record.pk]
+
+    def _do_crawl(self, crawl_record, shard_index=None):
+        if shard_index is None:
+            plugin_args = f"{crawl_record.pk}"
+
+            # Store wpull's queue of URLs in a file, instead of a temporary
+            # database, so that it can be reused to resume the crawl.
+            database_args = [f"--database={get_checkpoint_path(crawl_record)}"]
+        else:
+            # Each run of a shard starts from a fresh queue, which the plugin
+            # fills from the shard's frontier URLs.
+            plugin_args = f"{crawl_record.pk}:{shard_index}"
+            database_args = []
+
         arg_parser = AppArgumentParser()
         args = arg_parser.parse_args(
             [
@@ -33,8 +185,6 @@ class WpullCrawler:
                 "--recursive",
                 "--delete-after",
                 "--no-robots",
-                "--wait=0.5",
-                "--random-wait",
                 "--dns-timeout=5",
                 "--connect-timeout=5",
                 "--read-timeout=30",
@@ -45,17 +195,38 @@ class WpullCrawler:
                 "--user-agent=CFPB website indexer",
                 "--no-check-certificate",
                 f"--level={crawl_record.config['depth']}",
+                f"--concurrent={crawl_record.config['concurrency']}",
                 f"--plugin-script={plugin.__file__}",
-                f"--plugin-args={crawl_record.pk}",
+                f"--plugin-args={plugin_args}",
+                *database_args,
             ]
         )
+
+        # Fetch the sitemap here rather than from the plugin, where it would
+        # block wpull's event loop. In a sharded crawl, only the first shard
+        # reads the sitemap.
+        args.sitemap_entries = (
+            self.get_sitemap_entries(crawl_record) if not shard_index else None
+        )
+
         builder = Builder(args)
+
+        # Crawl the most important URLs first, instead of in the order they
+        # were found.
+        if crawl_record.config["prioritize"]:
+            builder.factory.set("URLTableImplementation", PriorityURLTable)
+
         app = builder.build()
 
         # This is required due to the use of async code in wpull. Unfortunately
         # wpull hooks aren't called in a way that allows us to wrap Django database
-        # calls with sync_to_async. This is only safe because we only download one
-        # URL at a time.
+        # calls with sync_to_async. The plugin's hooks all run one at a time on
+        # wpull's event loop thread, and some of them query the database there:
+        # loading the previous crawl's pages when the plugin is activated,
+        # loading URLs to resume, claiming a shard's frontier URLs and looking
+        # up the HTML of unchanged pages to copy. These block the event loop
+        # while they run, but never run concurrently with each other. Crawl
+        # results are written by a dedicated writer thread.
         # https://docs.djangoproject.com/en/3.2/topics/async/#async-safety
         os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
 
@@ -1,37 +1,47 @@
 import logging
 import mimetypes
-import re
+import time
+from pathlib import Path
 from urllib import parse
 
 from django.utils import timezone
 
 from wpull.application.hook import Actions
-from wpull.application.plugin import PluginFunctions, WpullPlugin, hook
+from wpull.application.plugin import PluginFunctions, WpullPlugin, event, hook
 from wpull.errors import ExitStatus
 from wpull.network.connection import BaseConnection
 from wpull.pipeline.item import URLProperties
 from wpull.url import URLInfo
 
-from crawler.models import Crawl, Error, Page, Redirect
-from crawler.parser import HTML_EXTERNAL_SITE
-from crawler.writer import DatabaseWriter
-
-logger = logging.getLogger("crawler")
-
-
-SKIP_URLS = list(
-    map(
-        re.compile,
-        [
-            r"^https://www.facebook.com/dialog/share\?.*",
-            r"^https://twitter.com/intent/tweet\?.*",
-            r"^https://x.com/intent/tweet\?.*",
-            r"^https://www.linkedin.com/shareArticle\?.*",
-        ],
-    )
+from crawler.models import Crawl, Error, FrontierURL, Page, Redirect
+from crawler.parser import get_link_urls, parser_backend_stats
+from crawler.linkcheck import LinkChecker
+from crawler.pipeline import PipelineStage
+from crawler.ratelimit import AdaptiveRateController
+from crawler.responses import (
+    build_page,
+    exceeds_max_page_size,
+    get_conditional_headers,
+    get_content_length,
+    get_previous_pages,
+    is_html,
+    is_unchanged_in_sitemap,
+    make_skipped_page,
+    should_download,
+)
+from crawler.rules import DEFAULT_URL_RULES, URLRuleSet
+from crawler.sharding import FRONTIER_POLL_INTERVAL, claim_frontier_urls, get_shard
+from crawler.sitemap import find_orphan_urls
+from crawler.stats import (
+    STATS_FILE_INTERVAL,
+    CrawlStats,
+    format_stats,
+    write_stats_file,
 )
+from crawler.url_index import canonicalize_url, make_url_index
+from crawler.writer import ThreadedDatabaseWriter, UnchangedPage
 
-HEAD_URLS = list(map(re.compile, [r"https://files.consumerfinance.gov/.*"]))
+logger = logging.getLogger("crawler")
 
 
 def patch_mimetypes():
@@ -72,18 +82,101 @@ class DatabaseWritingPlugin(WpullPlugin):
 
         self.start_url = URLInfo.parse(self.app_session.args.urls[0])
 
-        crawl_record_id = int(self.app_session.args.plugin_args)
-        crawl_record = Crawl.objects.get(pk=crawl_record_id)
-
-        self.db_writer = DatabaseWriter(crawl_record)
+        # Plugin arguments are the crawl ID, optionally followed by a colon and
+        # the index of the shard of the crawl being run.
+        crawl_record_id, _, shard_index = self.app_session.args.plugin_args.partition(
+            ":"
+        )
+        crawl_record = Crawl.objects.get(pk=int(crawl_record_id))
+
+        self.crawl_record = crawl_record
+        self.stats = CrawlStats()
+        self.db_writer = ThreadedDatabaseWriter(crawl_record, stats=self.stats)
+
+        # Optionally parse pages in the background, so that wpull can download
+        # the next page while the previous one is parsed and saved.
+        pipeline_queue_size = crawl_record.config["pipeline_queue_size"]
+        self.parse_stage = (
+            PipelineStage(
+                self.build_page,
+                self.db_writer.write,
+                max_queue_size=pipeline_queue_size,
+                stats=self.stats,
+            )
+            if pipeline_queue_size
+            else None
+        )
         self.max_pages = crawl_record.config["max_pages"]
+        self.max_page_size = crawl_record.config["max_page_size"]
+        self.parser_backend = crawl_record.config["parser_backend"]
+        url_rules = crawl_record.config["url_rules"]
+        self.url_rules = URLRuleSet(
+            DEFAULT_URL_RULES if url_rules is None else url_rules
+        )
 
-        self.accepted_urls = []
-        self.requested_urls = []
+        # Sets of canonicalized URLs, optionally backed by a Bloom filter to
+        # bound memory use on very large crawls.
+        bloom_filter_capacity = crawl_record.config["bloom_filter_capacity"]
+        self.accepted_urls = make_url_index(bloom_filter_capacity)
+        self.requested_urls = make_url_index(bloom_filter_capacity)
+
+        # When resuming a crawl, don't request URLs that were already saved.
+        for model in (Page, Error, Redirect):
+            for url in (
+                model._base_manager.filter(crawl=crawl_record)
+                .values_list("url", flat=True)
+                .iterator()
+            ):
+                self.accepted_urls.add(url)
+                self.requested_urls.add(url)
+
+        self.rate_controller = AdaptiveRateController(
+            crawl_record.config["min_rate"], crawl_record.config["max_rate"]
+        )
+        self.request_start_times = {}
 
-    def deactivate(self):
-        super().deactivate()
-        self.db_writer.analyze()
+        self.link_checker = LinkChecker(
+            self.record_link_status,
+            max_workers=crawl_record.config["link_check_workers"],
+            ttl=crawl_record.config["link_check_ttl"],
+            rate_controller=self.rate_controller,
+        )
+
+        # In a sharded crawl, URLs belonging to other shards are handed off to
+        # them through the database.
+        self.shard_index = int(shard_index) if shard_index else None
+        self.num_shards = crawl_record.config["shards"]
+        self.handed_off_urls = make_url_index(bloom_filter_capacity)
+        self.last_frontier_claim = None
+
+        # Sitemap entries, keyed by canonicalized URL, are fetched by the
+        # crawler before wpull starts, and their URLs are added to the queue
+        # when the first URL is accepted.
+        self.sitemap_entries = {
+            canonicalize_url(entry.url): entry
+            for entry in self.app_session.args.sitemap_entries or []
+        }
+        self.sitemap_seeded = False
+
+        # In incremental mode, pages from the previous crawl are fetched
+        # conditionally, and copied instead of parsed if they haven't changed.
+        self.previous_pages = (
+            get_previous_pages(crawl_record)
+            if crawl_record.config["incremental"]
+            else {}
+        )
+
+        # Stats are optionally written to a file periodically during the
+        # crawl. Each shard of a sharded crawl writes its own file.
+        self.stats_file = crawl_record.config["stats_file"]
+
+        if self.stats_file and self.shard_index is not None:
+            path = Path(self.stats_file)
+            self.stats_file = path.with_name(
+                f"{path.stem}-shard{self.shard_index}{path.suffix}"
+            )
+
+        self.last_stats_file_write = time.monotonic()
 
     @property
     def at_max_pages(self):
@@ -101,14 +194,16 @@ class DatabaseWritingPlugin(WpullPlugin):
 
         request = item_session.request
 
+        if self.sitemap_entries and not self.sitemap_seeded:
+            self.seed_from_sitemap(item_session)
+
+        if self.shard_index is not None:
+            self.claim_frontier_urls(item_session)
+
         # Don't request pages more than once.
         if request.url in self.requested_urls:
             return False
 
-        # Always skip certain URLs.
-        if SKIP_URLS and any(skip_url.match(request.url) for skip_url in SKIP_URLS):
-            return False
-
         # We want to crawl links to different domains to test their validity.
         # But once we've done that, we don't want to keep crawling there.
         # Therefore, don't crawl links that start on different domains.
@@ -118,58 +213,131 @@ class DatabaseWritingPlugin(WpullPlugin):
         ):
             return False
 
-        # Use HEAD requests to speed up the crawl for certain external domains.
-        # We can't do this everywhere because other sites may respond to HEAD
-        # requests in inconvenient ways. This avoids the need to fully download
-        # external responses.
-        if HEAD_URLS and any(head_url.match(request.url) for head_url in HEAD_URLS):
-            item_session.request.method = "HEAD"
-
-        # If we're crawling on the start domain, apply additional rejections.
-        elif request.url_info.hostname_with_port == self.start_url.hostname_with_port:
-            # Don't crawl URLs that look like filenames.
-            if "." in request.url_info.path:
-                return False
+        # Skip URLs, or decide how to crawl them, according to the first of
+        # the crawl's URL rules that matches them.
+        is_internal = (
+            request.url_info.hostname_with_port == self.start_url.hostname_with_port
+        )
+        rule = self.url_rules.match(request.url, internal=is_internal)
+
+        if rule and rule.action == "skip":
+            return False
+
+        # In a sharded crawl, hand off URLs that other shards are responsible
+        # for crawling.
+        if (
+            self.shard_index is not None
+            and get_shard(request.url, self.num_shards) != self.shard_index
+        ):
+            self.hand_off_url(item_session)
+            return False
+
+        # Check links to other domains in a separate pool of threads, so that
+        # they don't hold up crawling the start domain. Their statuses are
+        # cached, so recently checked links aren't requested again.
+        if not is_internal:
+            # Use HEAD requests to speed up checks of certain external domains.
+            # We can't do this everywhere because other sites may respond to
+            # HEAD requests in inconvenient ways.
+            method = "HEAD" if rule and rule.action == "head" else "GET"
+
+            self.requested_urls.add(request.url)
+            self.link_checker.check(
+                request.url, method, item_session.url_record.parent_url
+            )
+            return False
+
+        wrapped_url = (
+            rule.unwrap(request.url) if rule and rule.action == "unwrap" else None
+        )
+
+        if wrapped_url:
+            # Add the wrapped URL to the list to be crawled instead.
+            url_properties = URLProperties()
+            url_properties.level = item_session.url_record.level
+            url_properties.inline_level = item_session.url_record.inline_level
+            url_properties.parent_url = item_session.url_record.parent_url
+            url_properties.root_url = item_session.url_record.root_url
 
-            qs = parse.parse_qs(request.url_info.query)
-
-            if qs:
-                # Don't crawl external link URLs directly.
-                # Instead crawl to their ultimate destination.
-                if HTML_EXTERNAL_SITE.match(request.url_info.path):
-                    ext_urls = qs.get("ext_url")
-                    if ext_urls:
-                        # Add the external URL to the list to be crawled.
-                        ext_url = ext_urls[0]
-
-                        url_properties = URLProperties()
-                        url_properties.level = item_session.url_record.level
-                        url_properties.inline_level = (
-                            item_session.url_record.inline_level
-                        )
-                        url_properties.parent_url = item_session.url_record.parent_url
-                        url_properties.root_url = item_session.url_record.root_url
-
-                        item_session.app_session.factory["URLTable"].remove_many(
-                            [ext_url]
-                        )
-                        item_session.add_url(ext_url, url_properites=url_properties)
-                        return False
-
-                # For all other URLs, limit querystrings that get crawled.
-                # Only crawl pages that only have the "page" parameter.
-                elif list(qs.keys()) != ["page"]:
-                    return False
-
-        if request.url not in self.accepted_urls:
+            item_session.app_session.factory["URLTable"].remove_many([wrapped_url])
+            item_session.add_url(wrapped_url, url_properites=url_properties)
+            return False
+
+        if self.accepted_urls.add(request.url):
             logger.info(f"Crawling {request.url}")
-            self.accepted_urls.append(request.url)
 
+        previous_page = self.previous_pages.get(request.url)
+
+        if previous_page:
+            # Don't request pages that the sitemap says haven't changed.
+            sitemap_entry = self.sitemap_entries.get(canonicalize_url(request.url))
+
+            if is_unchanged_in_sitemap(sitemap_entry, previous_page):
+                self.requested_urls.add(request.url)
+                self.copy_previous_page(item_session, timezone.now())
+                return False
+
+            for name, value in get_conditional_headers(previous_page).items():
+                request.fields[name] = value
+
+        self.request_start_times[request.url] = time.monotonic()
         return True
 
+    def record_link_status(self, url, link_status, referrer):
+        status_code = link_status.status_code
+
+        if 300 <= status_code < 400:
+            self.db_writer.write(
+                Redirect(
+                    timestamp=timezone.now(),
+                    url=url,
+                    status_code=status_code,
+                    referrer=referrer,
+                    location=link_status.location or "",
+                )
+            )
+        elif not 200 <= status_code < 300:
+            self.db_writer.write(
+                Error(
+                    timestamp=timezone.now(),
+                    url=url,
+                    status_code=status_code,
+                    referrer=referrer,
+                )
+            )
+
+    @hook(PluginFunctions.wait_time)
+    def wait_time(self, seconds, item_session, error):
+        # wpull waits between requests made by each of its workers. Wait for
+        # the next request to the host that was just requested, which is
+        # shared by all workers, so that with --concurrency they don't each
+        # request the host at its full rate.
+        return self.rate_controller.get_delay(
+            item_session.request.url_info.hostname_with_port
+        )
+
+    def get_fetch_time(self, request):
+        """Return how long it took to download a URL, and record it."""
+        now = time.monotonic()
+        fetch_time = now - self.request_start_times.pop(request.url, now)
+        self.stats.observe("fetch", fetch_time)
+
+        if self.stats_file and now - self.last_stats_file_write >= STATS_FILE_INTERVAL:
+            self.last_stats_file_write = now
+            write_stats_file(
+                self.stats_file, self.stats.to_dict(), self.crawl_record.pk
+            )
+
+        return fetch_time
+
     @hook(PluginFunctions.handle_error)
     def handle_error(self, item_session, error):
-        if item_session.request.url in self.requested_urls:
+        self.get_fetch_time(item_session.request)
+        self.rate_controller.record_error(
+            item_session.request.url_info.hostname_with_port
+        )
+
+        if not self.requested_urls.add(item_session.request.url):
             logger.debug(f"Already logged error for {item_session.request.url}")
         else:
             logger.debug(error)
@@ -182,25 +350,48 @@ class DatabaseWritingPlugin(WpullPlugin):
                 )
             )
 
-            self.requested_urls.append(item_session.request.url)
+    def record_response(self, request, response):
+        self.rate_controller.record_response(
+            request.url_info.hostname_with_port,
+            response.status_code,
+            self.get_fetch_time(request),
+            response.fields.get("Retry-After"),
+        )
 
     @hook(PluginFunctions.handle_pre_response)
     def handle_pre_response(self, item_session):
-        # Our accept_url handler converts certain external requests from GET to
-        # HEAD. The wpull response body handler seems to assume that HEAD
-        # request responses will never have Content-Length or Transfer-Encoding
-        # headers, which doesn't seem to be the case in practice:
-        #
-        # https://github.com/ArchiveTeam/wpull/blob/v2.0.1/wpull/protocol/http/stream.py#L441-L451
-        #
-        # Therefore, we strip these headers out if they exist, since we don't
-        # need them for our purposes. Since this was an external request, we
-        # care only about the status code, not the response body.
-        if item_session.request.method == "HEAD":
-            item_session.response.fields.pop("Content-Length", None)
-            item_session.response.fields.pop("Transfer-Encoding", None)
+        request = item_session.request
+        response = item_session.response
 
-        return Actions.NORMAL
+        # Only the bodies of successful responses from the start domain are
+        # used, so decide from their headers whether they're worth downloading.
+        if (
+            response.status_code >= 300
+            or request.url_info.hostname_with_port != self.start_url.hostname_with_port
+        ):
+            return Actions.NORMAL
+
+        content_type = response.fields.get("Content-Type")
+        content_length = get_content_length(response.fields.get("Content-Length"))
+
+        if should_download(content_type, content_length, self.max_page_size):
+            return Actions.NORMAL
+
+        # Finishing the item here stops wpull from downloading the body, and
+        # handle_response isn't called.
+        self.record_response(request, response)
+        self.stats.increment("aborted_downloads")
+
+        if not self.requested_urls.add(request.url):
+            logger.debug(f"Already logged {request.url}")
+        elif not is_html(content_type):
+            logger.debug(f"Not downloading {request.url} of type {content_type}")
+        else:
+            self.db_writer.write(
+                self.make_skipped_page(request, response, content_length)
+            )
+
+        return Actions.FINISH
 
     @hook(PluginFunctions.handle_response)
     def handle_response(self, item_session):
@@ -209,12 +400,24 @@ class DatabaseWritingPlugin(WpullPlugin):
         status_code = response.status_code
         timestamp = timezone.now()
 
-        if request.url in self.requested_urls:
+        self.record_response(request, response)
+
+        if response.body is not None:
+            self.stats.increment("bytes_downloaded", response.body.size())
+
+        if not self.requested_urls.add(request.url):
             logger.debug(f"Already logged {request.url}")
             item_session.skip()
             return Actions.FINISH
-        else:
-            self.requested_urls.append(request.url)
+
+        if status_code == 304 and request.url in self.previous_pages:
+            self.copy_previous_page(
+                item_session,
+                timestamp,
+                response.fields.get("ETag"),
+                response.fields.get("Last-Modified"),
+            )
+            return Actions.NORMAL
 
         if status_code >= 300:
             referrer = request.fields.get("Referer")
@@ -261,27 +464,211 @@ class DatabaseWritingPlugin(WpullPlugin):
             item_session.skip()
             return Actions.FINISH
 
-        page_record = self.process_200_response(request, response)
+        content_type = response.fields.get("Content-Type")
 
-        if not page_record:
+        if not is_html(content_type):
             logger.debug(f"Unexpected response for {request.url}, skipping")
             item_session.skip()
             return Actions.FINISH
 
+        # Read the body now, because wpull deletes it once the response has
+        # been handled.
+        html = response.body.content()
+
+        # Pages without a Content-Length header can only be measured once
+        # they've been downloaded.
+        if exceeds_max_page_size(len(html), self.max_page_size):
+            self.db_writer.write(self.make_skipped_page(request, response, len(html)))
+            return Actions.NORMAL
+
+        page_args = (
+            request.url,
+            html,
+            content_type,
+            response.fields.get("ETag"),
+            response.fields.get("Last-Modified"),
+        )
+
+        # wpull finds links to crawl in the page itself, so parsing the page
+        # in the background doesn't delay discovering them.
+        if self.parse_stage:
+            self.parse_stage.submit(*page_args)
+            return Actions.NORMAL
+
+        page_record = self.build_page(*page_args)
+
+        if not page_record:
+            item_session.skip()
+            return Actions.FINISH
+
         self.db_writer.write(page_record)
         return Actions.NORMAL
 
-    def process_200_response(self, request, response):
-        content_type = response.fields.get("Content-Type")
+    def build_page(self, url, html, content_type, etag, last_modified):
+        """Parse a downloaded page into a record to save.
+
+        This may run on the event loop or in the background parse stage.
+        """
+        return build_page(
+            url,
+            html,
+            self.start_url.hostname,
+            self.parser_backend,
+            content_type,
+            etag,
+            last_modified,
+            previous_page=self.previous_pages.get(url),
+            stats=self.stats,
+        )
+
+    def make_skipped_page(self, request, response, size):
+        return make_skipped_page(
+            request.url,
+            size,
+            self.max_page_size,
+            response.fields.get("ETag"),
+            response.fields.get("Last-Modified"),
+        )
+
+    def copy_previous_page(
+        self, item_session, timestamp, etag=None, last_modified=None
+    ):
+        request = item_session.request
+        previous_page = self.previous_pages[request.url]
+
+        logger.debug(f"{request.url} unchanged since previous crawl")
+        self.db_writer.write(
+            UnchangedPage(
+                previous_page.id,
+                timestamp,
+                etag=etag,
+                last_modified=last_modified,
+            )
+        )
 
-        if not (content_type or "").startswith("text/html"):
+        # wpull can't find links in a page it hasn't downloaded, so crawl the
+        # links in the page's HTML from the previous crawl. Its saved links
+        # can't be used, because they leave out links in the site's header
+        # and footer, which wpull would have followed.
+        html = Page._base_manager.only("html").get(pk=previous_page.id).html
+
+        for url in get_link_urls(html, request.url):
+            item_session.add_child_url(url)
+
+    def seed_from_sitemap(self, item_session):
+        self.sitemap_seeded = True
+
+        # When crawling in priority order, URLs with a higher sitemap priority
+        # are crawled sooner.
+        frontier = getattr(
+            item_session.app_session.factory["URLTable"].url_table, "frontier", None
+        )
+
+        for url, entry in self.sitemap_entries.items():
+            if frontier and entry.priority is not None:
+                frontier.sitemap_priorities[url] = entry.priority
+
+            # Treat sitemap URLs as if they were linked from the start URL, so
+            # that they're crawled like any other page on the start domain.
+            url_properties = URLProperties()
+            url_properties.level = 1
+            url_properties.parent_url = self.start_url.url
+            url_properties.root_url = self.start_url.url
+
+            item_session.add_url(entry.url, url_properites=url_properties)
+
+        logger.info(f"Added {len(self.sitemap_entries)} URLs from sitemap")
+
+    def hand_off_url(self, item_session):
+        url = item_session.request.url
+
+        if self.handed_off_urls.add(url):
+            self.db_writer.write(
+                FrontierURL(
+                    shard=get_shard(url, self.num_shards),
+                    url=url,
+                    parent_url=item_session.url_record.parent_url,
+                    level=item_session.url_record.level,
+                )
+            )
+
+    def claim_frontier_urls(self, item_session):
+        now = time.monotonic()
+
+        if (
+            self.last_frontier_claim is not None
+            and now - self.last_frontier_claim < FRONTIER_POLL_INTERVAL
+        ):
             return
 
-        html = response.body.content().decode("utf-8")
-        return Page.from_html(request.url, html, self.start_url.hostname)
+        self.last_frontier_claim = now
+
+        for frontier_url in claim_frontier_urls(self.crawl_record, self.shard_index):
+            url_properties = URLProperties()
+            url_properties.level = frontier_url.level
+            url_properties.parent_url = frontier_url.parent_url or self.start_url.url
+            url_properties.root_url = self.start_url.url
+
+            item_session.add_url(frontier_url.url, url_properites=url_properties)
+
+    def report_orphan_urls(self):
+        orphan_urls = find_orphan_urls(
+            self.crawl_record,
+            [entry.url for entry in self.sitemap_entries.values()],
+        )
+
+        for url in orphan_urls:
+            logger.warning(f"Orphan URL {url} is in the sitemap but not linked")
+
+        logger.info(f"Found {len(orphan_urls)} orphan URLs in sitemap")
+
+    @event(PluginFunctions.finishing_statistics)
+    def finishing_statistics(self, app_session, statistics):
+        for rule in self.url_rules.rules:
+            logger.info(f"URL rule {rule}: {rule.hits} hits")
+
+        for name, stats in sorted(parser_backend_stats.items()):
+            logger.info(
+                f"Parser backend {name}: {stats.calls} calls, "
+                f"{stats.failures} failures, {stats.seconds:.2f} seconds"
+            )
+
+        for host, host_rate in sorted(self.rate_controller.hosts.items()):
+            logger.info(
+                f"Host {host}: {host_rate.requests} requests, "
+                f"{host_rate.achieved_rate:.2f} requests/second achieved, "
+                f"final rate limit {host_rate.rate:.2f} requests/second"
+            )
+
+        logger.info(
+            f"External links: {self.link_checker.requests} requested, "
+            f"{self.link_checker.cache_hits} found in cache"
+        )
+
+        logger.info(f"Crawl stats: {format_stats(self.stats.to_dict())}")
 
     @hook(PluginFunctions.exit_status)
     def exit_status(self, app_session, exit_code):
+        # Save any buffered crawl results, whether or not the crawl succeeded.
+        # This includes the statuses of external links still being checked.
+        # wpull doesn't deactivate plugins, so this is the last chance to.
+        if self.parse_stage:
+            self.parse_stage.close()
+
+        self.link_checker.close()
+        self.db_writer.analyze()
+        self.db_writer.close()
+
+        stats = self.stats.to_dict()
+        self.crawl_record.add_stats(stats)
+
+        if self.stats_file:
+            write_stats_file(self.stats_file, stats, self.crawl_record.pk)
+
+        # Shards can't tell which URLs other shards have yet to link to.
+        if self.sitemap_entries and self.shard_index is None:
+            self.report_orphan_urls()
+
         # If a non-zero exit code exists because of some kind of network error
         # (DNS resolution, connection issue, etc.) we want to ignore it and
         # instead return a zero error code. We expect to encounter some of
@@ -0,0 +1,77 @@
+from wpull.database.sqlmodel import QueuedURL, URLString
+from wpull.database.sqltable import SQLiteURLTable
+from wpull.pipeline.item import Status
+
+from crawler.frontier import PriorityFrontier
+
+
+class PriorityURLTable(SQLiteURLTable):
+    """wpull's URL table, checking out URLs in priority order.
+
+    wpull crawls URLs in the order they were added to its table. This table
+    keeps a PriorityFrontier of the URLs waiting to be crawled alongside it,
+    and checks out the highest priority one instead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.frontier = PriorityFrontier()
+
+    def add_many(self, new_urls):
+        new_urls = tuple(new_urls)
+        added_urls = super().add_many(new_urls)
+        added = set(added_urls)
+
+        for url, url_properties, _ in new_urls:
+            level = url_properties.level if url_properties else 0
+            self.frontier.add(url, level or 0, queued=url in added)
+
+        return added_urls
+
+    def remove_many(self, urls):
+        urls = tuple(urls)
+
+        for url in urls:
+            self.frontier.remove(url)
+
+        return super().remove_many(urls)
+
+    def release(self):
+        super().release()
+
+        # wpull releases the table when it starts. URLs queued by an earlier
+        # run of a resumed crawl are added to the frontier then.
+        for url_record in self.get_all():
+            if url_record.status == Status.todo:
+                self.frontier.add(url_record.url, url_record.level or 0)
+
+    def check_out(self, filter_status, level=None):
+        if filter_status != Status.todo or level is not None:
+            return super().check_out(filter_status, level)
+
+        while True:
+            url = self.frontier.pop()
+
+            if url is None:
+                break
+
+            with self._session() as session:
+                # Filtering on QueuedURL.url would query its URL string with
+                # a correlated subquery. Join to it instead, so that both
+                # tables are looked up by their unique indexes.
+                url_record = (
+                    session.query(QueuedURL)
+                    .join(QueuedURL.url_string)
+                    .filter(
+                        URLString.url == url,
+                        QueuedURL.status == Status.todo.value,
+                    )
+                    .first()
+                )
+
+                if url_record:
+                    url_record.status = Status.in_progress.value
+                    return url_record.to_plain()
+
+        # Fall back to wpull's order for any URLs the frontier doesn't know of.
+        return super().check_out(filter_status, level)
@@ -1,42 +1,383 @@
 import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
 
-from django.db import connections
+from django.db import connections, router, transaction
 
-from crawler.models import Component, Link, Page
+from crawler.models import (
+    Component,
+    Crawl,
+    Error,
+    FrontierURL,
+    Link,
+    Page,
+    PageRecord,
+    Redirect,
+)
+from crawler.stats import CrawlStats
 
 logger = logging.getLogger("crawler")
 
 
+@dataclass
+class UnchangedPage:
+    """A page that hasn't changed since it was saved by a previous crawl.
+
+    Writing one copies the previous page, and its components and links, into
+    the current crawl. Any ETag or Last-Modified header sent when the page
+    was requested again replaces the previous page's.
+    """
+
+    previous_page_id: int
+    timestamp: datetime
+    crawl: Crawl = None
+    etag: str = None
+    last_modified: str = None
+
+
+class LRUCache:
+    """A dictionary that holds at most max_size items.
+
+    When full, adding an item evicts the least recently used one.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        self._items.clear()
+
+    def get(self, key):
+        try:
+            self._items.move_to_end(key)
+        except KeyError:
+            return None
+
+        return self._items[key]
+
+    def set(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
 class DatabaseWriter:
-    def __init__(self, crawl):
+    """Write crawl results to the database in batches.
+
+    Records passed to write are buffered and saved in a single transaction
+    once batch_size records have accumulated or flush_interval seconds have
+    passed since the last flush. Call flush when the crawl ends to save any
+    remaining records. Pages can be written either as Page instances or, to
+    avoid building model instances for every link and component of every
+    page during a crawl, as PageRecords.
+
+    The ids of up to id_cache_size components and links are kept in memory,
+    so that only values not seen before need to be looked up in the database.
+
+    The time spent writing each batch, and the number of pages saved, are
+    recorded in stats.
+    """
+
+    def __init__(
+        self,
+        crawl,
+        batch_size=500,
+        flush_interval=5,
+        id_cache_size=100000,
+        stats=None,
+    ):
         self.crawl = crawl
+        self.stats = stats or CrawlStats()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+        self.id_caches = {
+            model: self._load_id_cache(model, field_name, id_cache_size)
+            for model, field_name in [(Component, "class_name"), (Link, "href")]
+        }
+
+    @staticmethod
+    def _load_id_cache(model, field_name, max_size):
+        cache = LRUCache(max_size)
+
+        # Preload the most recently created values, oldest first, so that
+        # they're evicted in the order that they were created.
+        values = model.objects.order_by("-pk").values_list(field_name, "pk")
+
+        for value, pk in reversed(values[:max_size]):
+            cache.set(value, pk)
+
+        return cache
+
+    def write(self, instance):
+        logger.debug(f"Saving {instance}")
+        instance.crawl = self.crawl
+        self.buffer.append(instance)
+
+        if (
+            len(self.buffer) >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        instances, self.buffer = self.buffer, []
+        self.last_flush = time.monotonic()
+
+        if not instances:
+            return
+
+        with self.stats.timer("write"):
+            self._flush(instances)
+
+    def _flush(self, instances):
+        using = router.db_for_write(Page)
+
+        try:
+            with transaction.atomic(using=using):
+                self._write_batch(instances)
+        except Exception:
+            # Fall back to saving records one at a time, so that one bad
+            # record doesn't prevent the rest of the batch from being saved.
+            logger.exception(f"Failed to save batch of {len(instances)} records")
+            self._clear_id_caches()
+
+            for instance in instances:
+                try:
+                    with transaction.atomic(using=using):
+                        self._write_batch([instance])
+                except Exception:
+                    logger.exception(f"Failed to save {instance}")
+                    self._clear_id_caches()
+
+    def _clear_id_caches(self):
+        # Ids cached during a rolled back transaction may no longer exist.
+        for id_cache in self.id_caches.values():
+            id_cache.clear()
+
+    def _write_batch(self, instances):
+        pages = [
+            instance
+            for instance in instances
+            if isinstance(instance, (Page, PageRecord))
+        ]
+
+        if pages:
+            self._write_pages(pages)
+
+        unchanged_pages = [
+            instance for instance in instances if isinstance(instance, UnchangedPage)
+        ]
+
+        if unchanged_pages:
+            self._write_unchanged_pages(unchanged_pages)
+
+        # Several shards may hand off the same URL, so ignore duplicates.
+        for model, ignore_conflicts in [
+            (Error, False),
+            (Redirect, False),
+            (FrontierURL, True),
+        ]:
+            model._base_manager.bulk_create(
+                [instance for instance in instances if isinstance(instance, model)],
+                ignore_conflicts=ignore_conflicts,
+            )
+
+    def _write_pages(self, pages):
+        page_components = []
+        page_links = []
+
+        for i, page in enumerate(pages):
+            if isinstance(page, PageRecord):
+                page_components.append(page.components)
+                page_links.append(page.links)
+                pages[i] = page.to_page()
+            else:
+                # Read related objects before saving pages; modelcluster keeps
+                # them in memory until the page is saved with save().
+                page_components.append(
+                    [component.class_name for component in page.components.all()]
+                )
+                page_links.append([link.href for link in page.links.all()])
+
+        component_ids = self._get_ids(Component, "class_name", page_components)
+        link_ids = self._get_ids(Link, "href", page_links)
+
+        Page._base_manager.bulk_create(pages)
+        self.stats.increment("pages", len(pages))
+
+        for field_name, ids, page_values in [
+            ("components", component_ids, page_components),
+            ("links", link_ids, page_links),
+        ]:
+            field = Page._meta.get_field(field_name)
+            through = field.remote_field.through
+
+            through.objects.bulk_create(
+                through(
+                    **{
+                        f"{field.m2m_field_name()}_id": page.pk,
+                        f"{field.m2m_reverse_field_name()}_id": ids[value],
+                    }
+                )
+                for page, values in zip(pages, page_values)
+                for value in set(values)
+            )
+
+    def _write_unchanged_pages(self, unchanged_pages):
+        previous_pages = Page._base_manager.in_bulk(
+            [unchanged_page.previous_page_id for unchanged_page in unchanged_pages]
+        )
+
+        pages = []
+
+        for unchanged_page in unchanged_pages:
+            page = previous_pages[unchanged_page.previous_page_id]
+            page.pk = None
+            page._state.adding = True
+            page.crawl = self.crawl
+            page.timestamp = unchanged_page.timestamp
+            page.etag = unchanged_page.etag or page.etag
+            page.last_modified = unchanged_page.last_modified or page.last_modified
+            pages.append(page)
+
+        Page._base_manager.bulk_create(pages)
+        self.stats.increment("pages", len(pages))
+
+        new_page_ids = {
+            unchanged_page.previous_page_id: page.pk
+            for unchanged_page, page in zip(unchanged_pages, pages)
+        }
+
+        for field_name in ["components", "links"]:
+            field = Page._meta.get_field(field_name)
+            through = field.remote_field.through
+            page_id_field = f"{field.m2m_field_name()}_id"
+            related_id_field = f"{field.m2m_reverse_field_name()}_id"
+
+            through.objects.bulk_create(
+                through(
+                    **{
+                        page_id_field: new_page_ids[page_id],
+                        related_id_field: related_id,
+                    }
+                )
+                for page_id, related_id in through.objects.filter(
+                    **{f"{page_id_field}__in": new_page_ids}
+                ).values_list(page_id_field, related_id_field)
+            )
+
+    def _get_ids(self, model, field_name, values_lists):
+        """Return a mapping of values to ids, creating any that don't exist."""
+        id_cache = self.id_caches[model]
+        ids = {}
+
+        for values in values_lists:
+            for value in values:
+                if value not in ids:
+                    ids[value] = id_cache.get(value)
+
+        missing = [value for value, pk in ids.items() if pk is None]
+
+        if missing:
+            model.objects.bulk_create(
+                [model(**{field_name: value}) for value in missing],
+                ignore_conflicts=True,
+            )
+
+            for value, instance in model.objects.in_bulk(
+                missing, field_name=field_name
+            ).items():
+                ids[value] = instance.pk
+                id_cache.set(value, instance.pk)
+
+        return ids
+
+    def analyze(self):
+        """Update the database's query planner statistics."""
+        self.flush()
+
+        with connections[router.db_for_write(Page)].cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+
+class ThreadedDatabaseWriter:
+    """Write records to the database from a dedicated thread.
+
+    Calls to write put records on a queue and return immediately, so that
+    they can safely be made from wpull's event loop while it downloads
+    several URLs at once. Only the writer thread talks to the database, using
+    its own connection. Call close to wait for queued records to be written.
+
+    The time that each item spends waiting in the queue is recorded in the
+    writer's stats as the "queue_wait" stage.
+    """
+
+    _STOP = object()
+
+    def __init__(self, crawl, max_queue_size=1000, **kwargs):
+        self.writer = DatabaseWriter(crawl, **kwargs)
+        self.stats = self.writer.stats
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.thread = threading.Thread(
+            target=self._run, name="DatabaseWriter", daemon=True
+        )
+        self.thread.start()
+
+    def _put(self, item):
+        self.queue.put((item, time.perf_counter()))
 
     def write(self, instance):
-        if isinstance(instance, Page):
-            return self._write_page(instance)
-        else:
-            logger.debug(f"Saving {instance}")
-            instance.crawl = self.crawl
-            instance.save()
+        self._put(instance)
 
-    def _write_page(self, page):
-        page.crawl = self.crawl
+    def flush(self):
+        """Wait until all queued records have been saved."""
+        self._put(self.writer.flush)
+        self.queue.join()
 
-        for component in page.components.all():
-            component.crawl = self.crawl
+    def analyze(self):
+        self._put(self.writer.analyze)
 
-        Component.objects.bulk_create(page.components.all(), ignore_conflicts=True)
+    def close(self):
+        if self.thread.is_alive():
+            self._put(self._STOP)
+            self.thread.join()
 
-        page.components = Component.objects.in_bulk(
-            page.components.values_list("class_name", flat=True),
-            field_name="class_name",
-        ).values()
+    def _run(self):
+        try:
+            while True:
+                try:
+                    item, enqueued = self.queue.get(timeout=self.writer.flush_interval)
+                except queue.Empty:
+                    self.writer.flush()
+                    continue
 
-        Link.objects.bulk_create(page.links.all(), ignore_conflicts=True)
+                self.stats.observe("queue_wait", time.perf_counter() - enqueued)
 
-        page.links = Link.objects.in_bulk(
-            page.links.values_list("href", flat=True), field_name="href"
-        ).values()
+                try:
+                    if item is self._STOP:
+                        break
+                    elif callable(item):
+                        item()
+                    else:
+                        self.writer.write(item)
+                except Exception:
+                    logger.exception(f"Failed to write {item}")
+                finally:
+                    self.queue.task_done()
 
-        logger.debug(f"Saving {page}")
-        page.save()
+            self.writer.flush()
+        finally:
+            connections.close_all()
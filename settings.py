@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 import dj_database_url
@@ -89,6 +90,50 @@ DATABASES = {
     ),
 }
 
+# Parsed HTML is cached by content hash so that unchanged pages don't need to
+# be parsed again. The cache is only kept if PARSER_CACHE_DIR is set, since
+# within a single crawl each page is normally only parsed once.
+_parser_cache_dir = os.getenv("PARSER_CACHE_DIR")
+
+# The statuses of external links are cached so that they don't need to be
+# checked by every crawl. Set LINK_CHECK_CACHE_DIR to share this cache across
+# crawls; how long statuses are kept is controlled by the crawl command.
+_link_check_cache_dir = os.getenv("LINK_CHECK_CACHE_DIR")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "parser": {
+        "BACKEND": (
+            "crawler.cache.SQLiteCache"
+            if _parser_cache_dir
+            else "django.core.cache.backends.dummy.DummyCache"
+        ),
+        "LOCATION": _parser_cache_dir,
+        "TIMEOUT": None,
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("PARSER_CACHE_MAX_ENTRIES", 50000)),
+            "CULL_FREQUENCY": 4,
+        },
+    },
+    "links": {
+        "BACKEND": (
+            "django.core.cache.backends.filebased.FileBasedCache"
+            if _link_check_cache_dir
+            else "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": _link_check_cache_dir or "links",
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("LINK_CHECK_CACHE_MAX_ENTRIES", 100000)),
+        },
+    },
+}
+
+# Crawls checkpoint their progress to files in this directory so that
+# interrupted crawls can be resumed.
+CRAWL_CHECKPOINT_DIR = Path(os.getenv("CRAWL_CHECKPOINT_DIR", tempfile.gettempdir()))
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
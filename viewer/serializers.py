@@ -32,7 +32,8 @@ class PageSerializer(RequestSerializer):
         csv_header = ["url", "title", "language"]
 
     def get_title(self, obj):
-        return PAGE_TITLE_SUFFIX_RE.sub("", obj["title"])
+        # Pages that weren't downloaded have no title.
+        return PAGE_TITLE_SUFFIX_RE.sub("", obj["title"]) or obj["url"]
 
 
 class PageWithComponentSerializer(PageSerializer):
@@ -67,6 +68,7 @@ class PageDetailSerializer(serializers.ModelSerializer):
             "html",
             "components",
             "links",
+            "skipped_reason",
         ]
 
 
@@ -6,6 +6,9 @@ from urllib.parse import urlencode
 
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
+
+from crawler.models import Crawl, Page
 
 
 class CSVTestMixin:
@@ -141,6 +144,31 @@ class ViewTests(CSVTestMixin, TestCase):
     def test_detail_view(self):
         response = self.client.get(reverse("page") + "?url=http://localhost:8000/")
         self.assertContains(response, "Sample homepage")
+        self.assertNotContains(response, "Content not downloaded")
+
+    def test_skipped_page(self):
+        Page.objects.create(
+            crawl=Crawl.objects.get(),
+            timestamp=timezone.now(),
+            url="http://localhost:8000/large/",
+            title="",
+            html="",
+            text="",
+            skipped_reason="Size of 2000 bytes exceeds the limit of 1000 bytes",
+        )
+
+        # Pages without titles are listed by URL.
+        results = self.get_pages_api(search_type="url", q="large")
+        self.assertEqual(results[0]["title"], "http://localhost:8000/large/")
+
+        response = self.client.get(
+            reverse("page") + "?url=http://localhost:8000/large/"
+        )
+        self.assertContains(
+            response,
+            "Content not downloaded: Size of 2000 bytes exceeds the limit of "
+            "1000 bytes",
+        )
 
 
 class ViewTestsNoCrawls(CSVTestMixin, TestCase):